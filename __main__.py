@@ -1,231 +1,431 @@
+import argparse
+import os
+import sys
+
 from algorithms.anvil import Anvil
+from algorithms.cache import CACHE_SIZE, ResultCache
+from algorithms.dictionary import DICTIONARY_SIZE, Dictionary
+from algorithms.lz77 import Lz77
+from algorithms.progress import Progress
+from algorithms.stats import Stats
+from algorithms.stream import file_size, write_stream
 
-import tkinter as tk
-from tkinter import ttk
-
-from tkinter.filedialog import askopenfilename, asksaveasfilename
-from tkinter.messagebox import showwarning, showinfo, showerror
-
-from threading import Thread
-
-
-class AnvilApp(tk.Tk):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        
-        # window settings
-        self.title('Anvil Kayıpsız Sıkıştırma')
-        self.resizable(False, False)
-        
-        # read "user guide" and "about" files
-        self.read_help_files()
-        
-        # set top bar menu
-        self.set_menu()
-        
-        # set encode - decode notebook
-        self.set_notebook()
-    
-    def read_help_files(self):
-        try:
-            with open('help/about.txt', 'r', encoding='utf-8') as f:
-                self.about_text = f.read()
-            
-        except FileNotFoundError as e:
-            showerror(
-                '"help/about.txt" yolunda "Hakkında" dosyası bulunamadı.\n'
-                'Lütfen dosyayı sağlayıp tekrar deneyiniz.'
-            )
-            raise e
-            
-        try:
-            with open('help/user_guide.txt', 'r', encoding='utf-8') as f:
-                self.user_guide_text = f.read()
-        except FileNotFoundError as e:
-            showerror(
-                '"help/user_guide.txt" yolunda "Kullanıcı Kılavuzu" dosyası '
-                'bulunamadı.\nLütfen dosyayı sağlayıp tekrar deneyiniz.'
-            )
-            raise e
-    
-    def set_notebook(self):
-        self.notebook = ttk.Notebook(self, width=500)
-        
-        self.encode_frame = FileFrame(
-            file_command=Anvil.encode, 
-            start_button_text="ENCODING'E BAŞLA",
-            file_types=[
-                ('Yazı Dosyaları', '.txt'),
-                ('Döküman Belgeleri', '.doc .docx'),
-            ],
-            file_default_type='.txt',
-            save_types=[('Anvil Dosyaları', '*.anvil')],
-            save_default_type='.anvil',
-        )
-        
-        self.decode_frame = FileFrame(
-            file_command=Anvil.decode, 
-            start_button_text="DECODING'E BAŞLA",
-            file_types=[('ANVIL Dosyaları', '.anvil')],
-            file_default_type='.anvil',
-            save_types=[
-                ('Yazı Dosyaları', '.txt'),
-                ('Döküman Belgeleri', '.doc .docx'),
-            ],
-            save_default_type='.txt',
-        )
-        
-        self.notebook.add(self.encode_frame)
-        self.notebook.add(self.decode_frame)
-        
-        self.notebook.tab(0, text='Encode', padding=10)
-        self.notebook.tab(1, text='Decode', padding=10)
-        
-        self.notebook.pack(fill='both')
-    
-    def set_menu(self):
-        self.menu = tk.Menu(self)
-        
-        self.help_menu = tk.Menu(self.menu, tearoff=False)
-        self.help_menu.add_command(
-            label='Hakkında', 
-            command=self.about,
-        )
-        self.help_menu.add_command(
-            label='Kullanım Kılavuzu',
-            command=self.user_guide,
-        )
-        
-        self.menu.add_cascade(label='Yardım', menu=self.help_menu)
-        self.config(menu=self.menu)
-    
-    def about(self):
-        about_window = tk.Toplevel(self)
-        
-        about_window.resizable(False, False)
-        about_window.title('Hakkında')
-        
-        about_label = ttk.Label(
-            about_window, 
-            text=self.about_text,
-            justify='center', 
-            padding=15,
-        )
-        
-        about_label.pack(fill='both', expand=True)
-    
-    def user_guide(self):
-        user_guide_window = tk.Toplevel(self)
-        
-        user_guide_window.resizable(False, False)
-        user_guide_window.title('Kullanım Kılavuzu')
-        
-        about_label = ttk.Label(
-            user_guide_window,
-            text=self.user_guide_text, 
-            justify='center',
-            padding=15,
-        )
-        
-        about_label.pack(fill='both', expand=True)
-
-
-class FileFrame(ttk.Frame):
-    def __init__(self, *args, file_command, file_default_type, file_types,
-                 save_default_type, save_types, start_button_text, **kwargs):
-        super().__init__(*args, **kwargs)
-        
-        self.file_default_type = file_default_type
-        self.file_types = file_types
-        self.save_default_type = save_default_type
-        self.save_types = save_types
-        
-        self.file_command = file_command
-        
-        self.file_path: str = None
-        self.save_path: str = None
-        
-        self.file_button_text = 'DOSYA YOLU SEÇ'
-        self.save_button_text = 'KAYIT YOLU SEÇ'
-        
-        self.file_button = ttk.Button(
-            self, command=self.select_file_path,
-            text=self.file_button_text
-        )
-        
-        self.save_button = ttk.Button(
-            self, command=self.select_save_path,
-            text=self.save_button_text
-        )
-        
-        self.start_button = ttk.Button(
-            self, command=lambda: Thread(target=self.command).start(),
-            state='disabled',
-            text=start_button_text,
-        )
-        
-        self.progress_bar = ttk.Progressbar(self, orient='horizontal')
-        self.progress_bar.config(mode='indeterminate')
-        
-        self.file_button.pack(fill='x')
-        self.save_button.pack(fill='x')
-        self.start_button.pack(fill='x')
-    
-    def select_file_path(self):
-        path = askopenfilename(
-            filetypes=self.file_types,
-            defaultextension=self.file_default_type,
+
+# lz77 token formats by their command line names
+TOKEN_FORMATS = {
+    'triple': Lz77.FORMAT_TRIPLE,
+    'compact': Lz77.FORMAT_COMPACT,
+}
+
+
+def positive_int(text: str) -> int:
+    # argument type of the sizes that must be at least 1
+    value = int(text)
+
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be a positive integer: {text}')
+
+    return value
+
+
+def open_input(path: str):
+    # '-' is the standard input
+    if path == '-':
+        return sys.stdin.buffer
+
+    return open(path, 'rb')
+
+
+def write_output(chunks, path: str):
+    # '-' is the standard output, chunks are written as they are made so
+    # the command can be used in a pipeline
+    if path != '-':
+        write_stream(chunks, path)
+        return
+
+    for chunk in chunks:
+        sys.stdout.buffer.write(chunk)
+
+    sys.stdout.buffer.flush()
+
+
+def print_progress(progress: Progress):
+    # progress is written to the standard error on a single line
+    elapsed = progress.elapsed()
+    speed = progress.done / elapsed / (1 << 20) if elapsed else 0.0
+
+    fraction = progress.fraction()
+    eta = progress.eta()
+
+    if fraction is None:
+        text = f'{progress.done / (1 << 20):.1f} MB'
+    else:
+        text = f'{fraction:6.1%}'
+
+    text += f'  {speed:.2f} MB/s'
+
+    if eta is not None:
+        text += f'  ETA {int(eta) // 60}:{int(eta) % 60:02}'
+
+    print(f'\r{text}  {progress.stage:<8}', end='', file=sys.stderr, flush=True)
+
+
+def make_progress(args, file=None) -> Progress:
+    if not args.progress:
+        return None
+
+    # mapped files are measured by the operation
+    if file is None:
+        return Progress(print_progress)
+
+    # the size of the input is only known if it is a regular file
+    return Progress(print_progress, total=file_size(file))
+
+
+def check_files(args, option: str):
+    # only files can be mapped or cached, not the standard streams
+    if args.input == '-' or args.output == '-':
+        raise ValueError(f'{option} needs an input file and an output file')
+
+
+def load_dictionary(args) -> Dictionary:
+    if args.dictionary is None:
+        return None
+
+    return Dictionary.load(args.dictionary)
+
+
+def parse_stages(args):
+    # a chain is given as the names of its stages separated by commas
+    if args.stages is None or args.stages == 'auto':
+        return args.stages
+
+    return args.stages.split(',')
+
+
+def make_stats(args) -> Stats:
+    # the stages are only measured if the stats are saved
+    if args.stats is None:
+        return None
+
+    return Stats()
+
+
+def save_stats(args, stats: Stats):
+    if stats is not None:
+        stats.save(args.stats)
+
+
+def encode(args):
+    dictionary = load_dictionary(args)
+    stats = make_stats(args)
+
+    if args.mmap or args.cache is not None:
+        check_files(args, '--mmap' if args.mmap else '--cache')
+        progress = make_progress(args)
+
+        cache = None
+
+        if args.cache is not None:
+            cache = ResultCache(args.cache, args.cache_size)
+
+        Anvil.encode(
+            args.input, args.output, TOKEN_FORMATS[args.format],
+            args.workers, progress, args.level, mapped=args.mmap,
+            block_size=args.block_size, dictionary=dictionary, cache=cache,
+            stats=stats, stages=parse_stages(args), min_speed=args.min_speed,
         )
-        
-        if path:
-            self.file_path = path
-            self.file_button.config(text=self.file_path)
-            
-            if self.file_path and self.save_path:
-                self.start_button.config(state='normal')
-        else:
-            self.file_path = None
-            self.file_button.config(text=self.file_button_text)
-    
-    def select_save_path(self):
-        path = asksaveasfilename(
-            filetypes=self.save_types,
-            defaultextension=self.save_default_type,
+    else:
+        with open_input(args.input) as file:
+            progress = make_progress(args, file)
+
+            # a regular file is encoded up to its size when it is opened,
+            # the size is written so the file can be appended later
+            write_output(Anvil.encode_stream(
+                file, TOKEN_FORMATS[args.format], args.block_size,
+                args.workers, progress, args.level, dictionary, stats,
+                parse_stages(args), args.min_speed, file_size(file),
+            ), args.output)
+
+    if progress is not None:
+        print(file=sys.stderr)
+
+    save_stats(args, stats)
+
+
+def decode(args):
+    dictionary = load_dictionary(args)
+    stats = make_stats(args)
+
+    if args.mmap:
+        check_files(args, '--mmap')
+        progress = make_progress(args)
+
+        Anvil.decode(
+            args.input, args.output, args.workers, progress, mapped=True,
+            dictionary=dictionary, stats=stats,
         )
-        
-        if path:
-            self.save_path = path
-            self.save_button.config(text=self.save_path)
-            
-            if self.file_path and self.save_path:
-                self.start_button.config(state='normal')
-        else:
-            self.save_path = None
-            self.save_button.config(text=self.save_button_text)
-    
-    def command(self):
-        self.start_button.pack_forget()
-        self.progress_bar.pack(fill='x')
-        self.progress_bar.start()
-        
-        self.file_button.config(state='disabled')
-        self.save_button.config(state='disabled')
-        
-        try:
-            self.file_command(self.file_path, self.save_path)
-        except Exception as e:
-            showerror('Hata', 'Bir hata ile karşılaşıldı:\n' + str(e))
-        else:
-            showinfo('Başarılı', 'İşleminiz başarıyla gerçekleştirildi!')
-        
-        self.file_button.config(state='normal', text=self.file_button_text)
-        self.save_button.config(state='normal', text=self.save_button_text)
-        
-        self.progress_bar.stop()
-        self.progress_bar.pack_forget()
-        self.start_button.pack(fill='x')
+    else:
+        with open_input(args.input) as file:
+            progress = make_progress(args, file)
 
+            write_output(Anvil.decode_stream(
+                file, args.workers, progress, dictionary, stats,
+            ), args.output)
+
+    if progress is not None:
+        print(file=sys.stderr)
+
+    save_stats(args, stats)
+
+
+def append(args):
+    # the output is an existing anvil file that is changed in place
+    if args.input == '-':
+        raise ValueError('append needs an input file')
+
+    dictionary = load_dictionary(args)
+    progress = make_progress(args)
+    stats = make_stats(args)
+
+    Anvil.append(
+        args.input, args.output, args.offset, args.workers, progress,
+        args.level, args.block_size, dictionary, stats,
+    )
+
+    if progress is not None:
+        print(file=sys.stderr)
+
+    save_stats(args, stats)
+
+
+def train(args):
+    samples = []
+
+    for path in args.samples:
+        with open(path, 'rb') as file:
+            samples.append(file.read())
+
+    dictionary = Dictionary.train(
+        samples, args.size, TOKEN_FORMATS[args.format]
+    )
+    dictionary.save(args.output)
+
+    print(f'dictionary {dictionary.id:08x}: {len(dictionary.content)} bytes')
+
+
+def info(args):
+    with open_input(args.input) as file:
+        for key, value in Anvil.info(file).items():
+            print(f'{key}: {value}')
+
+
+def bench(args):
+    # benchmark module is only imported when it's used
+    from algorithms import benchmark
+
+    benchmark.main(args.bench_args)
+
+
+def gui(args):
+    # tkinter is only imported when the gui is started, so the commands
+    # work without a display
+    from gui import AnvilApp
 
-if __name__ == '__main__':
     root = AnvilApp()
     root.mainloop()
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog='anvil',
+        description='lossless compression with lz77 and huffman, the gui '
+                    'is started if no command is given',
+    )
+    commands = parser.add_subparsers(dest='command')
+
+    workers_help = 'encode or decode independent blocks with this many ' \
+                   'processes, 0 means a process for every cpu'
+    progress_help = 'show the progress on the standard error'
+    mmap_help = 'map the input and the output files to memory instead of ' \
+                'streaming them'
+    dictionary_help = 'dictionary file made by the train command'
+    stats_help = 'save the time and the bytes of every stage, the block ' \
+                 'types, the lz77 tokens and the code lengths to this ' \
+                 'json file'
+
+    encode_parser = commands.add_parser(
+        'encode', help='compress a file or the standard input'
+    )
+    encode_parser.add_argument('input', nargs='?', default='-')
+    encode_parser.add_argument('-o', '--output', default='-')
+    encode_parser.add_argument(
+        '-f', '--format', choices=list(TOKEN_FORMATS), default='compact',
+        help='lz77 token format',
+    )
+    encode_parser.add_argument(
+        '-b', '--block-size', type=positive_int,
+        default=Anvil.BLOCK_SIZE,
+        help='number of input bytes coded as a block',
+    )
+    encode_parser.add_argument(
+        '-l', '--level', type=int, choices=list(Lz77.LEVELS),
+        help='compression level, 1 is the fastest and 9 is the smallest',
+    )
+    encode_parser.add_argument(
+        '-w', '--workers', type=int, help=workers_help
+    )
+    encode_parser.add_argument(
+        '-p', '--progress', action='store_true', help=progress_help
+    )
+    encode_parser.add_argument(
+        '-m', '--mmap', action='store_true', help=mmap_help
+    )
+    encode_parser.add_argument(
+        '-D', '--dictionary', help=dictionary_help
+    )
+    encode_parser.add_argument(
+        '--stats', metavar='FILE', help=stats_help
+    )
+    encode_parser.add_argument(
+        '-s', '--stages', metavar='CHAIN',
+        help='code the blocks with a chain of stages instead of lz77 and '
+             'its tables, like bwt,mtf,rle,huffman; auto picks the chain '
+             'that is best for samples of the input',
+    )
+    encode_parser.add_argument(
+        '--min-speed', type=float, metavar='MBPS',
+        help='auto only picks the chains that encode at least this many '
+             'MB/s',
+    )
+    encode_parser.add_argument(
+        '-c', '--cache', metavar='DIR',
+        help='take the output of an unchanged input from this directory '
+             'and save new outputs to it',
+    )
+    encode_parser.add_argument(
+        '--cache-size', type=int, default=CACHE_SIZE,
+        help='max bytes of the cache, least recently used outputs are '
+             'removed',
+    )
+    encode_parser.set_defaults(function=encode)
+
+    decode_parser = commands.add_parser(
+        'decode', help='decompress a file or the standard input'
+    )
+    decode_parser.add_argument('input', nargs='?', default='-')
+    decode_parser.add_argument('-o', '--output', default='-')
+    decode_parser.add_argument(
+        '-w', '--workers', type=int, help=workers_help
+    )
+    decode_parser.add_argument(
+        '-p', '--progress', action='store_true', help=progress_help
+    )
+    decode_parser.add_argument(
+        '-m', '--mmap', action='store_true', help=mmap_help
+    )
+    decode_parser.add_argument(
+        '-D', '--dictionary', help=dictionary_help
+    )
+    decode_parser.add_argument(
+        '--stats', metavar='FILE', help=stats_help
+    )
+    decode_parser.set_defaults(function=decode)
+
+    append_parser = commands.add_parser(
+        'append', help='encode the new bytes of a file to the end of its '
+                       'anvil file',
+    )
+    append_parser.add_argument('input')
+    append_parser.add_argument('-o', '--output', required=True)
+    append_parser.add_argument(
+        '--offset', type=int,
+        help='position of the new bytes in the input, the decoded size of '
+             'the anvil file by default',
+    )
+    append_parser.add_argument(
+        '-b', '--block-size', type=positive_int,
+        default=Anvil.BLOCK_SIZE,
+        help='number of input bytes coded as a block',
+    )
+    append_parser.add_argument(
+        '-l', '--level', type=int, choices=list(Lz77.LEVELS),
+        help='compression level, 1 is the fastest and 9 is the smallest',
+    )
+    append_parser.add_argument(
+        '-w', '--workers', type=int, help=workers_help
+    )
+    append_parser.add_argument(
+        '-p', '--progress', action='store_true', help=progress_help
+    )
+    append_parser.add_argument(
+        '-D', '--dictionary', help=dictionary_help
+    )
+    append_parser.add_argument(
+        '--stats', metavar='FILE', help=stats_help
+    )
+    append_parser.set_defaults(function=append)
+
+    train_parser = commands.add_parser(
+        'train', help='train a dictionary from sample files'
+    )
+    train_parser.add_argument('samples', nargs='+')
+    train_parser.add_argument('-o', '--output', required=True)
+    train_parser.add_argument(
+        '-s', '--size', type=int, default=DICTIONARY_SIZE,
+        help='max size of the dictionary content',
+    )
+    train_parser.add_argument(
+        '-f', '--format', choices=list(TOKEN_FORMATS), default='compact',
+        help='lz77 token format the dictionary is used with',
+    )
+    train_parser.set_defaults(function=train)
+
+    info_parser = commands.add_parser(
+        'info', help='describe an anvil file'
+    )
+    info_parser.add_argument('input', nargs='?', default='-')
+    info_parser.set_defaults(function=info)
+
+    # arguments of the bench command are parsed by the benchmark module
+    bench_parser = commands.add_parser(
+        'bench', help='run the benchmark suite, arguments are passed to it',
+        add_help=False,
+    )
+    bench_parser.set_defaults(function=bench)
+
+    gui_parser = commands.add_parser('gui', help='start the gui')
+    gui_parser.set_defaults(function=gui)
+
+    args, bench_args = parser.parse_known_args(args)
+
+    if bench_args and args.command != 'bench':
+        parser.error('unrecognized arguments: ' + ' '.join(bench_args))
+
+    args.bench_args = bench_args
+
+    if args.command is None:
+        args.function = gui
+
+    return args
+
+
+def main(args=None):
+    args = parse_args(sys.argv[1:] if args is None else args)
+
+    try:
+        args.function(args)
+    except BrokenPipeError:
+        # the reader of the output is closed, like `anvil decode | head`,
+        # output left in the buffer is sent to devnull so python doesn't
+        # fail again while flushing it at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+    except Exception as e:
+        print(f'anvil: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, List, Sequence, Union
+
+from .anvil import Anvil
+from .dictionary import Dictionary
+from .lz77 import Lz77, Lz77Decoder
+from .stream import CHUNK_SIZE, check_block_size
+from .varint import read_varint
+
+
+# max number of blocks of a stream that are read before their output is
+# taken, a consumer that is slower than the codec stops the reading of its
+# source at this many blocks
+QUEUE_SIZE = 4
+
+
+async def _iter_chunks(source,
+                       chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    # a bytes like object is a single chunk
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if len(source):
+            yield bytes(source)
+        return
+
+    # stream readers and other objects with an async read method are read
+    # chunk by chunk
+    if hasattr(source, 'read'):
+        while True:
+            chunk = await source.read(chunk_size)
+
+            if not chunk:
+                return
+
+            yield chunk
+
+    # otherwise the source must be an async iterable of chunks
+    async for chunk in source:
+        if chunk:
+            yield chunk
+
+
+async def _iter_blocks(source, block_size: int) -> AsyncIterator[bytes]:
+    # like `iter_blocks`, every block except the last one has exactly
+    # `block_size` bytes
+    check_block_size(block_size)
+    buffer = bytearray()
+
+    async for chunk in _iter_chunks(source, block_size):
+        buffer += chunk
+
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+class _AsyncChunkReader:
+    # `ChunkReader` for async sources
+    def __init__(self, source, chunk_size: int = CHUNK_SIZE):
+        self.chunks = _iter_chunks(source, chunk_size)
+        self.buffer = bytearray()
+
+    async def _fill(self, size: int) -> bool:
+        while len(self.buffer) < size:
+            try:
+                chunk = await self.chunks.__anext__()
+            except StopAsyncIteration:
+                return False
+
+            self.buffer += chunk
+
+        return True
+
+    async def peek(self, size: int) -> bytes:
+        await self._fill(size)
+        return bytes(self.buffer[:size])
+
+    async def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            async for chunk in self.chunks:
+                self.buffer += chunk
+
+            size = len(self.buffer)
+
+        await self._fill(size)
+
+        bytes_ = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return bytes_
+
+    async def read_exact(self, size: int) -> bytes:
+        bytes_ = await self.read(size)
+
+        if len(bytes_) < size:
+            raise ValueError('unexpected end of stream')
+
+        return bytes_
+
+    async def read_varint(self) -> int:
+        await self._fill(10)
+
+        if not self.buffer:
+            raise ValueError('unexpected end of stream')
+
+        value, index = read_varint(self.buffer, 0)
+        del self.buffer[:index]
+        return value
+
+    async def read_blocks(self) -> AsyncIterator[bytes]:
+        while True:
+            size = await self.read_varint()
+
+            # a block of size 0 is the end sign of the blocks
+            if size == 0:
+                return
+
+            yield await self.read_exact(size)
+
+
+class AsyncAnvil:
+    # the codec runs in an executor, so the event loop keeps serving other
+    # tasks while it compresses; the default thread pool of the loop is used
+    # if no executor is given, a process pool also codes the blocks of the
+    # streams in parallel since the codec holds the gil in a thread
+    def __init__(self, executor: Executor = None, max_jobs: int = None,
+                 queue_size: int = QUEUE_SIZE):
+        self.executor = executor
+        self.queue_size = queue_size
+
+        # jobs of all operations that are in the executor at once, the
+        # others wait for a free slot without copying their bytes to it
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.semaphore = asyncio.Semaphore(self.max_jobs)
+
+    async def _run(self, function: Callable, *args, **kwargs):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, partial(function, *args, **kwargs)
+            )
+
+    async def _run_thread(self, function: Callable, *args):
+        # stages that keep their state in this process, like the lz77
+        # window of a stream, can't run in a process pool
+        executor = self.executor
+
+        if not isinstance(executor, ThreadPoolExecutor):
+            executor = None
+
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, partial(function, *args)
+            )
+
+    async def compress(self, bytes_,
+                       token_format: int = Lz77.FORMAT_COMPACT,
+                       block_size: int = Anvil.BLOCK_SIZE,
+                       level: int = None,
+                       dictionary: Dictionary = None,
+                       stages: Union[Sequence[str], str] = None,
+                       min_speed: float = None) -> bytes:
+        return await self._run(
+            Anvil.compress, bytes(bytes_), token_format, block_size,
+            level=level, dictionary=dictionary, stages=stages,
+            min_speed=min_speed,
+        )
+
+    async def decompress(self, bytes_,
+                         dictionary: Dictionary = None) -> bytes:
+        return await self._run(
+            Anvil.decompress, bytes(bytes_), dictionary=dictionary
+        )
+
+    async def _map_blocks(self, function: Callable,
+                          blocks: AsyncIterator) -> AsyncIterator:
+        # like `Anvil._map_blocks`, the results are yielded in the order of
+        # the blocks; the next block is only read when a result is taken,
+        # so the memory of a stream doesn't grow with its input
+        futures: deque = deque()
+
+        try:
+            async for block in blocks:
+                futures.append(
+                    asyncio.ensure_future(self._run(function, block))
+                )
+
+                if len(futures) >= self.queue_size:
+                    yield await futures.popleft()
+
+            while futures:
+                yield await futures.popleft()
+        finally:
+            # waiting blocks aren't coded if the stream fails or is closed
+            for future in futures:
+                future.cancel()
+
+    async def encode_stream(self, source,
+                            token_format: int = Lz77.FORMAT_COMPACT,
+                            block_size: int = Anvil.BLOCK_SIZE,
+                            level: int = None,
+                            dictionary: Dictionary = None,
+                            stages: Union[Sequence[str], str] = None,
+                            min_speed: float = None
+                            ) -> AsyncIterator[bytes]:
+        # blocks are coded independently, so they can be coded by any
+        # process of the pool; the output is the same as the output of
+        # `Anvil.encode_stream` with workers
+        if stages is not None:
+            async for encoded_bytes in self._encode_stages(
+                source, block_size, level, dictionary, stages, min_speed
+            ):
+                yield encoded_bytes
+            return
+
+        yield Anvil._header(
+            token_format, Anvil.FLAG_INDEPENDENT | Anvil.FLAG_INDEX,
+            dictionary=dictionary,
+        )
+
+        encoded_sizes: List[int] = []
+        decoded_sizes: List[int] = []
+
+        async def sized_blocks():
+            async for block in _iter_blocks(source, block_size):
+                decoded_sizes.append(len(block))
+                yield block
+
+        async for encoded_block in self._map_blocks(
+            partial(
+                Anvil._compress_block, token_format=token_format, level=level,
+                dictionary=dictionary,
+            ),
+            sized_blocks(),
+        ):
+            encoded_sizes.append(len(encoded_block))
+            yield encoded_block
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
+        yield Anvil._write_index(encoded_sizes, decoded_sizes)
+
+    async def _encode_stages(self, source, block_size: int, level: int,
+                             dictionary: Dictionary,
+                             stages: Union[Sequence[str], str],
+                             min_speed: float) -> AsyncIterator[bytes]:
+        blocks = _iter_blocks(source, block_size)
+
+        # the first block is the sample of the auto mode, it is coded
+        # in the executor since every chain is tried on it
+        try:
+            first = await blocks.__anext__()
+        except StopAsyncIteration:
+            first = b''
+
+        stages = await self._run(
+            Anvil._resolve_stages, stages, first, min_speed, dictionary
+        )
+
+        yield Anvil._header(Lz77.FORMAT_COMPACT, 0, stages=stages)
+
+        async def all_blocks():
+            if first:
+                yield first
+
+            async for block in blocks:
+                yield block
+
+        async for encoded_block in self._map_blocks(
+            partial(Anvil._compress_stages, stages=stages, level=level),
+            all_blocks(),
+        ):
+            yield encoded_block
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
+    async def decode_stream(self, source,
+                            dictionary: Dictionary = None
+                            ) -> AsyncIterator[bytes]:
+        reader = _AsyncChunkReader(source)
+
+        version, token_format, flags, header_size = Anvil._parse_header(
+            await reader.peek(Anvil.MAX_HEADER_SIZE)
+        )
+        header = await reader.read(header_size)
+        dictionary = Anvil._check_dictionary(header, flags, dictionary)
+
+        if flags & Anvil.FLAG_STAGES:
+            async for decoded_bytes in self._map_blocks(
+                partial(
+                    Anvil._decompress_stages,
+                    stages=Anvil._stages(header, flags),
+                ),
+                reader.read_blocks(),
+            ):
+                yield decoded_bytes
+            return
+
+        # files before the blocks are a single huffman stream, they are
+        # decoded at once
+        if version == 1:
+            yield await self.decompress(await reader.read())
+            return
+
+        if flags & Anvil.FLAG_INDEPENDENT:
+            async for decoded_bytes in self._map_blocks(
+                partial(
+                    Anvil._decompress_block, token_format=token_format,
+                    dictionary=dictionary,
+                ),
+                reader.read_blocks(),
+            ):
+                yield decoded_bytes
+            return
+
+        # the entropy stage of the blocks runs in the executor, the lz77
+        # stage needs the window of the blocks before and runs in a thread
+        decoder = Lz77Decoder(
+            token_format, dictionary and dictionary.content
+        )
+
+        async for stored, bytes_ in self._map_blocks(
+            partial(
+                AsyncAnvil._decode_entropy, token_format=token_format,
+                dictionary=dictionary,
+            ),
+            reader.read_blocks(),
+        ):
+            try:
+                if stored:
+                    decoded_bytes = await self._run_thread(
+                        decoder.append, bytes_
+                    )
+                else:
+                    decoded_bytes = await self._run_thread(
+                        decoder.decode, bytes_
+                    )
+            except Exception as e:
+                raise Exception(f'error in lz77 decode: {e}')
+
+            if decoded_bytes:
+                yield decoded_bytes
+
+        try:
+            decoded_bytes = decoder.flush()
+        except Exception as e:
+            raise Exception(f'error in lz77 decode: {e}')
+
+        if decoded_bytes:
+            yield decoded_bytes
+
+    @staticmethod
+    def _decode_entropy(block, token_format: int,
+                        dictionary: Dictionary = None):
+        # returns whether the block is stored, with its decoded bytes or
+        # its lz77 output
+        if block[0] == Anvil.BLOCK_STORED:
+            return True, block[1:]
+
+        return False, Anvil._decode_entropy(block, token_format, dictionary)
+
+    @staticmethod
+    async def _write(chunks: AsyncIterator[bytes], writer):
+        # waits for the writer after every chunk, so a slow connection stops
+        # the codec instead of buffering its output
+        async for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+
+    async def encode_to(self, source, writer,
+                        token_format: int = Lz77.FORMAT_COMPACT,
+                        block_size: int = Anvil.BLOCK_SIZE,
+                        level: int = None, dictionary: Dictionary = None,
+                        stages: Union[Sequence[str], str] = None,
+                        min_speed: float = None):
+        # the writer is a stream writer or an object with its write and
+        # drain methods
+        await AsyncAnvil._write(self.encode_stream(
+            source, token_format, block_size, level, dictionary, stages,
+            min_speed,
+        ), writer)
+
+    async def decode_to(self, source, writer,
+                        dictionary: Dictionary = None):
+        await AsyncAnvil._write(
+            self.decode_stream(source, dictionary), writer
+        )
@@ -1,30 +1,1818 @@
+import math
+import os
+import shutil
+import struct
+from bisect import bisect_right
+from collections import Counter, deque
+from functools import partial
+from itertools import chain
+from typing import (
+    Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union,
+)
+
+from .cache import ResultCache
+from .dictionary import Dictionary
+from .entropy import Entropy
 from .huffman import Huffman
-from .lz77 import Lz77
+from .lz77 import Lz77, Lz77Decoder, Lz77Encoder
+from .pipeline import Pipeline
+from .progress import Progress
+from .stats import Stats
+from .stream import (
+    ChunkReader, byte_view, check_block_size, file_size, iter_blocks,
+    iter_sized, map_file, map_output, write_stream,
+)
+from .varint import read_varint, write_varint
 
 
 class Anvil:
     def __new__(cls): pass
-    
+
+    # files written before the header was added start with the huffman
+    # frequency dict whose first byte is never 0, so a header starting
+    # with 0 can't be confused with them
+    MAGIC = b'\x00ANV'
+
+    # version 1 is a single huffman stream of the lz77 output, version 2
+    # is a sequence of blocks each coded with its own huffman table,
+    # version 3 adds a flags byte to the header, version 4 adds the blocks
+    # that are coded with a table for every token field and version 5
+    # allows the lz77 matches that overlap the bytes they write, version 6
+    # adds the decoded size to the header, version 7 adds the id of the
+    # dictionary and the blocks that are coded with its tables, version 8
+    # adds the stored blocks and version 9 adds the chains of stages
+    VERSION = 9
+
+    # the first byte of a block is its type, a huffman stream starts with
+    # 0, so the blocks of the older versions are huffman blocks
+    BLOCK_HUFFMAN = Huffman.CANONICAL
+    BLOCK_TABLES = 1
+    BLOCK_DICTIONARY = 2
+
+    # the decoded bytes of the block follow its type, they are still the
+    # lz77 window of the next blocks
+    BLOCK_STORED = 3
+
+    # the output of the chain of stages in the header
+    BLOCK_STAGES = 4
+
+    # names of the block types in the stats
+    BLOCK_NAMES = {
+        BLOCK_HUFFMAN: 'huffman',
+        BLOCK_TABLES: 'tables',
+        BLOCK_DICTIONARY: 'dictionary',
+        BLOCK_STORED: 'stored',
+        BLOCK_STAGES: 'stages',
+    }
+
+    # blocks don't use the bytes before them as their lz77 window, so
+    # they can be encoded and decoded separately
+    FLAG_INDEPENDENT = 1
+
+    # the blocks are followed by an index of their compressed and decoded
+    # sizes, so a byte range can be decoded without the blocks before it
+    FLAG_INDEX = 2
+
+    # the header is followed by the decoded size as 8 bytes, so the output
+    # can be allocated before decoding
+    FLAG_SIZE = 4
+    SIZE_FIELD = 8
+
+    # the header is followed by the id of the dictionary as 4 bytes, after
+    # the decoded size if it is given too
+    FLAG_DICTIONARY = 8
+    DICTIONARY_FIELD = 4
+
+    # the blocks are coded with a chain of stages instead of lz77 and the
+    # tables of its tokens, the header ends with the number of the stages
+    # and their ids; the blocks are independent and have no index
+    FLAG_STAGES = 16
+    STAGES_FIELD = 1 + Pipeline.MAX_STAGES
+
+    # the index ends with its size as 4 bytes and this magic
+    INDEX_MAGIC = b'AIDX'
+    FOOTER_SIZE = len(INDEX_MAGIC) + 4
+
+    # magic, version, lz77 token format and flags
+    HEADER_SIZE = len(MAGIC) + 3
+    MAX_HEADER_SIZE = HEADER_SIZE + SIZE_FIELD + DICTIONARY_FIELD + \
+        STAGES_FIELD
+
+    # number of input bytes that are coded as a block
+    BLOCK_SIZE = 1 << 20
+
+    # a block is stored without trying lz77 if samples of it have more
+    # bits of entropy per byte than this and almost no repeated strings
+    PROBE_COUNT = 4
+    PROBE_SIZE = 1 << 12
+    PROBE_ENTROPY = 7.5
+    PROBE_REPEATS = 0.01
+
+    @staticmethod
+    def encode(file_path: str, save_path: str,
+               token_format: int = Lz77.FORMAT_COMPACT,
+               workers: int = None, progress: Progress = None,
+               level: int = None, mapped: bool = False,
+               block_size: int = BLOCK_SIZE, dictionary: Dictionary = None,
+               cache: ResultCache = None, stats: Stats = None,
+               stages: Union[Sequence[str], str] = None,
+               min_speed: float = None):
+        check_block_size(block_size)
+
+        if progress is not None and progress.total is None:
+            progress.total = os.path.getsize(file_path)
+
+        if cache is None:
+            Anvil._encode_file(
+                file_path, save_path, token_format, workers, progress, level,
+                mapped, block_size, dictionary, stats, stages, min_speed,
+            )
+            return
+
+        if stats is not None:
+            clock = stats.clock()
+
+        # an input that was encoded with the same parameters before is
+        # only hashed, the output is linked from the cache
+        with open(file_path, 'rb') as file:
+            key = cache.key(file, Anvil._cache_parameters(
+                token_format, workers, level, mapped, block_size, dictionary,
+                stages, min_speed,
+            ))
+
+            if stats is not None:
+                clock = stats.add('cache', clock, file.tell())
+
+        if cache.link(key, save_path):
+            if progress is not None:
+                progress.update('cache', progress.total)
+            return
+
+        Anvil._encode_file(
+            file_path, save_path, token_format, workers, progress, level,
+            mapped, block_size, dictionary, stats, stages, min_speed,
+        )
+        cache.store(key, save_path)
+
+    @staticmethod
+    def _encode_file(file_path: str, save_path: str, token_format: int,
+                     workers: Optional[int], progress: Optional[Progress],
+                     level: Optional[int], mapped: bool, block_size: int,
+                     dictionary: Optional[Dictionary],
+                     stats: Optional[Stats],
+                     stages: Union[Sequence[str], str, None],
+                     min_speed: Optional[float]):
+        # a mapped file is searched in place like the bytes of `compress`,
+        # instead of being read to the window of the stream encoder
+        if mapped:
+            with map_file(file_path) as bytes_:
+                write_stream(Anvil._compress_chunks(
+                    bytes_, token_format, block_size, workers, progress,
+                    level, dictionary, stats, stages, min_speed,
+                ), save_path)
+            return
+
+        with open(file_path, 'rb') as file:
+            write_stream(Anvil.encode_stream(
+                file, token_format, block_size, workers, progress, level,
+                dictionary, stats, stages, min_speed, file_size(file),
+            ), save_path)
+
+    @staticmethod
+    def decode(file_path: str, save_path: str, workers: int = None,
+               progress: Progress = None, mapped: bool = False,
+               dictionary: Dictionary = None, stats: Stats = None):
+        if progress is not None and progress.total is None:
+            progress.total = os.path.getsize(file_path)
+
+        # the output can only be mapped if the header has its size, files
+        # without it are decoded as a stream
+        if mapped:
+            with map_file(file_path) as bytes_:
+                _, _, flags, _ = Anvil._parse_header(bytes_)
+                size = Anvil._decoded_size(bytes_, flags)
+
+                if size is not None:
+                    with map_output(save_path, size) as output:
+                        Anvil._decompress_into(
+                            bytes_, output, workers, progress, dictionary,
+                            stats,
+                        )
+                    return
+
+        with open(file_path, 'rb') as file:
+            write_stream(Anvil.decode_stream(
+                file, workers, progress, dictionary, stats
+            ), save_path)
+
+    @staticmethod
+    def append(file_path: str, save_path: str, offset: int = None,
+               workers: int = None, progress: Progress = None,
+               level: int = None, block_size: int = BLOCK_SIZE,
+               dictionary: Dictionary = None, stats: Stats = None):
+        # encodes the bytes of the file from the offset to its end as new
+        # blocks at the end of the anvil file, the blocks before them are
+        # kept as they are; the offset is the decoded size of the anvil
+        # file by default, so only the new bytes of a growing file are
+        # encoded and only the new blocks are written
+        check_block_size(block_size)
+
+        if os.stat(save_path).st_nlink == 1:
+            with open(save_path, 'r+b') as save:
+                Anvil._append_blocks(
+                    save, file_path, offset, workers, progress, level,
+                    block_size, dictionary, stats,
+                )
+            return
+
+        # a file with other links may be an entry of the result cache, the
+        # blocks are added to a copy that replaces it, so the other links
+        # keep the old file
+        temp_path = save_path + '.tmp'
+        shutil.copyfile(save_path, temp_path)
+
+        try:
+            with open(temp_path, 'r+b') as save:
+                Anvil._append_blocks(
+                    save, file_path, offset, workers, progress, level,
+                    block_size, dictionary, stats,
+                )
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        os.replace(temp_path, save_path)
+
+    @staticmethod
+    def _append_blocks(save, file_path: str, offset: Optional[int],
+                       workers: Optional[int], progress: Optional[Progress],
+                       level: Optional[int], block_size: int,
+                       dictionary: Optional[Dictionary],
+                       stats: Optional[Stats]):
+        header = save.read(Anvil.MAX_HEADER_SIZE)
+        version, token_format, flags, _ = Anvil._parse_header(header)
+
+        if version < 3:
+            raise ValueError(
+                f'anvil files of version {version} can\'t be appended'
+            )
+
+        if flags & Anvil.FLAG_STAGES:
+            raise ValueError('anvil files of stages can\'t be appended')
+
+        dictionary = Anvil._check_dictionary(header, flags, dictionary)
+
+        # the end sign of the blocks and the index after it are written
+        # again after the new blocks
+        encoded_sizes: List[int] = []
+        decoded_sizes: List[int] = []
+
+        if flags & Anvil.FLAG_INDEX:
+            save.seek(0)
+            _, encoded_offsets, decoded_offsets = Anvil._read_index(save)
+
+            for i in range(1, len(encoded_offsets)):
+                encoded_sizes.append(
+                    encoded_offsets[i] - encoded_offsets[i - 1]
+                )
+                decoded_sizes.append(
+                    decoded_offsets[i] - decoded_offsets[i - 1]
+                )
+
+            end = encoded_offsets[-1]
+            size = decoded_offsets[-1]
+        else:
+            end = save.seek(0, os.SEEK_END) - 1
+            size = Anvil._decoded_size(header, flags)
+
+        save.seek(end)
+        tail = save.read()
+
+        if tail[:1] != b'\x00':
+            raise ValueError('invalid end of the anvil blocks')
+
+        if offset is None:
+            if size is None:
+                raise ValueError(
+                    'anvil file has no decoded size, the offset of the '
+                    'new bytes must be given'
+                )
+
+            offset = size
+
+        # a failed or cancelled append leaves the file as it was, the end
+        # sign with the index after it and the header are written back
+        try:
+            with open(file_path, 'rb') as file:
+                new_size = os.fstat(file.fileno()).st_size - offset
+
+                if offset < 0 or new_size < 0:
+                    raise ValueError('offset is out of the file')
+
+                if progress is not None and progress.total is None:
+                    progress.total = new_size
+
+                # independent blocks have no window, the new blocks of the
+                # other files start with the window of the blocks before
+                # them if the bytes before the offset are their bytes
+                window = b''
+
+                if not flags & Anvil.FLAG_INDEPENDENT and offset == size:
+                    window_size = Lz77._window_size(token_format)
+                    start = max(0, offset - window_size)
+
+                    file.seek(start)
+                    window = Anvil._prime(dictionary, token_format) + \
+                        file.read(offset - start)
+                    window = window[-window_size:]
+
+                file.seek(offset)
+                save.seek(end)
+
+                if flags & Anvil.FLAG_INDEPENDENT:
+                    blocks = Anvil._independent_blocks(
+                        iter_blocks(file, block_size), token_format,
+                        1 if workers is None else workers, progress,
+                        level, dictionary, encoded_sizes, decoded_sizes,
+                        stats,
+                    )
+                else:
+                    blocks = Anvil._stream_blocks(
+                        file, token_format, block_size, progress, level,
+                        dictionary, window, stats,
+                    )
+
+                for block in blocks:
+                    save.write(block)
+
+                # a block of size 0 is the end sign of the blocks
+                save.write(b'\x00')
+
+                if flags & Anvil.FLAG_INDEX:
+                    save.write(
+                        Anvil._write_index(encoded_sizes, decoded_sizes)
+                    )
+
+                save.truncate()
+
+            # the new blocks may use the blocks of this version, and the
+            # decoded size grows by the new bytes
+            save.seek(len(Anvil.MAGIC))
+            save.write(bytes([Anvil.VERSION]))
+
+            if flags & Anvil.FLAG_SIZE:
+                save.seek(Anvil.HEADER_SIZE)
+                save.write(struct.pack('<Q', size + new_size))
+        except BaseException:
+            save.seek(end)
+            save.write(tail)
+            save.truncate()
+
+            save.seek(0)
+            save.write(header)
+            raise
+
+    @staticmethod
+    def compress(bytes_, token_format: int = Lz77.FORMAT_COMPACT,
+                 block_size: int = BLOCK_SIZE, workers: int = None,
+                 progress: Progress = None, level: int = None,
+                 dictionary: Dictionary = None, cache: ResultCache = None,
+                 stats: Stats = None,
+                 stages: Union[Sequence[str], str] = None,
+                 min_speed: float = None) -> bytes:
+        check_block_size(block_size)
+        bytes_ = byte_view(bytes_)
+
+        if cache is None:
+            return b''.join(Anvil._compress_chunks(
+                bytes_, token_format, block_size, workers, progress, level,
+                dictionary, stats, stages, min_speed,
+            ))
+
+        if stats is not None:
+            clock = stats.clock()
+
+        # the output is the same as the output of a mapped file, so they
+        # share the entries of the cache
+        key = cache.key(bytes_, Anvil._cache_parameters(
+            token_format, workers, level, True, block_size, dictionary,
+            stages, min_speed,
+        ))
+        encoded_bytes = cache.load(key)
+
+        if stats is not None:
+            stats.add('cache', clock, len(bytes_))
+
+        if encoded_bytes is not None:
+            if progress is not None:
+                progress.update('cache', len(bytes_))
+            return encoded_bytes
+
+        encoded_bytes = b''.join(Anvil._compress_chunks(
+            bytes_, token_format, block_size, workers, progress, level,
+            dictionary, stats, stages, min_speed,
+        ))
+        cache.store_bytes(key, encoded_bytes)
+
+        return encoded_bytes
+
+    @staticmethod
+    def _cache_parameters(token_format: int, workers: Optional[int],
+                          level: Optional[int], sized: bool, block_size: int,
+                          dictionary: Optional[Dictionary],
+                          stages: Union[Sequence[str], str, None],
+                          min_speed: Optional[float]) -> tuple:
+        # the parameters that change the output; the number of workers
+        # doesn't, only whether the blocks are independent, and the size
+        # is only in the header if the whole input is known
+        if stages is not None and not isinstance(stages, str):
+            stages = tuple(stages)
+
+        return (
+            Anvil.VERSION, token_format, workers is not None, level, sized,
+            block_size, dictionary and dictionary.id, stages, min_speed,
+        )
+
+    @staticmethod
+    def _compress_chunks(bytes_, token_format: int, block_size: int,
+                         workers: int = None, progress: Progress = None,
+                         level: int = None, dictionary: Dictionary = None,
+                         stats: Stats = None,
+                         stages: Union[Sequence[str], str] = None,
+                         min_speed: float = None) -> Iterator[bytes]:
+        # yields the header and the encoded blocks of the bytes, the size
+        # of the bytes is known, so it is written to the header
+        if progress is not None and progress.total is None:
+            progress.total = len(bytes_)
+
+        if stages is not None:
+            yield from Anvil._encode_stages(
+                (
+                    memoryview(bytes_)[i:i + block_size]
+                    for i in range(0, len(bytes_), block_size)
+                ),
+                Anvil._resolve_stages(stages, bytes_, min_speed, dictionary),
+                workers, progress, level, stats,
+            )
+            return
+
+        # the level only changes how the lz77 matches are searched, so the
+        # decoder doesn't need to know it
+
+        # if workers are given, blocks are independent and encoded by that
+        # many processes, 0 means a process for every cpu
+        if workers is not None:
+            blocks = (
+                memoryview(bytes_)[i:i + block_size]
+                for i in range(0, len(bytes_), block_size)
+            )
+
+            yield from Anvil._encode_independent(
+                blocks, token_format, workers, progress, level, len(bytes_),
+                dictionary, stats,
+            )
+            return
+
+        yield Anvil._header(token_format, 0, len(bytes_), dictionary)
+
+        # blocks are encoded from the given bytes in place, the bytes
+        # before a block are its lz77 window; a dictionary is put before
+        # the first block, which copies the bytes, but a dictionary is
+        # meant for small inputs
+        primed = len(Anvil._prime(dictionary, token_format))
+
+        if primed:
+            bytes_ = Anvil._prime(dictionary, token_format) + bytes(bytes_)
+
+        i = primed
+
+        while i < len(bytes_):
+            start = i
+            end = min(i + block_size, len(bytes_))
+
+            if Anvil._incompressible(memoryview(bytes_)[start:end], stats):
+                i = end
+                yield Anvil._store_progress(
+                    memoryview(bytes_)[start:end], i - primed, progress,
+                    stats,
+                )
+                continue
+
+            if stats is not None:
+                clock = stats.clock()
+
+            try:
+                tokens, i = Lz77._encode_range(
+                    bytes_, i, end, token_format, progress=progress,
+                    offset=-primed, level=level, primed=primed,
+                )
+            except Exception as e:
+                raise Exception(f'error in lz77 encode: {e}')
+
+            if stats is not None:
+                Anvil._count_lz77(
+                    stats, clock, i - start, len(tokens), tokens,
+                    token_format,
+                )
+
+            yield Anvil._encode_progress(
+                tokens, token_format, i - primed, progress, dictionary,
+                memoryview(bytes_)[start:i], stats,
+            )
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
+    @staticmethod
+    def decompress(bytes_, workers: int = None, progress: Progress = None,
+                   dictionary: Dictionary = None,
+                   stats: Stats = None) -> bytes:
+        if progress is not None and progress.total is None:
+            progress.total = len(bytes_)
+
+        version, token_format, flags, index = Anvil._parse_header(bytes_)
+        dictionary = Anvil._check_dictionary(bytes_, flags, dictionary)
+
+        # blocks are read through a memoryview, so they aren't copied
+        encoded_bytes = memoryview(bytes_)
+
+        if flags & Anvil.FLAG_STAGES:
+            blocks = Anvil._split_blocks(encoded_bytes, index)
+            decoded_blocks = Anvil._decode_stages(
+                blocks, Anvil._stages(bytes_, flags), workers, stats
+            )
+
+            if progress is None:
+                return Anvil._check_size(
+                    bytes_, flags, b''.join(decoded_blocks)
+                )
+
+            decoded_bytes = bytearray()
+
+            for block, decoded_block in zip(blocks, decoded_blocks):
+                decoded_bytes += decoded_block
+
+                index += len(block)
+                progress.update('decode', index)
+
+            return Anvil._check_size(bytes_, flags, decoded_bytes)
+
+        # a dictionary is the window of the first block
+        prime = Anvil._prime(dictionary, token_format)
+        decoded_bytes = bytearray(prime)
+
+        if version == 1:
+            # files without blocks are a single huffman stream
+            try:
+                tokens = Huffman.decompress(encoded_bytes[index:])
+            except Exception as e:
+                raise Exception(f'error in huffman decode: {e}')
+
+            Anvil._decode_tokens(tokens, decoded_bytes, token_format)
+
+            return bytes(decoded_bytes)
+
+        blocks = Anvil._split_blocks(encoded_bytes, index)
+
+        # independent blocks can be decoded by separate processes
+        workers = Anvil._block_workers(workers, flags, dictionary)
+
+        if workers is not None and flags & Anvil.FLAG_INDEPENDENT:
+            decoded_blocks = Anvil._map_blocks(
+                partial(
+                    Anvil._decompress_block, token_format=token_format,
+                    dictionary=dictionary,
+                ),
+                blocks, workers, stats,
+            )
+
+            if progress is None:
+                return Anvil._check_size(
+                    bytes_, flags, b''.join(decoded_blocks)
+                )
+
+            decoded_bytes.clear()
+
+            for block, decoded_block in zip(blocks, decoded_blocks):
+                decoded_bytes += decoded_block
+
+                index += len(block)
+                progress.update('decode', index)
+
+            return Anvil._check_size(bytes_, flags, decoded_bytes)
+
+        for block in blocks:
+            # progress is given as the end of the block in the bytes
+            index += len(block)
+
+            Anvil._decode_block(
+                block, decoded_bytes, token_format, progress, index,
+                dictionary, stats,
+            )
+
+        del decoded_bytes[:len(prime)]
+
+        return Anvil._check_size(bytes_, flags, decoded_bytes)
+
+    @staticmethod
+    def _check_size(bytes_, flags: int, decoded_bytes) -> bytes:
+        # every way of decoding the blocks must give the decoded size that
+        # the header has
+        size = Anvil._decoded_size(bytes_, flags)
+
+        if size is not None and size != len(decoded_bytes):
+            raise ValueError('decoded size doesn\'t match the header')
+
+        return bytes(decoded_bytes)
+
+    @staticmethod
+    def _decompress_into(bytes_, output: memoryview, workers: int = None,
+                         progress: Progress = None,
+                         dictionary: Dictionary = None, stats: Stats = None):
+        # decodes the blocks to the output that has the decoded size from
+        # the header, only the lz77 window of the next block is kept
+        version, token_format, flags, index = Anvil._parse_header(bytes_)
+        dictionary = Anvil._check_dictionary(bytes_, flags, dictionary)
+
+        blocks = Anvil._split_blocks(memoryview(bytes_), index)
+        position = 0
+
+        workers = Anvil._block_workers(workers, flags, dictionary)
+
+        if workers is not None and flags & Anvil.FLAG_INDEPENDENT:
+            for block, decoded_bytes in zip(blocks, Anvil._map_blocks(
+                partial(
+                    Anvil._decompress_block, token_format=token_format,
+                    dictionary=dictionary,
+                ),
+                blocks, workers, stats,
+            )):
+                position = Anvil._write_output(output, position, decoded_bytes)
+
+                if progress is not None:
+                    index += len(block)
+                    progress.update('decode', index)
+        else:
+            window = bytearray(Anvil._prime(dictionary, token_format))
+            window_size = Lz77._window_size(token_format)
+
+            for block in blocks:
+                index += len(block)
+                start = len(window)
+
+                Anvil._decode_block(
+                    block, window, token_format, progress, index, dictionary,
+                    stats,
+                )
+
+                if stats is not None:
+                    stats.buffer('window', len(window))
+
+                with memoryview(window) as view:
+                    position = Anvil._write_output(
+                        output, position, view[start:]
+                    )
+
+                del window[:max(0, len(window) - window_size)]
+
+        if position != len(output):
+            raise ValueError('decoded size doesn\'t match the header')
+
+    @staticmethod
+    def _write_output(output: memoryview, position: int, bytes_) -> int:
+        # writes the bytes at the position, returns the end of them
+        end = position + len(bytes_)
+
+        if end > len(output):
+            raise ValueError('decoded size doesn\'t match the header')
+
+        output[position:end] = bytes_
+
+        return end
+
+    @staticmethod
+    def read_range(file_path: str, offset: int, length: int,
+                   dictionary: Dictionary = None) -> bytes:
+        # decodes `length` bytes starting from `offset` by decoding only
+        # the blocks that contain them, the file must have a block index
+        if offset < 0 or length < 0:
+            raise ValueError('offset and length must not be negative')
+
+        with open(file_path, 'rb') as file:
+            header = file.read(Anvil.MAX_HEADER_SIZE)
+            _, _, flags, _ = Anvil._parse_header(header)
+            dictionary = Anvil._check_dictionary(header, flags, dictionary)
+
+            file.seek(0)
+            token_format, encoded_offsets, decoded_offsets = \
+                Anvil._read_index(file)
+
+            end = min(offset + length, decoded_offsets[-1])
+
+            if offset >= end:
+                return b''
+
+            # first block that contains the offset
+            block = bisect_right(decoded_offsets, offset) - 1
+            start = offset - decoded_offsets[block]
+
+            decoded_bytes = bytearray()
+
+            while decoded_offsets[block] < end:
+                file.seek(encoded_offsets[block])
+                encoded_block = file.read(
+                    encoded_offsets[block + 1] - encoded_offsets[block]
+                )
+
+                # skip the size of the block
+                _, i = read_varint(encoded_block, 0)
+
+                decoded_bytes += Anvil._decompress_block(
+                    memoryview(encoded_block)[i:], token_format, dictionary
+                )
+                block += 1
+
+        return bytes(decoded_bytes[start:start + end - offset])
+
+    @staticmethod
+    def info(file) -> dict:
+        # describes an anvil file from its header, sizes of the blocks are
+        # given too if the file has a block index and can be seeked
+        header = file.read(Anvil.MAX_HEADER_SIZE)
+        version, token_format, flags, _ = Anvil._parse_header(header)
+
+        info = {
+            'version': version,
+            'token_format': token_format,
+            'independent_blocks': bool(flags & Anvil.FLAG_INDEPENDENT),
+            'indexed': bool(flags & Anvil.FLAG_INDEX),
+        }
+
+        size = Anvil._decoded_size(header, flags)
+
+        if size is not None:
+            info['decoded_size'] = size
+
+        dictionary_id = Anvil._dictionary_id(header, flags)
+
+        if dictionary_id is not None:
+            info['dictionary'] = f'{dictionary_id:08x}'
+
+        stages = Anvil._stages(header, flags)
+
+        if stages is not None:
+            info['stages'] = ','.join(stages)
+
+        if info['indexed'] and file.seekable():
+            file.seek(0)
+            _, encoded_offsets, decoded_offsets = Anvil._read_index(file)
+
+            info['blocks'] = len(decoded_offsets) - 1
+            info['compressed_size'] = file.seek(0, os.SEEK_END)
+            info['decoded_size'] = decoded_offsets[-1]
+
+        return info
+
+    @staticmethod
+    def _header(token_format: int, flags: int, size: int = None,
+                dictionary: Dictionary = None,
+                stages: Sequence[str] = None) -> bytes:
+        # the decoded size is written if it is known before the blocks
+        fields = b''
+
+        if size is not None:
+            flags |= Anvil.FLAG_SIZE
+            fields += struct.pack('<Q', size)
+
+        if dictionary is not None:
+            # the tables of a dictionary are for a single token format
+            if dictionary.token_format != token_format:
+                raise ValueError(
+                    'dictionary is trained for another lz77 token format'
+                )
+
+            flags |= Anvil.FLAG_DICTIONARY
+            fields += struct.pack('<I', dictionary.id)
+
+        if stages is not None:
+            stage_ids = Pipeline.stage_ids(stages)
+
+            flags |= Anvil.FLAG_STAGES
+            fields += bytes([len(stage_ids)] + stage_ids)
+
+        return Anvil.MAGIC + bytes([Anvil.VERSION, token_format, flags]) + \
+            fields
+
+    @staticmethod
+    def _decoded_size(bytes_, flags: int) -> Optional[int]:
+        # returns the decoded size from the header, None if it isn't given
+        if not flags & Anvil.FLAG_SIZE:
+            return None
+
+        if len(bytes_) < Anvil.HEADER_SIZE + Anvil.SIZE_FIELD:
+            raise ValueError('unexpected end of stream')
+
+        size, = struct.unpack_from('<Q', bytes_, Anvil.HEADER_SIZE)
+
+        return size
+
+    @staticmethod
+    def _dictionary_id(bytes_, flags: int) -> Optional[int]:
+        # returns the id of the dictionary from the header, None if the
+        # file doesn't use a dictionary
+        if not flags & Anvil.FLAG_DICTIONARY:
+            return None
+
+        index = Anvil.HEADER_SIZE
+
+        if flags & Anvil.FLAG_SIZE:
+            index += Anvil.SIZE_FIELD
+
+        if len(bytes_) < index + Anvil.DICTIONARY_FIELD:
+            raise ValueError('unexpected end of stream')
+
+        dictionary_id, = struct.unpack_from('<I', bytes_, index)
+
+        return dictionary_id
+
+    @staticmethod
+    def _stages(bytes_, flags: int) -> Optional[List[str]]:
+        # returns the names of the stages from the header, None if the
+        # blocks aren't coded with stages
+        if not flags & Anvil.FLAG_STAGES:
+            return None
+
+        index = Anvil.HEADER_SIZE
+
+        if flags & Anvil.FLAG_SIZE:
+            index += Anvil.SIZE_FIELD
+
+        if flags & Anvil.FLAG_DICTIONARY:
+            index += Anvil.DICTIONARY_FIELD
+
+        if len(bytes_) <= index or len(bytes_) <= index + bytes_[index]:
+            raise ValueError('unexpected end of stream')
+
+        return Pipeline.stage_names(
+            bytes_[index + 1:index + 1 + bytes_[index]]
+        )
+
+    @staticmethod
+    def _resolve_stages(stages: Union[Sequence[str], str], sample,
+                        min_speed: Optional[float],
+                        dictionary: Optional[Dictionary]) -> List[str]:
+        # returns the chain that the blocks are coded with, auto selects it
+        # by coding samples of the input
+        if dictionary is not None:
+            raise ValueError('dictionaries can\'t be used with stages')
+
+        if stages == 'auto':
+            return Pipeline.select(sample, min_speed)
+
+        stages = list(stages)
+        Pipeline.stage_ids(stages)
+
+        return stages
+
+    @staticmethod
+    def _check_dictionary(bytes_, flags: int,
+                          dictionary: Dictionary) -> Optional[Dictionary]:
+        # returns the dictionary that the file is decoded with, a file
+        # that doesn't use a dictionary ignores the given one
+        dictionary_id = Anvil._dictionary_id(bytes_, flags)
+
+        if dictionary_id is None:
+            return None
+
+        if dictionary is None or dictionary.id != dictionary_id:
+            raise ValueError(
+                f'anvil file needs the dictionary {dictionary_id:08x}'
+            )
+
+        return dictionary
+
+    @staticmethod
+    def _block_workers(workers: Optional[int], flags: int,
+                       dictionary: Optional[Dictionary]) -> Optional[int]:
+        # every independent block starts with the dictionary as its window
+        # instead of the block before it, so they are decoded one by one
+        # even if no workers are given
+        if workers is None and dictionary is not None and \
+                flags & Anvil.FLAG_INDEPENDENT:
+            return 1
+
+        return workers
+
+    @staticmethod
+    def _prime(dictionary: Dictionary, token_format: int) -> bytes:
+        # the window that the first block starts with
+        if dictionary is None:
+            return b''
+
+        return Lz77._prime(dictionary.content, token_format)
+
+    @staticmethod
+    def _parse_header(bytes_) -> Tuple[int, int, int, int]:
+        # returns the version, lz77 token format, flags and the size of the
+        # header
+        if bytes_[:len(Anvil.MAGIC)] != Anvil.MAGIC:
+            # files without a header are written with lz77 triples
+            return 1, Lz77.FORMAT_TRIPLE, 0, 0
+
+        # headers before version 3 don't have the flags byte
+        header_size = Anvil.HEADER_SIZE - 1
+
+        if len(bytes_) < header_size:
+            raise ValueError('unexpected end of stream')
+
+        version, token_format = bytes_[len(Anvil.MAGIC):header_size]
+
+        if version > Anvil.VERSION:
+            raise Exception(f'unsupported anvil version: {version}')
+
+        if version < 3:
+            return version, token_format, 0, header_size
+
+        if len(bytes_) < Anvil.HEADER_SIZE:
+            raise ValueError('unexpected end of stream')
+
+        flags = bytes_[header_size]
+        header_size = Anvil.HEADER_SIZE
+
+        if flags & Anvil.FLAG_SIZE:
+            header_size += Anvil.SIZE_FIELD
+
+        if flags & Anvil.FLAG_DICTIONARY:
+            header_size += Anvil.DICTIONARY_FIELD
+
+        if flags & Anvil.FLAG_STAGES:
+            if len(bytes_) <= header_size:
+                raise ValueError('unexpected end of stream')
+
+            header_size += 1 + bytes_[header_size]
+
+        return version, token_format, flags, header_size
+
+    @staticmethod
+    def encode_stream(source, token_format: int = Lz77.FORMAT_COMPACT,
+                      block_size: int = BLOCK_SIZE, workers: int = None,
+                      progress: Progress = None, level: int = None,
+                      dictionary: Dictionary = None,
+                      stats: Stats = None,
+                      stages: Union[Sequence[str], str] = None,
+                      min_speed: float = None,
+                      size: int = None) -> Iterator[bytes]:
+        # if the size of the source is given, like the size of a regular
+        # file, only that many bytes are read and the size is written to
+        # the header, so the bytes after them can be appended later
+        check_block_size(block_size)
+
+        if size is not None:
+            source = iter_sized(source, size)
+
+        if stages is not None:
+            # the first block is the sample of the auto mode
+            blocks = iter_blocks(source, block_size)
+            first = next(blocks, b'')
+
+            yield from Anvil._encode_stages(
+                chain([first], blocks) if first else blocks,
+                Anvil._resolve_stages(stages, first, min_speed, dictionary),
+                workers, progress, level, stats, size,
+            )
+            return
+
+        if workers is not None:
+            yield from Anvil._encode_independent(
+                iter_blocks(source, block_size), token_format, workers,
+                progress, level, size, dictionary, stats,
+            )
+            return
+
+        # header tells the decoder which token format the lz77 output
+        # was written in
+        yield Anvil._header(token_format, 0, size, dictionary)
+
+        yield from Anvil._stream_blocks(
+            source, token_format, block_size, progress, level, dictionary,
+            Anvil._prime(dictionary, token_format), stats,
+        )
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
     @staticmethod
-    def encode(file_path: str, save_path: str):
+    def _stream_blocks(source, token_format: int, block_size: int,
+                       progress: Optional[Progress], level: Optional[int],
+                       dictionary: Optional[Dictionary], window: bytes,
+                       stats: Stats = None) -> Iterator[bytes]:
+        # the lz77 window is kept between blocks, so only the window and
+        # the current block are in memory; the window starts with the given
+        # bytes, which the decoder must have before the blocks
+        encoder = Lz77Encoder(
+            token_format, progress=progress, level=level, dictionary=window
+        )
+
+        for block in iter_blocks(source, block_size):
+            start = encoder.offset + encoder.index
+
+            if stats is not None:
+                clock = stats.clock()
+
+            if Anvil._incompressible(block, stats):
+                # the bytes that are waiting for their lookahead are
+                # encoded before the stored block
+                try:
+                    encoded_bytes = encoder.store(block)
+                except Exception as e:
+                    raise Exception(f'error in lz77 encode: {e}')
+
+                if stats is not None:
+                    Anvil._count_lz77(
+                        stats, clock,
+                        encoder.offset + encoder.index - start - len(block),
+                        len(encoded_bytes), encoded_bytes, token_format,
+                    )
+
+                if encoded_bytes:
+                    yield Anvil._encode_progress(
+                        encoded_bytes, token_format, start, progress,
+                        dictionary, stats=stats,
+                    )
+
+                yield Anvil._store_progress(
+                    block, encoder.offset + encoder.index, progress, stats
+                )
+                continue
+
+            try:
+                encoded_bytes = encoder.encode(block)
+            except Exception as e:
+                raise Exception(f'error in lz77 encode: {e}')
+
+            if stats is not None:
+                stats.buffer('window', len(encoder.buffer))
+                Anvil._count_lz77(
+                    stats, clock, encoder.offset + encoder.index - start,
+                    len(encoded_bytes), encoded_bytes, token_format,
+                )
+
+            if encoded_bytes:
+                yield Anvil._encode_progress(
+                    encoded_bytes, token_format,
+                    encoder.offset + encoder.index, progress, dictionary,
+                    encoder.input_bytes(start), stats,
+                )
+
+        start = encoder.offset + encoder.index
+
+        if stats is not None:
+            clock = stats.clock()
+
         try:
-            Lz77.encode(file_path, save_path)
+            encoded_bytes = encoder.flush()
         except Exception as e:
             raise Exception(f'error in lz77 encode: {e}')
-        
+
+        if stats is not None:
+            Anvil._count_lz77(
+                stats, clock, encoder.offset + encoder.index - start,
+                len(encoded_bytes), encoded_bytes, token_format,
+            )
+
+        if encoded_bytes:
+            yield Anvil._encode_progress(
+                encoded_bytes, token_format,
+                encoder.offset + encoder.index, progress, dictionary,
+                encoder.input_bytes(start), stats,
+            )
+
+    @staticmethod
+    def _encode_independent(blocks: Iterable, token_format: int,
+                            workers: int, progress: Progress = None,
+                            level: int = None, size: int = None,
+                            dictionary: Dictionary = None,
+                            stats: Stats = None) -> Iterator[bytes]:
+        yield Anvil._header(
+            token_format, Anvil.FLAG_INDEPENDENT | Anvil.FLAG_INDEX, size,
+            dictionary,
+        )
+
+        encoded_sizes: List[int] = []
+        decoded_sizes: List[int] = []
+
+        yield from Anvil._independent_blocks(
+            blocks, token_format, workers, progress, level, dictionary,
+            encoded_sizes, decoded_sizes, stats,
+        )
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
+        yield Anvil._write_index(encoded_sizes, decoded_sizes)
+
+    @staticmethod
+    def _independent_blocks(blocks: Iterable, token_format: int,
+                            workers: int, progress: Optional[Progress],
+                            level: Optional[int],
+                            dictionary: Optional[Dictionary],
+                            encoded_sizes: List[int],
+                            decoded_sizes: List[int],
+                            stats: Stats = None) -> Iterator[bytes]:
+        # the sizes of the blocks are added to the given lists for the
+        # index; decoded sizes are saved while the blocks are given to the
+        # processes, results come in the same order
+        def sized_blocks():
+            for block in blocks:
+                decoded_sizes.append(len(block))
+                yield block
+
+        count = len(encoded_sizes)
+        done = 0
+
+        for encoded_block in Anvil._map_blocks(
+            partial(
+                Anvil._compress_block, token_format=token_format, level=level,
+                dictionary=dictionary,
+            ),
+            sized_blocks(), workers, stats,
+        ):
+            encoded_sizes.append(len(encoded_block))
+            yield encoded_block
+
+            if progress is not None:
+                done += decoded_sizes[count]
+                progress.update('encode', done)
+
+            count += 1
+
+    @staticmethod
+    def _encode_stages(blocks: Iterable, stages: List[str],
+                       workers: Optional[int], progress: Optional[Progress],
+                       level: Optional[int], stats: Optional[Stats],
+                       size: int = None) -> Iterator[bytes]:
+        # blocks of stages don't share a window, so they are encoded by
+        # many processes if workers are given
+        yield Anvil._header(Lz77.FORMAT_COMPACT, 0, size, stages=stages)
+
+        decoded_sizes: List[int] = []
+
+        def sized_blocks():
+            for block in blocks:
+                decoded_sizes.append(len(block))
+                yield block
+
+        done = 0
+
+        for i, encoded_block in enumerate(Anvil._map_blocks(
+            partial(Anvil._compress_stages, stages=stages, level=level),
+            sized_blocks(), 1 if workers is None else workers, stats,
+        )):
+            yield encoded_block
+
+            if progress is not None:
+                done += decoded_sizes[i]
+                progress.update('encode', done)
+
+        # a block of size 0 is the end sign of the blocks
+        yield b'\x00'
+
+    @staticmethod
+    def _compress_stages(block, stages: List[str], level: int = None,
+                         stats: Stats = None) -> bytes:
+        if Anvil._incompressible(block, stats):
+            return Anvil._stored_block(block, stats)
+
+        encoded_bytes = Pipeline.compress(bytes(block), stages, level, stats)
+
+        if len(encoded_bytes) >= len(block):
+            return Anvil._stored_block(block, stats)
+
+        encoded_block = bytearray()
+        write_varint(encoded_block, len(encoded_bytes) + 1)
+        encoded_block.append(Anvil.BLOCK_STAGES)
+        encoded_block += encoded_bytes
+
+        if stats is not None:
+            stats.count_block('stages', len(encoded_bytes) + 1)
+            stats.buffer('block', len(encoded_bytes) + 1)
+
+        return bytes(encoded_block)
+
+    @staticmethod
+    def _decode_stages(blocks: Iterable, stages: List[str],
+                       workers: Optional[int],
+                       stats: Optional[Stats]) -> Iterator[bytes]:
+        return Anvil._map_blocks(
+            partial(Anvil._decompress_stages, stages=stages),
+            blocks, 1 if workers is None else workers, stats,
+        )
+
+    @staticmethod
+    def _decompress_stages(block, stages: List[str],
+                           stats: Stats = None) -> bytes:
+        if stats is not None:
+            stats.count_block(
+                Anvil.BLOCK_NAMES.get(block[0], 'unknown'), len(block)
+            )
+
+        if block[0] == Anvil.BLOCK_STORED:
+            return bytes(block[1:])
+
+        if block[0] != Anvil.BLOCK_STAGES:
+            raise ValueError(f'unknown block type: {block[0]}')
+
+        return Pipeline.decompress(bytes(block[1:]), stages, stats)
+
+    @staticmethod
+    def _write_index(encoded_sizes: List[int],
+                     decoded_sizes: List[int]) -> bytes:
+        # index is the number of blocks and the encoded and decoded size of
+        # every block, followed by the footer
+        index = bytearray()
+        write_varint(index, len(encoded_sizes))
+
+        for encoded_size, decoded_size in zip(encoded_sizes, decoded_sizes):
+            write_varint(index, encoded_size)
+            write_varint(index, decoded_size)
+
+        index += struct.pack('<I', len(index)) + Anvil.INDEX_MAGIC
+
+        return bytes(index)
+
+    @staticmethod
+    def _read_index(file) -> Tuple[int, List[int], List[int]]:
+        # returns the token format, the offsets of the blocks in the file
+        # and the offsets of the blocks in the decoded bytes, both with the
+        # end offset as the last item
+        version, token_format, flags, header_size = Anvil._parse_header(
+            file.read(Anvil.MAX_HEADER_SIZE)
+        )
+
+        if not flags & Anvil.FLAG_INDEX:
+            raise Exception('anvil file has no block index')
+
+        file.seek(-Anvil.FOOTER_SIZE, os.SEEK_END)
+        footer = file.read(Anvil.FOOTER_SIZE)
+
+        if footer[4:] != Anvil.INDEX_MAGIC:
+            raise ValueError('invalid anvil block index')
+
+        index_size, = struct.unpack('<I', footer[:4])
+
+        file.seek(-Anvil.FOOTER_SIZE - index_size, os.SEEK_END)
+        index = file.read(index_size)
+
+        count, i = read_varint(index, 0)
+
+        encoded_offsets = [header_size]
+        decoded_offsets = [0]
+
+        for _ in range(count):
+            encoded_size, i = read_varint(index, i)
+            decoded_size, i = read_varint(index, i)
+
+            encoded_offsets.append(encoded_offsets[-1] + encoded_size)
+            decoded_offsets.append(decoded_offsets[-1] + decoded_size)
+
+        return token_format, encoded_offsets, decoded_offsets
+
+    @staticmethod
+    def _encode_progress(bytes_, token_format: int, done: int,
+                         progress: Progress, dictionary: Dictionary = None,
+                         raw_bytes=None, stats: Stats = None) -> bytes:
+        # encodes the lz77 output of a block and reports both stages
+        if progress is None:
+            return Anvil._encode_block(
+                bytes_, token_format, dictionary, raw_bytes, stats
+            )
+
+        progress.update('lz77', done)
+        encoded_bytes = Anvil._encode_block(
+            bytes_, token_format, dictionary, raw_bytes, stats
+        )
+        progress.update('entropy', done)
+
+        return encoded_bytes
+
+    @staticmethod
+    def _store_progress(bytes_, done: int, progress: Progress,
+                        stats: Stats = None) -> bytes:
+        block = Anvil._stored_block(bytes_, stats)
+
+        if progress is not None:
+            progress.update('store', done)
+
+        return block
+
+    @staticmethod
+    def _stored_block(bytes_, stats: Stats = None) -> bytes:
+        if stats is not None:
+            clock = stats.clock()
+
+        block = bytearray()
+        write_varint(block, len(bytes_) + 1)
+        block.append(Anvil.BLOCK_STORED)
+        block += bytes_
+
+        if stats is not None:
+            stats.add('store', clock, len(bytes_), len(block))
+            stats.count_block('stored', len(bytes_) + 1)
+
+        return bytes(block)
+
+    @staticmethod
+    def _count_lz77(stats: Stats, clock: float, bytes_in: int,
+                    bytes_out: int, tokens, token_format: int):
+        # the time and the tokens of an lz77 stage, the tokens are counted
+        # after the stage, so it isn't slowed down by the stats
+        stats.add('lz77', clock, bytes_in, bytes_out)
+        stats.count_tokens(tokens, token_format)
+        stats.buffer('tokens', len(tokens))
+
+    @staticmethod
+    def _incompressible(bytes_, stats: Stats = None) -> bool:
+        # compressed and random bytes have an even distribution of bytes
+        # and no repeated strings, only samples of the block are read so
+        # the probe costs little next to lz77; repeats that are farther
+        # apart than a sample aren't seen, blocks that lz77 can't make
+        # smaller are stored by `_encode_block` anyway
+        if stats is not None:
+            clock = stats.clock()
+
+        step = len(bytes_) // Anvil.PROBE_COUNT
+
+        if step < Anvil.PROBE_SIZE:
+            samples = [bytes(bytes_)]
+        else:
+            samples = [
+                bytes(bytes_[i * step:i * step + Anvil.PROBE_SIZE])
+                for i in range(Anvil.PROBE_COUNT)
+            ]
+
+        counts = Counter()
+
+        for sample in samples:
+            counts.update(sample)
+
+        size = sum(counts.values())
+        incompressible = False
+
+        if size:
+            entropy = -sum(
+                count / size * math.log2(count / size)
+                for count in counts.values()
+            )
+
+            incompressible = entropy >= Anvil.PROBE_ENTROPY
+
+        if incompressible:
+            # the 4 byte strings that are in a sample more than once
+            grams = 0
+            repeats = 0
+
+            for sample in samples:
+                sample_grams = {
+                    sample[i:i + 4] for i in range(len(sample) - 3)
+                }
+                grams += max(0, len(sample) - 3)
+                repeats += max(0, len(sample) - 3) - len(sample_grams)
+
+            incompressible = repeats <= grams * Anvil.PROBE_REPEATS
+
+        if stats is not None:
+            stats.add('probe', clock, size)
+
+        return incompressible
+
+    @staticmethod
+    def _encode_block(bytes_, token_format: int,
+                      dictionary: Dictionary = None, raw_bytes=None,
+                      stats: Stats = None) -> bytes:
+        # the size of every coding of the block is computed from its
+        # frequencies and code lengths, only the smallest one is packed;
+        # raw bytes are the input bytes of the block, the block is stored
+        # if its coded bytes aren't smaller than them
         try:
-            Huffman.encode(save_path, save_path)
+            freqs, lengths = Huffman._build([bytes_], len(bytes_), stats)
         except Exception as e:
             raise Exception(f'error in huffman encode: {e}')
-    
+
+        try:
+            tokens, freqs_list, lengths_list = Entropy._build(
+                bytes_, token_format, stats
+            )
+        except Exception as e:
+            raise Exception(f'error in entropy encode: {e}')
+
+        block_type = Anvil.BLOCK_HUFFMAN
+        size = Huffman._coded_size(freqs, lengths)
+
+        # a table for every token field is smaller unless the block is
+        # too small for the size of the tables
+        tables_size = Entropy._coded_size(
+            token_format, freqs_list, lengths_list, False
+        ) + 1
+
+        if tables_size < size:
+            block_type = Anvil.BLOCK_TABLES
+            size = tables_size
+
+        # the tables of a dictionary aren't written, so they are usually
+        # the smallest for the small blocks they are trained for
+        if dictionary is not None:
+            if stats is not None:
+                Entropy._count_codes(
+                    stats, 'entropy.preset', freqs_list,
+                    dictionary.lengths_list,
+                )
+
+            tables_size = Entropy._coded_size(
+                token_format, freqs_list, dictionary.lengths_list, True
+            ) + 1
+
+            if tables_size < size:
+                block_type = Anvil.BLOCK_DICTIONARY
+                size = tables_size
+
+        if raw_bytes is not None and len(raw_bytes) < size:
+            return Anvil._stored_block(raw_bytes, stats)
+
+        if block_type == Anvil.BLOCK_HUFFMAN:
+            try:
+                encoded_bytes = Huffman._pack(
+                    [bytes_], lengths, len(bytes_), stats=stats
+                )
+            except Exception as e:
+                raise Exception(f'error in huffman encode: {e}')
+        else:
+            if block_type == Anvil.BLOCK_DICTIONARY:
+                lengths_list = dictionary.lengths_list
+
+            try:
+                encoded_bytes = bytes([block_type]) + Entropy._pack(
+                    bytes_, token_format, tokens, lengths_list,
+                    block_type == Anvil.BLOCK_DICTIONARY, stats,
+                )
+            except Exception as e:
+                raise Exception(f'error in entropy encode: {e}')
+
+        # every block starts with the size of its entropy output
+        block = bytearray()
+        write_varint(block, len(encoded_bytes))
+        block += encoded_bytes
+
+        if stats is not None:
+            stats.count_block(
+                Anvil.BLOCK_NAMES[encoded_bytes[0]], len(encoded_bytes)
+            )
+            stats.buffer('block', len(encoded_bytes))
+
+        return bytes(block)
+
     @staticmethod
-    def decode(file_path: str, save_path: str):
+    def _decode_entropy(block, token_format: int,
+                        dictionary: Dictionary = None,
+                        stats: Stats = None) -> bytes:
+        # returns the lz77 output of a block
+        if stats is not None:
+            stats.count_block(Anvil.BLOCK_NAMES[block[0]], len(block))
+            stats.buffer('block', len(block))
+
+        if block[0] == Anvil.BLOCK_TABLES:
+            try:
+                return Entropy.decompress(
+                    block[1:], token_format, stats=stats
+                )
+            except Exception as e:
+                raise Exception(f'error in entropy decode: {e}')
+
+        if block[0] == Anvil.BLOCK_DICTIONARY:
+            if dictionary is None:
+                raise ValueError('block is coded with a dictionary')
+
+            try:
+                return Entropy.decompress(
+                    block[1:], token_format, dictionary.lengths_list, stats
+                )
+            except Exception as e:
+                raise Exception(f'error in entropy decode: {e}')
+
         try:
-            Huffman.decode(file_path, save_path)
+            return Huffman.decompress(block, stats=stats)
         except Exception as e:
             raise Exception(f'error in huffman decode: {e}')
-        
+
+    @staticmethod
+    def _decode_tokens(tokens, decoded_bytes: bytearray, token_format: int):
         try:
-            Lz77.decode(save_path, save_path)
+            used = Lz77._decode_into(tokens, decoded_bytes, token_format)
+
+            if used != len(tokens):
+                raise ValueError('block ends in the middle of a token')
         except Exception as e:
             raise Exception(f'error in lz77 decode: {e}')
+
+    @staticmethod
+    def _decode_block(block, decoded_bytes: bytearray, token_format: int,
+                      progress: Progress = None, done: int = 0,
+                      dictionary: Dictionary = None, stats: Stats = None):
+        # done is the progress that is reported after every stage
+        if block[0] == Anvil.BLOCK_STORED:
+            if stats is not None:
+                clock = stats.clock()
+
+            decoded_bytes += block[1:]
+
+            if stats is not None:
+                stats.add('store', clock, len(block), len(block) - 1)
+                stats.count_block('stored', len(block))
+
+            if progress is not None:
+                progress.update('store', done)
+            return
+
+        tokens = Anvil._decode_entropy(block, token_format, dictionary, stats)
+
+        if progress is not None:
+            progress.update('entropy', done)
+
+        if stats is not None:
+            clock = stats.clock()
+            size = len(decoded_bytes)
+
+        Anvil._decode_tokens(tokens, decoded_bytes, token_format)
+
+        if stats is not None:
+            Anvil._count_lz77(
+                stats, clock, len(tokens), len(decoded_bytes) - size, tokens,
+                token_format,
+            )
+
+        if progress is not None:
+            progress.update('lz77', done)
+
+    @staticmethod
+    def _compress_block(block, token_format: int, level: int = None,
+                        dictionary: Dictionary = None,
+                        stats: Stats = None) -> bytes:
+        # independent blocks are encoded without the bytes before them, but
+        # every block starts with the dictionary as its window
+        prime = Anvil._prime(dictionary, token_format)
+
+        if Anvil._incompressible(block, stats):
+            return Anvil._stored_block(block, stats)
+
+        raw_bytes = block
+
+        if prime:
+            block = prime + bytes(block)
+
+        if stats is not None:
+            clock = stats.clock()
+
+        try:
+            tokens, _ = Lz77._encode_range(
+                block, len(prime), len(block), token_format,
+                offset=-len(prime), level=level, primed=len(prime),
+            )
+        except Exception as e:
+            raise Exception(f'error in lz77 encode: {e}')
+
+        if stats is not None:
+            Anvil._count_lz77(
+                stats, clock, len(raw_bytes), len(tokens), tokens,
+                token_format,
+            )
+
+        return Anvil._encode_block(
+            tokens, token_format, dictionary, raw_bytes, stats
+        )
+
+    @staticmethod
+    def _decompress_block(block, token_format: int,
+                          dictionary: Dictionary = None,
+                          stats: Stats = None) -> bytes:
+        prime = Anvil._prime(dictionary, token_format)
+
+        decoded_bytes = bytearray(prime)
+        Anvil._decode_block(
+            block, decoded_bytes, token_format, dictionary=dictionary,
+            stats=stats,
+        )
+
+        return bytes(decoded_bytes[len(prime):])
+
+    @staticmethod
+    def _map_blocks(function: Callable, blocks: Iterable, workers: int,
+                    stats: Stats = None) -> Iterator:
+        # calls the function for every block with the given number of
+        # processes and yields the results in the order of the blocks
+        if stats is None:
+            yield from Anvil._map_processes(function, blocks, workers)
+            return
+
+        # every block is measured with its own stats in its process, they
+        # are added to the stats of the operation, so the time of a stage
+        # is the sum of its time in every process
+        for result, block_stats in Anvil._map_processes(
+            partial(Anvil._with_stats, function), blocks, workers
+        ):
+            stats.merge(block_stats)
+            yield result
+
+    @staticmethod
+    def _with_stats(function: Callable, block) -> Tuple[object, Stats]:
+        stats = Stats()
+
+        return function(block, stats=stats), stats
+
+    @staticmethod
+    def _map_processes(function: Callable, blocks: Iterable,
+                       workers: int) -> Iterator:
+        if workers == 0:
+            workers = os.cpu_count() or 1
+
+        if workers == 1:
+            for block in blocks:
+                yield function(block)
+            return
+
+        # process pool is only imported when it's used, so the command line
+        # starts fast
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as executor:
+            futures = deque()
+
+            try:
+                for block in blocks:
+                    # blocks are copied to the processes, so only 2 blocks
+                    # per process are waiting and memory doesn't grow with
+                    # the input
+                    futures.append(executor.submit(function, bytes(block)))
+
+                    if len(futures) >= 2 * workers:
+                        yield futures.popleft().result()
+
+                while futures:
+                    yield futures.popleft().result()
+            except BaseException:
+                # waiting blocks aren't processed if the operation fails or
+                # is cancelled
+                executor.shutdown(cancel_futures=True)
+                raise
+
+    @staticmethod
+    def decode_stream(source, workers: int = None, progress: Progress = None,
+                      dictionary: Dictionary = None,
+                      stats: Stats = None) -> Iterator[bytes]:
+        reader = ChunkReader(source)
+
+        version, token_format, flags, header_size = Anvil._parse_header(
+            reader.peek(Anvil.MAX_HEADER_SIZE)
+        )
+        header = reader.read(header_size)
+        dictionary = Anvil._check_dictionary(header, flags, dictionary)
+
+        if flags & Anvil.FLAG_STAGES:
+            for decoded_bytes in Anvil._decode_stages(
+                Anvil._read_blocks(reader), Anvil._stages(header, flags),
+                workers, stats,
+            ):
+                yield decoded_bytes
+
+                if progress is not None:
+                    progress.update('decode', reader.position)
+            return
+
+        # independent blocks can be decoded by separate processes
+        workers = Anvil._block_workers(workers, flags, dictionary)
+
+        if workers is not None and flags & Anvil.FLAG_INDEPENDENT:
+            for decoded_bytes in Anvil._map_blocks(
+                partial(
+                    Anvil._decompress_block, token_format=token_format,
+                    dictionary=dictionary,
+                ),
+                Anvil._read_blocks(reader), workers, stats,
+            ):
+                yield decoded_bytes
+
+                # blocks are read before they are decoded, so the progress
+                # is ahead by the blocks that are waiting
+                if progress is not None:
+                    progress.update('decode', reader.position)
+            return
+
+        if version == 1:
+            blocks = Anvil._huffman_stream(reader)
+        else:
+            blocks = Anvil._entropy_blocks(
+                reader, token_format, progress, dictionary, stats
+            )
+
+        decoder = Lz77Decoder(
+            token_format, dictionary and dictionary.content
+        )
+
+        for stored, bytes_ in blocks:
+            if stats is not None:
+                clock = stats.clock()
+
+            try:
+                if stored:
+                    decoded_bytes = decoder.append(bytes_)
+                else:
+                    decoded_bytes = decoder.decode(bytes_)
+            except Exception as e:
+                raise Exception(f'error in lz77 decode: {e}')
+
+            if stats is not None:
+                # the decoder gives the bytes that leave its window, so the
+                # output of a stage is counted as its input
+                stats.buffer('window', len(decoder.window))
+
+                if stored:
+                    stats.add('store', clock, len(bytes_), len(bytes_))
+                else:
+                    Anvil._count_lz77(
+                        stats, clock, len(bytes_), len(decoded_bytes),
+                        bytes_, token_format,
+                    )
+
+            if progress is not None:
+                progress.update('lz77', reader.position)
+
+            if decoded_bytes:
+                yield decoded_bytes
+
+        try:
+            decoded_bytes = decoder.flush()
+        except Exception as e:
+            raise Exception(f'error in lz77 decode: {e}')
+
+        if decoded_bytes:
+            yield decoded_bytes
+
+    @staticmethod
+    def _split_blocks(bytes_, index: int) -> List[memoryview]:
+        blocks: List[memoryview] = []
+
+        while True:
+            size, index = read_varint(bytes_, index)
+
+            # a block of size 0 is the end sign of the blocks
+            if size == 0:
+                return blocks
+
+            if index + size > len(bytes_):
+                raise ValueError('unexpected end of stream')
+
+            blocks.append(bytes_[index:index + size])
+            index += size
+
+    @staticmethod
+    def _read_blocks(reader: ChunkReader) -> Iterator[bytes]:
+        while True:
+            size = reader.read_varint()
+
+            # a block of size 0 is the end sign of the blocks
+            if size == 0:
+                return
+
+            yield reader.read_exact(size)
+
+    @staticmethod
+    def _huffman_stream(reader: ChunkReader) -> Iterator[Tuple[bool, bytes]]:
+        try:
+            for bytes_ in Huffman.decode_stream(reader):
+                yield False, bytes_
+        except Exception as e:
+            raise Exception(f'error in huffman decode: {e}')
+
+    @staticmethod
+    def _entropy_blocks(reader: ChunkReader, token_format: int,
+                        progress: Progress = None,
+                        dictionary: Dictionary = None,
+                        stats: Stats = None
+                        ) -> Iterator[Tuple[bool, bytes]]:
+        # yields the lz77 output of the blocks, or the decoded bytes of the
+        # stored blocks, with whether the block is stored
+        for encoded_bytes in Anvil._read_blocks(reader):
+            if encoded_bytes[0] == Anvil.BLOCK_STORED:
+                if stats is not None:
+                    stats.count_block('stored', len(encoded_bytes))
+
+                yield True, encoded_bytes[1:]
+                continue
+
+            tokens = Anvil._decode_entropy(
+                encoded_bytes, token_format, dictionary, stats
+            )
+
+            if progress is not None:
+                progress.update('entropy', reader.position)
+
+            yield False, tokens
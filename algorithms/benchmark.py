@@ -0,0 +1,231 @@
+import argparse
+import json
+import lzma
+import os
+import platform
+import random
+import time
+import tracemalloc
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+from .anvil import Anvil
+from .huffman import Huffman
+from .lz77 import Lz77
+
+
+# corpus sizes measured by default, small enough to run in a few minutes
+SIZES = (16 << 10, 256 << 10)
+
+# every measurement is repeated and the fastest run is reported
+REPEAT = 3
+
+# corpora are generated from this seed, so every run measures the same bytes
+SEED = 0
+
+_WORDS = (
+    'the of and to in is that it was for on are as with his they at be '
+    'this from have or by one had not but what all were when we there can '
+    'an your which their said if do will each about how up out them then '
+    'she many some so these would other into has more her two like him '
+    'see time could no make than first been its who now people my made '
+    'over did down only way find use may water long little very after '
+    'words called just where most know compression block window stream'
+).split()
+
+_LEVELS = ('DEBUG', 'INFO', 'INFO', 'INFO', 'WARNING', 'ERROR')
+
+_MESSAGES = (
+    'request {id} served in {ms} ms',
+    'user {id} logged in from 10.0.{a}.{b}',
+    'cache miss for key session:{id}',
+    'retrying job {id} after {ms} ms',
+    'connection {id} closed by peer',
+)
+
+
+def _text_corpus(rng: random.Random, size: int) -> bytes:
+    # words are picked with a zipf like distribution, so common words
+    # repeat like they do in natural language
+    weights = [1 / (rank + 1) for rank in range(len(_WORDS))]
+    parts = []
+    length = 0
+
+    while length < size:
+        words = rng.choices(_WORDS, weights, k=rng.randint(5, 20))
+        sentence = ' '.join(words).capitalize() + '. '
+        parts.append(sentence)
+        length += len(sentence)
+
+    return ''.join(parts).encode()[:size]
+
+
+def _log_corpus(rng: random.Random, size: int) -> bytes:
+    parts = []
+    length = 0
+    timestamp = 1_600_000_000
+
+    while length < size:
+        timestamp += rng.randint(0, 3)
+        message = rng.choice(_MESSAGES).format(
+            id=rng.randint(1000, 9999), ms=rng.randint(1, 500),
+            a=rng.randint(0, 255), b=rng.randint(0, 255),
+        )
+        line = '{} {:<7} worker-{} {}\n'.format(
+            time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)),
+            rng.choice(_LEVELS), rng.randint(1, 8), message,
+        )
+        parts.append(line)
+        length += len(line)
+
+    return ''.join(parts).encode()[:size]
+
+
+def _json_corpus(rng: random.Random, size: int) -> bytes:
+    records = []
+    length = 0
+
+    while length < size:
+        record = json.dumps({
+            'id': rng.randint(0, 1 << 32),
+            'name': ' '.join(rng.choices(_WORDS, k=2)),
+            'active': rng.random() < 0.5,
+            'score': round(rng.uniform(0, 100), 2),
+            'tags': rng.sample(_WORDS, rng.randint(0, 4)),
+        })
+        records.append(record)
+        length += len(record) + 2
+
+    return ('[' + ',\n'.join(records) + ']').encode()[:size]
+
+
+def _random_corpus(rng: random.Random, size: int) -> bytes:
+    return rng.randbytes(size)
+
+
+CORPORA: Dict[str, Callable[[random.Random, int], bytes]] = {
+    'logs': _log_corpus,
+    'text': _text_corpus,
+    'json': _json_corpus,
+    'random': _random_corpus,
+}
+
+
+def make_corpus(kind: str, size: int, seed: int = SEED) -> bytes:
+    # the same kind, size and seed always give the same bytes
+    return CORPORA[kind](random.Random(f'{kind}-{size}-{seed}'), size)
+
+
+# every codec is a pair of compress and decompress functions, lz77 and
+# huffman are the stages of the anvil pipeline, zlib and lzma are baselines
+CODECS: Dict[str, Tuple[Callable, Callable]] = {
+    'lz77': (
+        lambda bytes_: Lz77.compress(bytes_, Lz77.FORMAT_COMPACT),
+        lambda bytes_: Lz77.decompress(bytes_, Lz77.FORMAT_COMPACT),
+    ),
+    'huffman': (Huffman.compress, Huffman.decompress),
+    'anvil': (Anvil.compress, Anvil.decompress),
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def _measure(function: Callable, bytes_, repeat: int) -> Tuple[float, int]:
+    # returns the fastest time of the runs and the peak memory allocated
+    # by python, memory is traced in a separate run since tracing slows
+    # down the function
+    seconds = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(bytes_)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(bytes_)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def _mb_per_second(size: int, seconds: float) -> float:
+    return round(size / (1 << 20) / seconds, 3) if seconds else 0.0
+
+
+def run(codecs: List[str] = None, corpora: List[str] = None,
+        sizes: List[int] = SIZES, repeat: int = REPEAT,
+        seed: int = SEED) -> dict:
+    codecs = codecs or list(CODECS)
+    corpora = corpora or list(CORPORA)
+
+    results = []
+
+    for kind in corpora:
+        for size in sizes:
+            bytes_ = make_corpus(kind, size, seed)
+
+            for name in codecs:
+                compress, decompress = CODECS[name]
+                encoded_bytes = compress(bytes_)
+
+                if decompress(encoded_bytes) != bytes_:
+                    raise Exception(f'{name} round trip failed on {kind}')
+
+                encode_time, encode_peak = _measure(compress, bytes_, repeat)
+                decode_time, decode_peak = _measure(
+                    decompress, encoded_bytes, repeat
+                )
+
+                # speeds are in uncompressed bytes per second for both ways
+                results.append({
+                    'codec': name,
+                    'corpus': kind,
+                    'size': size,
+                    'compressed_size': len(encoded_bytes),
+                    'ratio': round(size / len(encoded_bytes), 3),
+                    'encode_mb_s': _mb_per_second(size, encode_time),
+                    'decode_mb_s': _mb_per_second(size, decode_time),
+                    'encode_peak_memory': encode_peak,
+                    'decode_peak_memory': decode_peak,
+                })
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(
+        prog='benchmark',
+        description='measure anvil stages and baselines on synthetic corpora',
+    )
+    parser.add_argument('-o', '--output', help='json file to write, '
+                        'results are printed if not given')
+    parser.add_argument('--codecs', nargs='+', choices=list(CODECS))
+    parser.add_argument('--corpora', nargs='+', choices=list(CORPORA))
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args(args)
+
+    report = json.dumps(run(
+        args.codecs, args.corpora, args.sizes, args.repeat, args.seed
+    ), indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from typing import List
+
+from .stream import byte_view
+from .varint import read_varint, write_varint
+
+
+class Bwt:
+    def __new__(cls): pass
+
+    # the input is transformed in blocks of this size, sorting the
+    # rotations of a block takes most of the time and grows faster than
+    # its size
+    BLOCK_SIZE = 1 << 16
+
+    # rotations are first sorted by this many bytes, the sort of the bytes
+    # runs in c, so only the rotations with longer common prefixes need
+    # the rounds in python
+    PREFIX_SIZE = 32
+
+    @staticmethod
+    def compress(bytes_) -> bytes:
+        # every block is its size, the row of its first rotation and the
+        # last bytes of its sorted rotations
+        bytes_ = byte_view(bytes_)
+        encoded_bytes = bytearray()
+
+        for start in range(0, len(bytes_), Bwt.BLOCK_SIZE):
+            block = bytes(bytes_[start:start + Bwt.BLOCK_SIZE])
+            order = Bwt._sort_rotations(block)
+
+            write_varint(encoded_bytes, len(block))
+            write_varint(encoded_bytes, order.index(0))
+
+            # the byte before every rotation, the first rotation is
+            # preceded by the last byte
+            encoded_bytes += bytes(block[i - 1] for i in order)
+
+        return bytes(encoded_bytes)
+
+    @staticmethod
+    def decompress(bytes_) -> bytes:
+        decoded_bytes = bytearray()
+        index = 0
+
+        try:
+            while index < len(bytes_):
+                size, index = read_varint(bytes_, index)
+                primary, index = read_varint(bytes_, index)
+
+                if index + size > len(bytes_) or primary >= max(size, 1):
+                    raise ValueError('invalid bwt block')
+
+                decoded_bytes += Bwt._invert(
+                    bytes_[index:index + size], primary
+                )
+                index += size
+        except IndexError:
+            raise ValueError('unexpected end of stream')
+
+        return bytes(decoded_bytes)
+
+    @staticmethod
+    def _sort_rotations(block: bytes) -> List[int]:
+        # returns the start of every rotation in sorted order, the ranks
+        # of the rotations are doubled in length every round until they
+        # are all different
+        size = len(block)
+        width = min(Bwt.PREFIX_SIZE, size)
+
+        doubled = block + block[:width]
+        prefixes = [doubled[i:i + width] for i in range(size)]
+        order = sorted(range(size), key=prefixes.__getitem__)
+
+        ranks = [0] * size
+        rank = 0
+        last = None
+
+        for i in order:
+            if prefixes[i] != last:
+                rank += 1
+                last = prefixes[i]
+
+            ranks[i] = rank
+
+        # rotations of a repeated string are equal however long they are
+        # compared, their order doesn't change the output
+        while rank < size and width < size:
+            next_ranks = ranks[width:] + ranks[:width]
+            keys = [
+                rank_ * (rank + 1) + next_rank
+                for rank_, next_rank in zip(ranks, next_ranks)
+            ]
+            order.sort(key=keys.__getitem__)
+
+            rank = 0
+            last = -1
+
+            for i in order:
+                if keys[i] != last:
+                    rank += 1
+                    last = keys[i]
+
+                ranks[i] = rank
+
+            width *= 2
+
+        return order
+
+    @staticmethod
+    def _invert(last_bytes, primary: int) -> bytes:
+        # the i-th occurrence of a byte in the last bytes is the i-th
+        # rotation that starts with it, so the rotations are walked from
+        # the first one backwards
+        starts = [0] * 256
+        start = 0
+
+        for byte in range(256):
+            starts[byte] = start
+            start += last_bytes.count(byte)
+
+        previous = [0] * len(last_bytes)
+
+        for i, byte in enumerate(last_bytes):
+            previous[i] = starts[byte]
+            starts[byte] += 1
+
+        decoded_bytes = bytearray(len(last_bytes))
+        row = primary
+
+        for i in range(len(last_bytes) - 1, -1, -1):
+            decoded_bytes[i] = last_bytes[row]
+            row = previous[row]
+
+        return bytes(decoded_bytes)
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import shutil
+from typing import Optional
+
+from .stream import iter_chunks, write_stream
+
+
+# max total size of the cached outputs
+CACHE_SIZE = 1 << 30
+
+# size of the content hash in bytes
+DIGEST_SIZE = 16
+
+
+class ResultCache:
+    # outputs are saved in a directory by the hash of their input and the
+    # parameters of the encoder, so an input that didn't change since the
+    # last run is only hashed instead of compressed again
+    EXTENSION = '.anvil'
+
+    # entries are linked to the outputs, so their times are the times of
+    # the outputs too; the last use of an entry is the modification time
+    # of an empty file with this extension next to it
+    USED_EXTENSION = '.used'
+
+    # a full cache is evicted to this part of its max size, so the stores
+    # after an eviction don't scan the directory again until they fill
+    # the space that it freed
+    EVICT_TARGET = 0.9
+
+    def __init__(self, directory: str, max_size: int = CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+        # total size of the entries, the directory is scanned for it by
+        # the first store and the stores after it add their sizes, so it
+        # is only scanned again when the cache is over its max size;
+        # entries stored by other processes are seen at that scan
+        self.total_size: Optional[int] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, parameters: tuple) -> str:
+        # blake2b is faster than reading most files, the parameters are
+        # hashed first so a change in any of them gives another key
+        hash_ = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        hash_.update(repr(parameters).encode())
+
+        for chunk in iter_chunks(source):
+            hash_.update(chunk)
+
+        return hash_.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ResultCache.EXTENSION)
+
+    @staticmethod
+    def _used_path(path: str) -> str:
+        return path[:-len(ResultCache.EXTENSION)] + ResultCache.USED_EXTENSION
+
+    def _touch(self, path: str) -> bool:
+        # marks the entry as used now, False if it isn't in the cache
+        if not os.path.exists(path):
+            return False
+
+        used_path = ResultCache._used_path(path)
+
+        try:
+            os.utime(used_path)
+        except FileNotFoundError:
+            open(used_path, 'wb').close()
+
+        return True
+
+    def load(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+
+        if not self._touch(path):
+            return None
+
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            # evicted by another process after it was touched
+            return None
+
+    def link(self, key: str, save_path: str) -> bool:
+        # the cached output is linked to the save path, it is copied if the
+        # save path is on another file system; outputs are always replaced
+        # and never written in place, so the entry doesn't change through
+        # the link
+        path = self._path(key)
+
+        if not self._touch(path):
+            return False
+
+        temp_path = save_path + '.tmp'
+
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        try:
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+        except FileNotFoundError:
+            return False
+
+        os.replace(temp_path, save_path)
+
+        return True
+
+    def store(self, key: str, file_path: str):
+        # the output is linked to the cache like `link`, a temporary path is
+        # used so a reader never sees a half written entry
+        path = self._path(key)
+        temp_path = path + '.tmp'
+
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        try:
+            os.link(file_path, temp_path)
+        except OSError:
+            shutil.copyfile(file_path, temp_path)
+
+        os.replace(temp_path, path)
+        self._touch(path)
+        self._add(path)
+
+    def store_bytes(self, key: str, bytes_):
+        path = self._path(key)
+
+        write_stream([bytes_], path)
+        self._touch(path)
+        self._add(path)
+
+    def _add(self, path: str):
+        # counts a stored entry, an entry that replaced another one with
+        # the same key is counted twice until the next scan
+        if self.total_size is None:
+            self.total_size = self.size()
+        else:
+            try:
+                self.total_size += os.path.getsize(path)
+            except FileNotFoundError:
+                return
+
+        if self.total_size > self.max_size:
+            self._evict()
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self) -> list:
+        # entries as (last use time, size, path), an entry without a used
+        # file was last used when it was written
+        entries = []
+        used_times = {}
+
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(ResultCache.USED_EXTENSION):
+                    try:
+                        used_times[entry.path] = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        pass
+                    continue
+
+                if not entry.name.endswith(ResultCache.EXTENSION):
+                    continue
+
+                try:
+                    info = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                entries.append((info.st_mtime, info.st_size, entry.path))
+
+        return [
+            (
+                used_times.get(ResultCache._used_path(path), mtime),
+                size, path,
+            )
+            for mtime, size, path in entries
+        ]
+
+    @staticmethod
+    def _remove(path: str):
+        # removes an entry and its used file
+        for path_ in (path, ResultCache._used_path(path)):
+            try:
+                os.remove(path_)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        # the least recently used entries are removed until the cache fits
+        # in its max size, a cache over its max size is evicted to the
+        # target
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+
+        if size <= self.max_size:
+            self.total_size = size
+            return
+
+        for _, entry_size, path in entries:
+            if size <= self.max_size * ResultCache.EVICT_TARGET:
+                break
+
+            ResultCache._remove(path)
+            size -= entry_size
+
+        self.total_size = size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            ResultCache._remove(path)
+
+        self.total_size = 0
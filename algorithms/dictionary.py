@@ -0,0 +1,180 @@
+import zlib
+from collections import Counter
+from heapq import heapify, heappop, heappush
+from typing import Iterable, List, Set
+
+from .entropy import Entropy
+from .huffman import Huffman
+from .lz77 import Lz77
+from .varint import read_varint, write_varint
+
+
+# max size of the trained content, the window of the compact format holds
+# all of it
+DICTIONARY_SIZE = 1 << 15
+
+# samples are split to segments of this size, the segments that have the
+# most common substrings are put to the content
+SEGMENT_SIZE = 64
+
+# length of the substrings that are counted in the samples
+GRAM_SIZE = 6
+
+
+def _grams(bytes_) -> Set[bytes]:
+    return {
+        bytes_[p:p + GRAM_SIZE] for p in range(len(bytes_) - GRAM_SIZE + 1)
+    }
+
+
+class Dictionary:
+    # many small inputs like json records have little to match in their
+    # own bytes and too few symbols to pay for the huffman tables, so a
+    # dictionary trained from samples of them gives the lz77 window that
+    # the inputs start with and the tables of the entropy stage; both the
+    # encoder and the decoder must use the same dictionary
+    MAGIC = b'ADIC'
+
+    def __init__(self, content: bytes, token_format: int,
+                 lengths_list: List[List[int]]):
+        self.content = bytes(content)
+        self.token_format = token_format
+
+        # code lengths of every table of the token format, every symbol
+        # has a code so any input can be coded with them
+        self.lengths_list = lengths_list
+
+        # files refer to the dictionary by the checksum of its bytes
+        self.id = zlib.crc32(self.to_bytes())
+
+    @staticmethod
+    def train(samples: Iterable[bytes], size: int = DICTIONARY_SIZE,
+              token_format: int = Lz77.FORMAT_COMPACT) -> 'Dictionary':
+        samples = [bytes(sample) for sample in samples]
+
+        # content that doesn't fit in the window would never be matched
+        content = Dictionary._select_segments(
+            samples, min(size, Lz77._window_size(token_format))
+        )
+
+        # symbols of the samples that are coded with the content as their
+        # window, every symbol is counted once more so it has a code
+        freqs_list = [
+            [1] * table_size
+            for table_size in Entropy._table_sizes(token_format)
+        ]
+
+        for sample in samples:
+            tokens = Lz77.compress(sample, token_format, dictionary=content)
+
+            for freqs, sample_freqs in zip(
+                freqs_list, Entropy._freqs(tokens, token_format)
+            ):
+                for symbol, freq in enumerate(sample_freqs):
+                    freqs[symbol] += freq
+
+        return Dictionary(content, token_format, [
+            Huffman._code_lengths(freqs) for freqs in freqs_list
+        ])
+
+    @staticmethod
+    def _select_segments(samples: List[bytes], size: int) -> bytes:
+        # number of the samples that have every substring
+        counts: Counter = Counter()
+
+        for sample in samples:
+            counts.update(_grams(sample))
+
+        # segments overlap by half, so a common part of the samples is in
+        # a segment even if it is split by the segment boundaries
+        segments = [
+            sample[i:i + SEGMENT_SIZE]
+            for sample in samples
+            for i in range(0, len(sample), SEGMENT_SIZE // 2)
+        ]
+
+        # substrings that are in the content already
+        covered: Set[bytes] = set()
+
+        def score(segment: bytes) -> int:
+            # a substring is only worth its place if it repeats in the
+            # samples and isn't in the content yet
+            return sum(
+                counts[gram] for gram in _grams(segment)
+                if counts[gram] > 1 and gram not in covered
+            )
+
+        # scores only decrease as the content grows, so a segment whose
+        # score didn't change since it was pushed is the best one
+        heap = [
+            (-score(segment), i, segment)
+            for i, segment in enumerate(segments)
+        ]
+        heapify(heap)
+
+        selected: List[bytes] = []
+        selected_size = 0
+
+        while heap and selected_size < size:
+            negative_score, i, segment = heappop(heap)
+            current_score = score(segment)
+
+            if current_score < -negative_score:
+                heappush(heap, (-current_score, i, segment))
+                continue
+
+            if not current_score:
+                break
+
+            selected.append(segment)
+            selected_size += len(segment)
+            covered.update(_grams(segment))
+
+        # the best segments are put to the end, so they are matched with
+        # the shortest distances
+        return b''.join(reversed(selected))[-size:]
+
+    def to_bytes(self) -> bytes:
+        # magic, token format, content size, content and the code lengths
+        # of every table
+        bytes_ = bytearray(Dictionary.MAGIC)
+        bytes_.append(self.token_format)
+
+        write_varint(bytes_, len(self.content))
+        bytes_ += self.content
+
+        for lengths in self.lengths_list:
+            Huffman._write_code_lengths(bytes_, lengths)
+
+        return bytes(bytes_)
+
+    @staticmethod
+    def from_bytes(bytes_) -> 'Dictionary':
+        if bytes_[:len(Dictionary.MAGIC)] != Dictionary.MAGIC:
+            raise ValueError('not an anvil dictionary')
+
+        index = len(Dictionary.MAGIC)
+        token_format = bytes_[index]
+
+        size, index = read_varint(bytes_, index + 1)
+        content = bytes(bytes_[index:index + size])
+        index += size
+
+        lengths_list = []
+
+        for table_size in Entropy._table_sizes(token_format):
+            lengths, index = Huffman._read_code_lengths(
+                bytes_, index, table_size
+            )
+            lengths_list.append(lengths)
+
+        return Dictionary(content, token_format, lengths_list)
+
+    def save(self, save_path: str):
+        with open(save_path, 'wb') as save:
+            save.write(self.to_bytes())
+
+    @staticmethod
+    def load(file_path: str) -> 'Dictionary':
+        with open(file_path, 'rb') as file:
+            return Dictionary.from_bytes(file.read())
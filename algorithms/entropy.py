@@ -0,0 +1,561 @@
+from typing import List, Tuple
+
+from .huffman import Huffman, _BitWriter, _TableDecoder
+from .lz77 import Lz77
+from .stats import Stats
+from .stream import byte_view
+from .varint import read_varint, write_varint
+
+
+# number of the codes of a value that is written as a code and extra bits,
+# enough for every value below 2 ** 32
+VALUE_CODES = 64
+
+# symbols of the compact literal and length table: a literal is its own
+# symbol, END_SYMBOL ends a group of sequences and the symbols after it
+# are the codes of the match lengths
+END_SYMBOL = 256
+LITERAL_SYMBOLS = END_SYMBOL + 1 + VALUE_CODES
+
+# codes and code lengths of a table
+_Table = Tuple[List[int], List[int]]
+
+
+def _value_code(value: int) -> Tuple[int, int]:
+    # returns the code and the number of the extra bits of a value, values
+    # below 4 have their own codes and every greater power of two is split
+    # to 2 codes by its second highest bit, the bits after it are extra
+    if value < 4:
+        return value, 0
+
+    extra_bits = value.bit_length() - 2
+
+    return 2 * extra_bits + 2 + ((value >> extra_bits) & 1), extra_bits
+
+
+# the smallest value and the number of the extra bits of every code
+_VALUE_BASES: List[int] = []
+_VALUE_EXTRA_BITS: List[int] = []
+
+for _code in range(VALUE_CODES):
+    if _code < 4:
+        _VALUE_BASES.append(_code)
+        _VALUE_EXTRA_BITS.append(0)
+    else:
+        _VALUE_EXTRA_BITS.append((_code - 2) >> 1)
+        _VALUE_BASES.append((2 | (_code & 1)) << _VALUE_EXTRA_BITS[-1])
+
+
+class _BitReader:
+    def __init__(self, bytes_, index: int):
+        self.bytes_ = bytes_
+        self.index = index
+
+        # bits that are read but not used yet, the first bit is the highest
+        # one of the lowest `bit_count` bits
+        self.bits = 0
+        self.bit_count = 0
+
+    def fill(self):
+        # read 8 bytes at once, after the end of the bytes zeros are read
+        # once, so the last code can be looked up with a full table index
+        chunk = self.bytes_[self.index:self.index + 8]
+
+        if not chunk:
+            if self.index > len(self.bytes_):
+                raise ValueError('unexpected end of stream')
+
+            chunk = bytes(8)
+
+        self.index += len(chunk)
+
+        self.bits = ((self.bits & ((1 << self.bit_count) - 1))
+                     << (len(chunk) * 8)) | int.from_bytes(chunk, 'big')
+        self.bit_count += len(chunk) * 8
+
+    def read(self, count: int) -> int:
+        while self.bit_count < count:
+            self.fill()
+
+        self.bit_count -= count
+        return (self.bits >> self.bit_count) & ((1 << count) - 1)
+
+    def symbol(self, decoder: _TableDecoder) -> int:
+        # codes are never longer than the max code length, the table is
+        # indexed with that many bits
+        while self.bit_count < Huffman.MAX_CODE_LENGTH:
+            self.fill()
+
+        entry = decoder.table[
+            (self.bits >> (self.bit_count - decoder.table_bits))
+            & ((1 << decoder.table_bits) - 1)
+        ]
+
+        if entry > 0:
+            self.bit_count -= entry & 31
+            return entry >> 5
+
+        symbol, length = decoder._lookup(self.bits, self.bit_count)
+        self.bit_count -= length
+        return symbol
+
+
+class Entropy:
+    def __new__(cls): pass
+
+    # lz77 output is coded with a huffman table for every field of the
+    # tokens instead of a single table for all bytes, so literals, lengths
+    # and distances don't share a distribution: triples have a table for
+    # the distances, lengths and next bytes; compact sequences have a table
+    # for the literals and match lengths and a table for the distances like
+    # deflate, lengths and distances are written as codes and extra bits
+
+    # preset tables are given as the code lengths of every table, like a
+    # dictionary gives them; their tables aren't written to the output and
+    # they must have a code for every symbol
+
+    @staticmethod
+    def compress(bytes_, token_format: int,
+                 lengths_list: List[List[int]] = None,
+                 stats: Stats = None) -> bytes:
+        bytes_ = byte_view(bytes_)
+        preset = lengths_list is not None
+
+        if not preset:
+            tokens, _, lengths_list = Entropy._build(
+                bytes_, token_format, stats
+            )
+
+            return Entropy._pack(
+                bytes_, token_format, tokens, lengths_list, preset, stats
+            )
+
+        if stats is not None:
+            start = stats.clock()
+
+        # frequencies of preset tables are only needed for the stats
+        tokens, freqs_list = Entropy._count(
+            bytes_, token_format, stats is not None
+        )
+
+        if stats is not None:
+            stats.add('entropy.preset.count', start, len(bytes_))
+            Entropy._count_codes(
+                stats, 'entropy.preset', freqs_list, lengths_list
+            )
+
+        return Entropy._pack(
+            bytes_, token_format, tokens, lengths_list, preset, stats
+        )
+
+    @staticmethod
+    def decompress(bytes_, token_format: int,
+                   lengths_list: List[List[int]] = None,
+                   stats: Stats = None) -> bytes:
+        try:
+            if token_format == Lz77.FORMAT_TRIPLE:
+                return Entropy._decode_triples(bytes_, lengths_list, stats)
+
+            if token_format == Lz77.FORMAT_COMPACT:
+                return Entropy._decode_compact(bytes_, lengths_list, stats)
+        except IndexError:
+            raise ValueError('unexpected end of stream')
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def _table_sizes(token_format: int) -> List[int]:
+        # number of the symbols of every table of a token format
+        if token_format == Lz77.FORMAT_TRIPLE:
+            return [256, 256, 256]
+
+        if token_format == Lz77.FORMAT_COMPACT:
+            return [LITERAL_SYMBOLS, VALUE_CODES]
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def _freqs(bytes_, token_format: int) -> List[List[int]]:
+        # frequencies of the symbols of every table in the lz77 output
+        return Entropy._count(bytes_, token_format)[1]
+
+    @staticmethod
+    def _count(bytes_, token_format: int, count_freqs: bool = True):
+        # returns the tokens of the lz77 output, the fields of the triples
+        # or the compact sequences, and the frequencies of every table
+        if token_format == Lz77.FORMAT_TRIPLE:
+            tokens = Entropy._triple_fields(bytes_)
+
+            if not count_freqs:
+                return tokens, None
+
+            return tokens, Entropy._triple_freqs(*tokens)
+
+        if token_format == Lz77.FORMAT_COMPACT:
+            tokens = list(Lz77._iter_sequences(bytes_))
+
+            if not count_freqs:
+                return tokens, None
+
+            return tokens, Entropy._compact_freqs(bytes_, tokens)
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def _build(bytes_, token_format: int, stats: Stats = None):
+        # returns the tokens, the frequencies and the code lengths of every
+        # table of the lz77 output
+        if stats is not None:
+            start = stats.clock()
+
+        tokens, freqs_list = Entropy._count(bytes_, token_format)
+
+        if stats is not None:
+            start = stats.add('entropy.count', start, len(bytes_))
+
+        lengths_list = [Huffman._code_lengths(freqs) for freqs in freqs_list]
+
+        if stats is not None:
+            stats.add('entropy.tree', start)
+            Entropy._count_codes(stats, 'entropy', freqs_list, lengths_list)
+
+        return tokens, freqs_list, lengths_list
+
+    @staticmethod
+    def _coded_size(token_format: int, freqs_list: List[List[int]],
+                    lengths_list: List[List[int]], preset: bool) -> int:
+        # size of the output of `_pack` without packing it, the number of
+        # the tokens is counted by the symbols that every token has
+        header = bytearray()
+
+        if token_format == Lz77.FORMAT_TRIPLE:
+            write_varint(header, sum(freqs_list[0]))
+        else:
+            write_varint(header, sum(freqs_list[0][END_SYMBOL:]))
+
+        if not preset:
+            for lengths in lengths_list:
+                Huffman._write_code_lengths(header, lengths)
+
+        bits = sum(
+            freq * length
+            for freqs, lengths in zip(freqs_list, lengths_list)
+            for freq, length in zip(freqs, lengths)
+        )
+
+        # the extra bits of the match lengths and distances
+        if token_format == Lz77.FORMAT_COMPACT:
+            literal_freqs, distance_freqs = freqs_list
+
+            for freqs in (literal_freqs[END_SYMBOL + 1:], distance_freqs):
+                bits += sum(
+                    freq * extra_bits
+                    for freq, extra_bits in zip(freqs, _VALUE_EXTRA_BITS)
+                )
+
+        return len(header) + (bits + 7) // 8
+
+    @staticmethod
+    def _pack(bytes_, token_format: int, tokens,
+              lengths_list: List[List[int]], preset: bool,
+              stats: Stats = None) -> bytes:
+        # writes the tokens with the codes of the tables, the tables are
+        # written before them unless they are preset
+        if stats is not None:
+            start = stats.clock()
+
+        writer = _BitWriter()
+
+        if token_format == Lz77.FORMAT_TRIPLE:
+            write_varint(writer.encoded_bytes, len(tokens[0]))
+        else:
+            write_varint(writer.encoded_bytes, len(tokens))
+
+        tables = Entropy._write_tables(
+            writer.encoded_bytes, lengths_list, preset
+        )
+
+        if token_format == Lz77.FORMAT_TRIPLE:
+            Entropy._pack_triples(writer, tokens, tables)
+        else:
+            Entropy._pack_compact(writer, bytes_, tokens, tables)
+
+        encoded_bytes = Entropy._finish(writer)
+
+        if stats is not None:
+            stats.add(
+                Entropy._stage(preset) + '.pack', start, len(bytes_),
+                len(encoded_bytes),
+            )
+
+        return encoded_bytes
+
+    @staticmethod
+    def _write_tables(encoded_bytes: bytearray,
+                      lengths_list: List[List[int]],
+                      preset: bool) -> List[_Table]:
+        # writes the code lengths of every table, returns the codes and the
+        # lengths of every table; preset lengths aren't written
+        tables = []
+
+        for lengths in lengths_list:
+            if not preset:
+                Huffman._write_code_lengths(encoded_bytes, lengths)
+
+            tables.append((Huffman._canonical_codes(lengths), lengths))
+
+        return tables
+
+    @staticmethod
+    def _read_tables(
+        bytes_, index: int, sizes: List[int],
+        lengths_list: List[List[int]] = None,
+    ) -> Tuple[List[_TableDecoder], int]:
+        if lengths_list is not None:
+            return [
+                Huffman._table_decoder(lengths) for lengths in lengths_list
+            ], index
+
+        decoders = []
+
+        for size in sizes:
+            lengths, index = Huffman._read_code_lengths(bytes_, index, size)
+            decoders.append(Huffman._table_decoder(lengths))
+
+        return decoders, index
+
+    @staticmethod
+    def _stage(preset: bool) -> str:
+        # stages with preset tables are named separately in the stats,
+        # since they don't build their tables
+        if not preset:
+            return 'entropy'
+
+        return 'entropy.preset'
+
+    @staticmethod
+    def _count_codes(stats: Stats, stage: str, freqs_list: List[List[int]],
+                     lengths_list: List[List[int]]):
+        for freqs, lengths in zip(freqs_list, lengths_list):
+            stats.count_codes(stage, freqs, lengths)
+
+    @staticmethod
+    def _finish(writer: _BitWriter) -> bytes:
+        # the last partial byte is filled with zeros after its bits
+        last_bits, bit_count = writer.finish()
+
+        if bit_count:
+            writer.encoded_bytes.append(last_bits << (8 - bit_count))
+
+        return writer.take()
+
+    @staticmethod
+    def _triple_fields(bytes_) -> Tuple[bytes, bytes, bytes]:
+        # distances, lengths and next bytes of the triples
+        if len(bytes_) % 3:
+            raise ValueError('lz77 stream ends in the middle of a token')
+
+        return bytes(bytes_[0::3]), bytes(bytes_[1::3]), bytes(bytes_[2::3])
+
+    @staticmethod
+    def _triple_freqs(distances: bytes, lengths: bytes,
+                      next_bytes: bytes) -> List[List[int]]:
+        # the length of a triple without a match isn't used, so it isn't
+        # written and isn't counted
+        match_lengths = bytes(
+            length for distance, length in zip(distances, lengths) if distance
+        )
+
+        return [
+            Huffman._freqs([field])
+            for field in (distances, match_lengths, next_bytes)
+        ]
+
+    @staticmethod
+    def _pack_triples(writer: _BitWriter, tokens: Tuple[bytes, bytes, bytes],
+                      tables: List[_Table]):
+        distances, lengths, next_bytes = tokens
+
+        (
+            (distance_codes, distance_lengths),
+            (length_codes, length_lengths),
+            (byte_codes, byte_lengths),
+        ) = tables
+
+        write = writer.write
+
+        for distance, length, next_byte in zip(distances, lengths, next_bytes):
+            write(distance_codes[distance], distance_lengths[distance])
+
+            if distance:
+                write(length_codes[length], length_lengths[length])
+
+            write(byte_codes[next_byte], byte_lengths[next_byte])
+
+    @staticmethod
+    def _decode_triples(bytes_, lengths_list: List[List[int]] = None,
+                        stats: Stats = None) -> bytes:
+        if stats is not None:
+            stage = Entropy._stage(lengths_list is not None)
+            start = stats.clock()
+
+        count, index = read_varint(bytes_, 0)
+
+        (distance_decoder, length_decoder, byte_decoder), index = \
+            Entropy._read_tables(
+                bytes_, index, Entropy._table_sizes(Lz77.FORMAT_TRIPLE),
+                lengths_list,
+            )
+
+        if stats is not None:
+            start = stats.add(stage + '.table', start, index)
+
+        reader = _BitReader(bytes_, index)
+        symbol = reader.symbol
+
+        decoded_bytes = bytearray()
+        append = decoded_bytes.append
+
+        for _ in range(count):
+            distance = symbol(distance_decoder)
+            append(distance)
+            append(symbol(length_decoder) if distance else 0)
+            append(symbol(byte_decoder))
+
+        if stats is not None:
+            stats.add(
+                stage + '.decode', start, len(bytes_) - index,
+                len(decoded_bytes),
+            )
+
+        return bytes(decoded_bytes)
+
+    @staticmethod
+    def _compact_freqs(bytes_, sequences: list) -> List[List[int]]:
+        literal_freqs = [0] * LITERAL_SYMBOLS
+        distance_freqs = [0] * VALUE_CODES
+
+        # literals are counted at once like the huffman input
+        literal_bytes = bytearray()
+
+        for literal_start, literal_end, match_distance, match_length \
+                in sequences:
+            literal_bytes += bytes_[literal_start:literal_end]
+
+            if match_distance:
+                literal_freqs[END_SYMBOL + 1 + _value_code(
+                    match_length - Lz77.MIN_MATCH
+                )[0]] += 1
+                distance_freqs[_value_code(match_distance - 1)[0]] += 1
+            else:
+                literal_freqs[END_SYMBOL] += 1
+
+        Huffman._count_chars(literal_bytes, literal_freqs)
+
+        return [literal_freqs, distance_freqs]
+
+    @staticmethod
+    def _pack_compact(writer: _BitWriter, bytes_, sequences: list,
+                      tables: List[_Table]):
+        (
+            (literal_codes, literal_lengths),
+            (distance_codes, distance_lengths),
+        ) = tables
+
+        write = writer.write
+
+        for literal_start, literal_end, match_distance, match_length \
+                in sequences:
+            writer.write_symbols(
+                bytes_[literal_start:literal_end],
+                literal_codes, literal_lengths,
+            )
+
+            if not match_distance:
+                write(literal_codes[END_SYMBOL], literal_lengths[END_SYMBOL])
+                continue
+
+            value = match_length - Lz77.MIN_MATCH
+            code, extra_bits = _value_code(value)
+            symbol = END_SYMBOL + 1 + code
+
+            write(literal_codes[symbol], literal_lengths[symbol])
+
+            if extra_bits:
+                write(value & ((1 << extra_bits) - 1), extra_bits)
+
+            value = match_distance - 1
+            code, extra_bits = _value_code(value)
+
+            write(distance_codes[code], distance_lengths[code])
+
+            if extra_bits:
+                write(value & ((1 << extra_bits) - 1), extra_bits)
+
+    @staticmethod
+    def _decode_compact(bytes_, lengths_list: List[List[int]] = None,
+                        stats: Stats = None) -> bytes:
+        if stats is not None:
+            stage = Entropy._stage(lengths_list is not None)
+            start = stats.clock()
+
+        # the sequences are written again in the compact format, so the
+        # lz77 decoders don't depend on the entropy stage
+        count, index = read_varint(bytes_, 0)
+
+        (literal_decoder, distance_decoder), index = Entropy._read_tables(
+            bytes_, index, Entropy._table_sizes(Lz77.FORMAT_COMPACT),
+            lengths_list,
+        )
+
+        if stats is not None:
+            start = stats.add(stage + '.table', start, index)
+
+        reader = _BitReader(bytes_, index)
+        symbol = reader.symbol
+        read = reader.read
+
+        decoded_bytes = bytearray()
+        literals = bytearray()
+
+        for _ in range(count):
+            literals.clear()
+
+            while True:
+                literal = symbol(literal_decoder)
+
+                if literal >= END_SYMBOL:
+                    break
+
+                literals.append(literal)
+
+            if literal == END_SYMBOL:
+                Lz77._write_sequence(
+                    decoded_bytes, literals, 0, len(literals), 0, 0
+                )
+                continue
+
+            code = literal - END_SYMBOL - 1
+            match_length = _VALUE_BASES[code] + Lz77.MIN_MATCH
+
+            if _VALUE_EXTRA_BITS[code]:
+                match_length += read(_VALUE_EXTRA_BITS[code])
+
+            code = symbol(distance_decoder)
+            match_distance = _VALUE_BASES[code] + 1
+
+            if _VALUE_EXTRA_BITS[code]:
+                match_distance += read(_VALUE_EXTRA_BITS[code])
+
+            Lz77._write_sequence(
+                decoded_bytes, literals, 0, len(literals),
+                match_distance, match_length,
+            )
+
+        if stats is not None:
+            stats.add(
+                stage + '.decode', start, len(bytes_) - index,
+                len(decoded_bytes),
+            )
+
+        return bytes(decoded_bytes)
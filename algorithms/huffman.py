@@ -1,5 +1,18 @@
-from typing import Dict, List
-from math import ceil
+from collections import Counter
+from heapq import heapify, heappop, heappush
+from typing import Dict, Iterator, List, Tuple
+
+from .progress import Progress
+from .stats import Stats
+from .stream import (
+    ChunkReader, byte_view, iter_chunks, map_file, write_stream,
+)
+
+# numpy is optional, it is only used for counting the chars faster
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class _Node:
@@ -32,34 +45,402 @@ class _Node:
         return codes
 
 
+class _BitWriter:
+    def __init__(self):
+        # bits that aren't written yet, the first bit is the highest one
+        # of the lowest `bit_count` bits
+        self.bits = 0
+        self.bit_count = 0
+
+        self.encoded_bytes = bytearray()
+
+    def write(self, code: int, length: int):
+        self.bits = (self.bits << length) | code
+        self.bit_count += length
+
+        # write the bits as a 64 bit word when there are enough bits
+        if self.bit_count >= 64:
+            self.bit_count -= 64
+            self.encoded_bytes += (self.bits >> self.bit_count).to_bytes(8, 'big')
+            self.bits &= (1 << self.bit_count) - 1
+
+    def write_symbols(self, symbols, codes: List[int], lengths: List[int]):
+        # same as calling write for every symbol, without the attribute
+        # access and the function call for every symbol
+        encoded_bytes = self.encoded_bytes
+        bits = self.bits
+        bit_count = self.bit_count
+
+        for symbol in symbols:
+            bits = (bits << lengths[symbol]) | codes[symbol]
+            bit_count += lengths[symbol]
+
+            if bit_count >= 64:
+                bit_count -= 64
+                encoded_bytes += (bits >> bit_count).to_bytes(8, 'big')
+                bits &= (1 << bit_count) - 1
+
+        self.bits = bits
+        self.bit_count = bit_count
+
+    def take(self) -> bytes:
+        # give the bytes written so far
+        bytes_ = bytes(self.encoded_bytes)
+        self.encoded_bytes.clear()
+        return bytes_
+
+    def finish(self) -> Tuple[int, int]:
+        # write all whole bytes, returns the bits that don't fill a byte
+        # and the number of them
+        whole_bytes = self.bit_count // 8
+        self.bit_count -= whole_bytes * 8
+
+        self.encoded_bytes += (self.bits >> self.bit_count).to_bytes(whole_bytes, 'big')
+
+        last_bits = self.bits & ((1 << self.bit_count) - 1)
+        bit_count = self.bit_count
+
+        self.bits = 0
+        self.bit_count = 0
+
+        return last_bits, bit_count
+
+
+class _TableDecoder:
+    def __init__(self, codes: Dict[int, Tuple[int, int]],
+                 table_bits: int = 10):
+        # codes are given as {char: (code, length)}, codes that are longer
+        # than the table bits are resolved with a second level table
+        self.max_length = max(
+            (length for _, length in codes.values()), default=0
+        )
+        self.table_bits = min(table_bits, self.max_length)
+
+        # an entry is (char << 5 | length) for a code, -(index + 1) for a
+        # second level table and 0 for the bits that aren't a code
+        self.table: List[int] = [0] * (1 << self.table_bits)
+        self.subtables: List[Tuple[int, List[int]]] = []
+
+        # codes that are longer than the table bits grouped by their prefix
+        long_codes: Dict[int, List[Tuple[int, int, int]]] = {}
+
+        for char, (code, length) in codes.items():
+            if length <= self.table_bits:
+                # every index that starts with the code points to the char
+                shift = self.table_bits - length
+                start = code << shift
+
+                for index in range(start, start + (1 << shift)):
+                    self.table[index] = (char << 5) | length
+            else:
+                prefix = code >> (length - self.table_bits)
+                long_codes.setdefault(prefix, []).append((char, code, length))
+
+        for prefix, group in long_codes.items():
+            # the second level table is indexed by the bits after the prefix
+            sub_bits = max(length for _, _, length in group) - self.table_bits
+            subtable = [0] * (1 << sub_bits)
+
+            for char, code, length in group:
+                shift = self.table_bits + sub_bits - length
+                start = (code << shift) & ((1 << sub_bits) - 1)
+
+                for index in range(start, start + (1 << shift)):
+                    subtable[index] = (char << 5) | length
+
+            self.subtables.append((sub_bits, subtable))
+            self.table[prefix] = -len(self.subtables)
+
+        # bits that are read but not decoded yet, the first bit is the
+        # highest one of the lowest `bit_count` bits
+        self.bits = 0
+        self.bit_count = 0
+
+    def _lookup(self, bits: int, bit_count: int) -> Tuple[int, int]:
+        # bits must have at least max length bits
+        entry = self.table[
+            (bits >> (bit_count - self.table_bits))
+            & ((1 << self.table_bits) - 1)
+        ]
+
+        if entry < 0:
+            sub_bits, subtable = self.subtables[-entry - 1]
+            entry = subtable[
+                (bits >> (bit_count - self.table_bits - sub_bits))
+                & ((1 << sub_bits) - 1)
+            ]
+
+        if entry == 0:
+            raise ValueError('invalid huffman code')
+
+        return entry >> 5, entry & 31
+
+    def add_bits(self, bits: int, bit_count: int):
+        self.bits = (self.bits << bit_count) | bits
+        self.bit_count += bit_count
+
+    def decode(self, bytes_, final: bool = False) -> bytearray:
+        # decode all codes in the bytes, the bits of the last code that
+        # isn't complete are kept for the next call unless it is final
+        decoded_bytes = bytearray()
+        append = decoded_bytes.append
+
+        # there aren't any codes, if there aren't any chars
+        if not self.max_length:
+            return decoded_bytes
+
+        table = self.table
+        table_bits = self.table_bits
+        table_mask = (1 << table_bits) - 1
+        max_length = self.max_length
+
+        bits = self.bits
+        bit_count = self.bit_count
+
+        index = 0
+        while True:
+            if bit_count < max_length:
+                # read 8 bytes at once to the bits
+                if index < len(bytes_):
+                    chunk = bytes_[index:index + 8]
+                    index += len(chunk)
+
+                    bits = ((bits & ((1 << bit_count) - 1)) << (len(chunk) * 8)) \
+                        | int.from_bytes(chunk, 'big')
+                    bit_count += len(chunk) * 8
+                    continue
+
+                if not final or bit_count == 0:
+                    break
+
+                # fill the missing bits of the last code with zeros, the
+                # code can only be used if it doesn't need them
+                char, length = self._lookup(
+                    bits << (max_length - bit_count), max_length
+                )
+
+                if length > bit_count:
+                    break
+
+                append(char)
+                bit_count -= length
+                continue
+
+            entry = table[(bits >> (bit_count - table_bits)) & table_mask]
+
+            if entry > 0:
+                append(entry >> 5)
+                bit_count -= entry & 31
+            else:
+                char, length = self._lookup(bits, bit_count)
+                append(char)
+                bit_count -= length
+
+        self.bits = bits & ((1 << bit_count) - 1)
+        self.bit_count = bit_count
+
+        if final:
+            self.bits = 0
+            self.bit_count = 0
+
+        return decoded_bytes
+
+
 class Huffman:
     def __new__(cls): pass
 
+    # first byte of the streams that start with the code lengths, streams
+    # that start with a freq dict never start with a 0 freq
+    CANONICAL = 0
+
+    # max length of a code, so a code length fits in 4 bits and long codes
+    # need only one second level table while decoding
+    MAX_CODE_LENGTH = 15
+
     @staticmethod
-    def _file_freq_dict(file_path: str) -> Dict[int, int]:
-        freq_dict: Dict[int, int] = {}
-        
-        with open(file_path, 'rb') as file:
-            while True:
-                char = file.read(1)
-                
-                # if the file ends, stop reading
-                if not char:
-                    break
-                
-                byte = ord(char)
-                
-                # if the dict contains the char, increase the number of the chars
-                if byte in freq_dict.keys():
-                    freq_dict[byte] += 1
-                # if the map don't contains the char, add char to the map
-                else:
-                    freq_dict[byte] = 1
-            
-        return freq_dict
+    def _count_chars(bytes_, freqs: List[int]):
+        # add the number of every char in the bytes to the freqs
+        if numpy is not None:
+            counts = numpy.bincount(
+                numpy.frombuffer(bytes_, dtype=numpy.uint8), minlength=256
+            )
+
+            for char, count in enumerate(counts.tolist()):
+                freqs[char] += count
+
+            return
+
+        # if there are a few different chars (like in a text), remove the
+        # chars one by one with translate, which runs over the whole
+        # bytes in C, otherwise count them with a counter
+        if len(set(bytes_[:4096])) > 64:
+            for char, count in Counter(bytes_).items():
+                freqs[char] += count
+
+            return
+
+        remaining = bytes(bytes_)
+
+        while remaining:
+            char = remaining[0]
+            length = len(remaining)
+
+            remaining = remaining.translate(None, bytes([char]))
+            freqs[char] += length - len(remaining)
+
+    @staticmethod
+    def _freqs(chunks) -> List[int]:
+        freqs = [0] * 256
+
+        for chunk in chunks:
+            Huffman._count_chars(chunk, freqs)
+
+        return freqs
+
+    @staticmethod
+    def _code_lengths(freqs: List[int],
+                      max_length: int = MAX_CODE_LENGTH) -> List[int]:
+        # returns the code length of every char, 0 for the unused chars
+        lengths = [0] * len(freqs)
+        chars = [char for char, freq in enumerate(freqs) if freq]
+
+        # a single char still needs a code of 1 bit
+        if len(chars) == 1:
+            lengths[chars[0]] = 1
+
+        if len(chars) <= 1:
+            return lengths
+
+        # build huffman tree with a heap, nodes are only numbers: chars
+        # are their own numbers and every parent gets the next number
+        heap = [(freqs[char], char) for char in chars]
+        heapify(heap)
+
+        parents: Dict[int, int] = {}
+        node = len(freqs)
+
+        # continue until one root node remains
+        while len(heap) > 1:
+            # get 2 nodes that has min freq
+            left_freq, left_node = heappop(heap)
+            right_freq, right_node = heappop(heap)
+
+            parents[left_node] = node
+            parents[right_node] = node
+
+            heappush(heap, (left_freq + right_freq, node))
+            node += 1
+
+        # a parent always has a greater number than its child nodes, so the
+        # depths can be found from the root (the last node) to the leaves
+        depths = {node - 1: 0}
+
+        for parent in range(node - 2, len(freqs) - 1, -1):
+            depths[parent] = depths[parents[parent]] + 1
+
+        for char in chars:
+            lengths[char] = depths[parents[char]] + 1
+
+        if max(lengths) <= max_length:
+            return lengths
+
+        return Huffman._package_merge(freqs, chars, max_length)
+
+    @staticmethod
+    def _package_merge(freqs: List[int], chars: List[int],
+                       max_length: int) -> List[int]:
+        # optimal code lengths that aren't longer than the max length: every
+        # char is an item for every length, two cheapest items of a length
+        # are packaged as an item of the previous length and the cheapest
+        # 2n - 2 items of the first length give the code lengths
+        leaves = sorted((freqs[char], [char]) for char in chars)
+        items = leaves
+
+        for _ in range(max_length - 1):
+            packages = [
+                (items[i][0] + items[i + 1][0], items[i][1] + items[i + 1][1])
+                for i in range(0, len(items) - 1, 2)
+            ]
+
+            items = sorted(leaves + packages, key=lambda item: item[0])
+
+        lengths = [0] * len(freqs)
+
+        # code length of a char is the number of the selected items it is in
+        for _, group in items[:2 * len(chars) - 2]:
+            for char in group:
+                lengths[char] += 1
+
+        return lengths
+
+    @staticmethod
+    def _canonical_codes(lengths: List[int]) -> List[int]:
+        # chars are sorted by their code lengths and their values, every
+        # code is the next number after the previous code that is shifted
+        # when the code length increases, so only the lengths are needed
+        # to create the same codes again
+        codes = [0] * len(lengths)
+
+        code = 0
+        previous_length = 0
+
+        for length, char in sorted(
+            (length, char) for char, length in enumerate(lengths) if length
+        ):
+            code <<= length - previous_length
+            codes[char] = code
+
+            code += 1
+            previous_length = length
+
+        return codes
+
+    @staticmethod
+    def _table_decoder(lengths: List[int]) -> _TableDecoder:
+        codes = Huffman._canonical_codes(lengths)
+
+        return _TableDecoder({
+            char: (codes[char], length)
+            for char, length in enumerate(lengths) if length
+        })
+
+    @staticmethod
+    def _write_code_lengths(encoded_bytes: bytearray, lengths: List[int]):
+        # lengths are written in runs, the high 4 bits of a byte is the
+        # length and the low 4 bits is the number of the repeats minus 1
+        i = 0
+        while i < len(lengths):
+            length = lengths[i]
+            repeat = 1
+
+            while repeat < 16 and i + repeat < len(lengths) \
+                    and lengths[i + repeat] == length:
+                repeat += 1
+
+            encoded_bytes.append((length << 4) | (repeat - 1))
+            i += repeat
+
+    @staticmethod
+    def _read_code_lengths(bytes_, index: int,
+                           count: int) -> Tuple[List[int], int]:
+        # returns the lengths of `count` chars and the index after them
+        lengths: List[int] = []
+
+        while len(lengths) < count:
+            byte = bytes_[index]
+            index += 1
+
+            lengths.extend([byte >> 4] * ((byte & 15) + 1))
+
+        if len(lengths) != count:
+            raise ValueError('invalid huffman code lengths')
+
+        return lengths, index
 
     @staticmethod
     def _build_tree(node_list: List[_Node]) -> _Node:
+        # only used for the streams that start with a freq dict
+
         # function will be used as parameter for min function
         # while getting the node that has min frequency
         def get_freq(node): return node.freq
@@ -85,20 +466,6 @@ class Huffman:
         # get remaining node that contains other nodes as child
         return node_list[0]
 
-    @staticmethod
-    def _normalize_freq_dict(freq_dict: Dict[int, int]) -> Dict[int, int]:
-        # apply the max function every freq pair and get the max freq
-        max_freq = max(freq_dict.values())
-
-        normalized_freq_dict = {}
-
-        for char, freq in freq_dict.items():
-            # normalize freq from (0, x) to (0, 255)
-            # so it can be written as one byte to file
-            normalized_freq_dict[char] = ceil(freq * 255 / max_freq)
-
-        return normalized_freq_dict
-
     @staticmethod
     def _dict_to_node_list(dict_: Dict[int, int]) -> List[_Node]:
         node_list: List[_Node] = []
@@ -111,275 +478,259 @@ class Huffman:
         return node_list
 
     @staticmethod
-    def encode(file_path: str, save_path: str):
-        # read file and get freq of the chars
-        freq_dict = Huffman._file_freq_dict(file_path)
+    def encode(file_path: str, save_path: str, progress: Progress = None):
+        # the mapped file is counted and encoded in place without a copy
+        with map_file(file_path) as bytes_:
+            write_stream([Huffman.compress(bytes_, progress)], save_path)
 
-        # normalize frequencies so it can be written as one byte to file
-        freq_dict = Huffman._normalize_freq_dict(freq_dict)
+    @staticmethod
+    def decode(file_path: str, save_path: str, offset: int = 0,
+               progress: Progress = None):
+        with map_file(file_path) as bytes_:
+            # skip the bytes before the huffman output
+            write_stream(
+                [Huffman.decompress(bytes_[offset:], progress)], save_path
+            )
 
-        # create an node list from frequency map
-        leaf_nodes = Huffman._dict_to_node_list(freq_dict)
+    @staticmethod
+    def compress(bytes_, progress: Progress = None,
+                 stats: Stats = None) -> bytes:
+        # both counting and encoding read the same bytes, bytearray and
+        # memoryview are read in place
+        bytes_ = byte_view(bytes_)
+
+        if progress is None:
+            chunks = [bytes_]
+        else:
+            if progress.total is None:
+                progress.total = len(bytes_)
 
-        # build huffman tree for creating unique binary codes
-        huffman_tree = Huffman._build_tree(leaf_nodes)
+            # the bytes are encoded a part at a time to report the progress
+            chunks = [
+                memoryview(bytes_)[i:i + progress.interval]
+                for i in range(0, len(bytes_), progress.interval)
+            ]
 
-        # get binary code of each charcode (example: {100: '10110', 132: '0', ...})
-        huffman_codes = huffman_tree.huffman_codes()
+        _, lengths = Huffman._build(chunks, len(bytes_), stats)
 
-        encoded_bytes = bytearray()
+        return Huffman._pack(chunks, lengths, len(bytes_), progress, stats)
 
-        # write freq dict for creating huffman tree when it will be decoded
-        # (example: freq0, char0, freq1, char1, freq2, ...)
-        for char, freq in freq_dict.items():
-            encoded_bytes.append(freq)
-            encoded_bytes.append(char)
+    @staticmethod
+    def _build(chunks, size: int,
+               stats: Stats = None) -> Tuple[List[int], List[int]]:
+        # returns the freqs and the code lengths of the chunks
+        if stats is not None:
+            start = stats.clock()
 
-        # 0 freq is the sign for the end of the freq dict
-        encoded_bytes.append(0)
-        
-        with open(file_path, 'rb') as file:
-            buffer: List[str] = []
+        freqs = Huffman._freqs(chunks)
 
-            while True:
-                char = file.read(1)
-                
-                if not char:
-                    break
-                
-                byte = ord(char)
-                
-                # get the huffman code of the char from the freq dict
-                huffman_code = huffman_codes[byte]
-
-                # add all bits of the huffman code to the buffer
-                for bit in huffman_code:
-                    buffer.append(bit)
-
-                # if size of the buffer reaches to a byte
-                while len(buffer) >= 8:
-                    # get the first 8 elements and concat them
-                    byte_string = ''.join(buffer[:8])
-
-                    # parse the string to int and add to the list
-                    encoded_byte = int(byte_string, 2)
-                    encoded_bytes.append(encoded_byte)
-
-                    # remove first 8 elements from list
-                    buffer = buffer[8:]
-
-            if buffer == []:
-                # if buffer is empty, all bits in the last byte must be used
-                used_bits_in_last_byte = 8
-            else:
-                # if buffer is not empty, used bits in the last byte
-                # must be equal to the length of the buffer
-                used_bits_in_last_byte = len(buffer)
+        if stats is not None:
+            start = stats.add('huffman.count', start, size)
 
-                # add the last remaining byte to the list
-                byte_string = ''.join(buffer)
+        # only the code lengths are written, both encoder and decoder
+        # create the same canonical codes from them
+        lengths = Huffman._code_lengths(freqs)
 
-                encoded_byte = int(byte_string, 2)
-                encoded_bytes.append(byte)
+        if stats is not None:
+            stats.add('huffman.tree', start)
+            stats.count_codes('huffman', freqs, lengths)
 
-            # add the number of the used bits in the last byte to the encoded_bytes
-            # so decoder can distinguish unused bits in the last byte
-            encoded_bytes.append(used_bits_in_last_byte)
-            
-            with open(save_path, 'wb') as save:
-                # write all encoded_bytes to the file
-                save.write(encoded_bytes)
+        return freqs, lengths
 
     @staticmethod
-    def decode(file_path: str, save_path: str):
-        reading_freq_dict = True
-        freq_dict: Dict[int, int] = {}
-        is_freq = True
-        last_freq: int
+    def _pack(chunks, lengths: List[int], size: int,
+              progress: Progress = None, stats: Stats = None) -> bytes:
+        if stats is not None:
+            start = stats.clock()
 
-        huffman_codes: Dict[str, int] = {}
-        bitstring_list: List[int] = []
+        encoded_bytes = b''.join(
+            Huffman._encode_chunks(chunks, lengths, progress)
+        )
 
-        with open(file_path, 'rb') as file:
-            while True:
-                char = file.read(1)
-                
-                if not char:
-                    break
-                
-                byte = ord(char)
+        if stats is not None:
+            stats.add('huffman.pack', start, size, len(encoded_bytes))
 
-                # when reading freq dict
-                if reading_freq_dict:
+        return encoded_bytes
 
-                    # if current byte represents a freq
-                    if is_freq:
+    @staticmethod
+    def _coded_size(freqs: List[int], lengths: List[int]) -> int:
+        # size of the output of `_pack` without packing it: the marker, the
+        # code lengths, the codes and the number of the used bits
+        header = bytearray()
+        Huffman._write_code_lengths(header, lengths)
 
-                        # if freq is 0 (end sign for freq dict)
-                        if byte == 0:
-                            # create a list of nodes from freq dict
-                            leaf_nodes = Huffman._dict_to_node_list(freq_dict)
+        bits = sum(freq * length for freq, length in zip(freqs, lengths))
 
-                            # build a huffman tree from leaf nodes
-                            huffman_tree = Huffman._build_tree(leaf_nodes)
+        return 1 + len(header) + (bits + 7) // 8 + 1
 
-                            # add the huffman codes as a pair of
-                            # (code-char) to the dict
-                            for char, binary in huffman_tree.huffman_codes().items():
-                                huffman_codes[binary] = char
+    @staticmethod
+    def decompress(bytes_, progress: Progress = None,
+                   stats: Stats = None) -> bytes:
+        if stats is not None:
+            start = stats.clock()
 
-                            # finish reading freq dict
-                            reading_freq_dict = False
+        try:
+            decoder, index = Huffman._parse_header(bytes_, 0)
+        except IndexError:
+            raise ValueError('unexpected end of stream')
 
-                        # if reading freq dict is not finished
-                        else:
-                            last_freq = byte
+        if stats is not None:
+            start = stats.add('huffman.table', start, index)
 
-                    # if current byte represents a char
-                    else:
-                        freq_dict[byte] = last_freq
+        if len(bytes_) - index < 1:
+            raise ValueError('unexpected end of stream')
 
-                    # if current byte represents freq, set is_freq to false
-                    # for next byte, otherwise vice versa
-                    is_freq = not is_freq
+        # last byte represents the number of the used bits in the last but
+        # two byte, the bytes before them are decoded through a memoryview
+        # so they aren't copied
+        encoded_bytes = memoryview(bytes_)[index:-2]
 
-                # when reading huffman codes of chars
-                else:
-                    # add encoded byte to the list in bit-string format
-                    bitstring_list.append('{0:08b}'.format(byte))
+        if progress is None:
+            decoded_bytes = decoder.decode(encoded_bytes)
+        else:
+            if progress.total is None:
+                progress.total = len(bytes_)
 
-        # last byte in the file represents the number of
-        # the used bits in the last but two byte
-        used_bits_in_last_byte = int(bitstring_list.pop(), 2)
+            # the bytes are decoded a part at a time to report the progress
+            decoded_bytes = bytearray()
 
-        # the last but two byte has bits that may not be used, encoder wrote a byte
-        # to the end of the file to specify the used bytes
-        last_byte = bitstring_list.pop()[-used_bits_in_last_byte:]
-        bitstring_list.append(last_byte)
+            for i in range(0, len(encoded_bytes), progress.interval):
+                part = encoded_bytes[i:i + progress.interval]
+                decoded_bytes += decoder.decode(part)
 
-        decoded_bytes = bytearray()
-        key_buffer = ''
-        
-        for bitstring in bitstring_list:    
-            for bit in bitstring:
-                # add current bit to the buffer
-                key_buffer += bit
+                progress.update('huffman', index + i + len(part))
 
-                # if there is huffman code that matches with key_buffer
-                if key_buffer in huffman_codes.keys():
-                    # add corresponding charcode to the decoded bytes
-                    decoded_bytes.append(huffman_codes[key_buffer])
+        if len(bytes_) - index >= 2:
+            last_byte, used_bits_in_last_byte = bytes_[-2:]
 
-                    # reset buffer
-                    key_buffer = ''
+            decoder.add_bits(
+                last_byte & ((1 << used_bits_in_last_byte) - 1),
+                used_bits_in_last_byte,
+            )
 
-        with open(save_path, 'wb') as save:
-            # write all decoded bytes to the file
-            save.write(decoded_bytes)
+        decoded_bytes += decoder.decode(b'', final=True)
 
+        if stats is not None:
+            stats.add(
+                'huffman.decode', start, len(bytes_) - index,
+                len(decoded_bytes),
+            )
 
-class Lz77:
-    def __new__(cls): pass
+        return bytes(decoded_bytes)
 
     @staticmethod
-    def encode(file_path: str, save_path: str):
-        with open(file_path, 'rb') as file:
-            bytes_ = file.read()
-            encoded_bytes = bytearray()
-
-            # index
-            i = 0
-            while i < len(bytes_):
-                # distance between current index and matched pointer
-                match_distance = 0
-
-                # length of the matched pointer
-                match_length = 0
-
-                # search index
-                for j in range(max(0, i - 255), i):
-                    # the lookahead index for continues byte group
-                    k = 0
-
-                    # conditions for increasing the lookahead index
-                    while all([
-                        # the lookahead index musn't be greater than
-                        # the number of byte after i, so decoder won't
-                        #  give an index error
-                        (k < len(bytes_) - i - 1),
-
-                        # lookahead index musn't be greater than 255,
-                        # so it can fit in one byte
-                        (k < 256),
-
-                        # sum of the lookahead index and the search index
-                        # musn't be greater than current index, so decoder
-                        # won't try to access not loaded byte
-                        # after current index
-                        (j + k < i),
-
-                        # look after the current index and the search index,
-                        # they must be same
-                        (bytes_[i + k] == bytes_[j + k]),
-                    ]):
-                        # +1 -> indexes starts from 0, lengths starts from 1
-                        length = k + 1
-
-                        # distance -> current index - search index
-                        distance = i - j
-
-                        # get pointer that has max length
-                        if (length >= match_length):
-                            match_length = length
-                            match_distance = distance
-
-                        k += 1
-
-                # increase index by length of the matched byte
-                i += match_length
-
-                # get the next byte from byte
-                next_byte = bytes_[i]
-
-                # add the distance, length and next byte to the list
-                encoded_bytes.append(match_distance)
-                encoded_bytes.append(match_length)
-                encoded_bytes.append(next_byte)
-
-                i += 1
-        
-        with open(save_path, 'wb') as save:
-            save.write(encoded_bytes)
+    def _encode_chunks(chunks, lengths: List[int],
+                       progress: Progress = None) -> Iterator[bytes]:
+        codes = Huffman._canonical_codes(lengths)
+
+        writer = _BitWriter()
+        encoded_bytes = writer.encoded_bytes
+
+        encoded_bytes.append(Huffman.CANONICAL)
+        Huffman._write_code_lengths(encoded_bytes, lengths)
+
+        done = 0
+
+        for chunk in chunks:
+            writer.write_symbols(chunk, codes, lengths)
+
+            if progress is not None:
+                done += len(chunk)
+                progress.update('huffman', done)
+
+            # give the encoded bytes of the chunk, only the bits that
+            # don't fill a word are kept
+            yield writer.take()
+
+        last_bits, used_bits_in_last_byte = writer.finish()
+
+        if used_bits_in_last_byte == 0:
+            # if there isn't a partial byte, all bits in the last byte must be used
+            used_bits_in_last_byte = 8
+        else:
+            # add the last partial byte to the list, its bits are the
+            # lowest bits of the byte
+            encoded_bytes.append(last_bits)
+
+        # add the number of the used bits in the last byte to the encoded_bytes
+        # so decoder can distinguish unused bits in the last byte
+        encoded_bytes.append(used_bits_in_last_byte)
+
+        yield writer.take()
 
     @staticmethod
-    def decode(file_path: str, save_path: str):
-        with open(file_path, 'rb') as file:
-            decoded_bytes = bytearray()
-            
-            while True:
-                bytes_ = file.read(3)
-                
-                # if the file ends, stop reading
-                if not bytes_:
-                    break
-                
-                # get distance, length and next byte from
-                # the file in the fixed order
-                distance, length, next_byte = bytes_
-                
-                # if it is a pointer to the past byte
-                if (distance != 0):
-                    # the start of the byte
-                    start = len(decoded_bytes) - distance
-
-                    # skip to the `start` and take the first `length` byte
-                    bytes_ = decoded_bytes[start: start + length]
-
-                    decoded_bytes.extend(bytes_)
-
-                # add next byte to the list
-                decoded_bytes.append(next_byte)
-        
-        with open(save_path, 'wb') as save:
-            save.write(decoded_bytes)
+    def _parse_header(bytes_, index: int) -> Tuple[_TableDecoder, int]:
+        # returns the decoder and the index of the first encoded byte
+        if bytes_[index] == Huffman.CANONICAL:
+            lengths, index = Huffman._read_code_lengths(bytes_, index + 1, 256)
+
+            return Huffman._table_decoder(lengths), index
+
+        # streams written before the canonical codes start with a freq dict
+        freq_dict: Dict[int, int] = {}
+
+        while True:
+            freq = bytes_[index]
+            index += 1
+
+            # if freq is 0 (end sign for freq dict)
+            if freq == 0:
+                break
+
+            # the char comes after its freq
+            freq_dict[bytes_[index]] = freq
+            index += 1
+
+        # create a list of nodes from freq dict
+        leaf_nodes = Huffman._dict_to_node_list(freq_dict)
+
+        # build a huffman tree from leaf nodes
+        huffman_tree = Huffman._build_tree(leaf_nodes)
+
+        decoder = _TableDecoder({
+            char: (int(binary, 2), len(binary))
+            for char, binary in huffman_tree.huffman_codes().items()
+        })
+
+        return decoder, index
+
+    @staticmethod
+    def decode_stream(source,
+                      progress: Progress = None) -> Iterator[bytes]:
+        reader = ChunkReader(source)
+
+        # a header is never longer than the freq dict of all chars
+        header = reader.peek(2 * 256 + 1)
+
+        try:
+            decoder, index = Huffman._parse_header(header, 0)
+        except IndexError:
+            raise ValueError('unexpected end of stream')
+
+        reader.read(index)
+
+        # last byte in the file represents the number of the used bits in
+        # the last but two byte, so the last 2 bytes are held back until
+        # the file ends
+        pending = bytearray()
+
+        for chunk in iter_chunks(reader):
+            pending += chunk
+
+            yield bytes(decoder.decode(pending[:-2]))
+            del pending[:-2]
+
+            if progress is not None:
+                progress.update('huffman', reader.position)
+
+        if len(pending) == 2:
+            last_byte, used_bits_in_last_byte = pending
+
+            # the last but two byte has bits that may not be used, encoder
+            # wrote a byte to the end of the file to specify the used bytes
+            decoder.add_bits(
+                last_byte & ((1 << used_bits_in_last_byte) - 1),
+                used_bits_in_last_byte,
+            )
 
+        yield bytes(decoder.decode(b'', final=True))
@@ -1,104 +1,1040 @@
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from .progress import Progress
+from .stream import byte_view, iter_chunks, map_file, write_stream
+from .varint import read_varint, write_varint
+
+
+def _match_length(bytes_, i: int, j: int, length: int, limit: int) -> int:
+    # compare the bytes after `i` and `j` in slices first, so long matches
+    # don't cost a python level comparison for every byte
+    while length + 32 <= limit and \
+            bytes_[i + length: i + length + 32] == bytes_[j + length: j + length + 32]:
+        length += 32
+
+    while length < limit and bytes_[i + length] == bytes_[j + length]:
+        length += 1
+
+    return length
+
+
+def _run_length(bytes_, i: int, limit: int) -> int:
+    # number of the bytes after `i` that repeat the byte before it, the
+    # compared slices are doubled while they match and halved when they
+    # don't, so a run of n bytes costs log(n) slice comparisons
+    length = 0
+    step = 1
+
+    while step and length < limit:
+        step = min(step, limit - length)
+
+        # the bytes from `i - 1` to `i + length` are the same, so the slice
+        # at `i - 1` is a run of the byte as long as the step isn't longer
+        if bytes_[i + length:i + length + step] == bytes_[i - 1:i - 1 + step]:
+            length += step
+            step *= 2
+        else:
+            step //= 2
+
+    return length
+
+
+def _copy_match(decoded_bytes: bytearray, distance: int, length: int):
+    # copies `length` bytes from `distance` bytes before the end, a match
+    # that is longer than its distance repeats the bytes after its start,
+    # so the copied slice is doubled until the length is reached
+    start = len(decoded_bytes) - distance
+
+    if start < 0:
+        raise ValueError('lz77 match distance is out of the decoded bytes')
+
+    while length > 0:
+        chunk = decoded_bytes[start:start + length]
+        decoded_bytes += chunk
+        length -= len(chunk)
+
+
+class _HashChain:
+    def __init__(self, bytes_, window_size: int, max_chain: int,
+                 min_match: int = 1, start: int = 0):
+        self.bytes_ = bytes_
+        self.window_size = window_size
+        self.max_chain = max_chain
+        self.min_match = min_match
+
+        # size of the chain tables is a power of two greater than the window,
+        # so a slot is never reused while its position is still in the window
+        self.mask = (1 << window_size.bit_length()) - 1
+
+        # the most recent position of every 3 byte prefix, and the previous
+        # position that has the same prefix for every position in the window
+        self.head3: Dict[int, int] = {}
+        self.prev3: List[int] = [-1] * (self.mask + 1)
+
+        # same tables for 2 byte prefixes, used when there isn't a longer match
+        self.head2: Dict[int, int] = {}
+        self.prev2: List[int] = [-1] * (self.mask + 1)
+
+        # the most recent position of every byte
+        self.last1: List[int] = [-1] * 256
+
+        # the first position that isn't inserted to the tables yet, bytes
+        # before the window of the start position can never be matched
+        self.inserted = max(0, start - window_size)
+
+    def copy(self, bytes_) -> '_HashChain':
+        # a chain of other bytes that start with the inserted bytes
+        chain = _HashChain.__new__(_HashChain)
+        chain.__dict__.update(self.__dict__)
+
+        chain.bytes_ = bytes_
+        chain.head3 = self.head3.copy()
+        chain.prev3 = self.prev3.copy()
+        chain.head2 = self.head2.copy()
+        chain.prev2 = self.prev2.copy()
+        chain.last1 = self.last1.copy()
+
+        return chain
+
+    def insert_until(self, end: int):
+        bytes_ = self.bytes_
+        mask = self.mask
+        head3, prev3 = self.head3, self.prev3
+        head2, prev2 = self.head2, self.prev2
+        last1 = self.last1
+
+        # prefixes can't be longer than the bytes left after the position
+        end3 = min(end, len(bytes_) - 2)
+        end2 = min(end, len(bytes_) - 1)
+
+        # 2 and 1 byte tables are only needed if short matches are searched
+        if self.min_match >= 3:
+            for p in range(self.inserted, end3):
+                key = (bytes_[p] << 16) | (bytes_[p + 1] << 8) | bytes_[p + 2]
+                prev3[p & mask] = head3.get(key, -1)
+                head3[key] = p
+
+            self.inserted = max(self.inserted, end)
+            return
+
+        for p in range(self.inserted, end):
+            byte = bytes_[p]
+            last1[byte] = p
+
+            if p < end2:
+                key = (byte << 8) | bytes_[p + 1]
+                prev2[p & mask] = head2.get(key, -1)
+                head2[key] = p
+
+                if p < end3:
+                    key = (key << 8) | bytes_[p + 2]
+                    prev3[p & mask] = head3.get(key, -1)
+                    head3[key] = p
+
+        self.inserted = max(self.inserted, end)
+
+    def longest_match(self, i: int, max_length: int, max_run: int = 0):
+        # returns (distance, length) of the longest match, the closest one
+        # is selected between equal lengths; matches can overlap the bytes
+        # after the current index, since the decoder copies them in order
+        if max_length < self.min_match:
+            return 0, 0
+
+        bytes_ = self.bytes_
+        mask = self.mask
+        min_pos = max(0, i - self.window_size)
+
+        # a run of the byte before the index is matched at distance 1
+        # without searching the chain, runs can be up to `max_run` long
+        if i and bytes_[i] == bytes_[i - 1]:
+            run = _run_length(bytes_, i, max(max_length, max_run))
+
+            if run >= min(max_length, Lz77.NICE_LENGTH):
+                return 1, run
+
+        match_distance = 0
+        match_length = 0
+
+        if max_length >= 3:
+            prev3 = self.prev3
+            key = (bytes_[i] << 16) | (bytes_[i + 1] << 8) | bytes_[i + 2]
+            j = self.head3.get(key, -1)
+            chain = self.max_chain
+
+            # positions in the chain gets smaller, so the first match that
+            # has the max length is the closest one
+            while j >= min_pos and chain > 0:
+                # skip the candidate if it can't be longer than the best match
+                if bytes_[j + match_length] == bytes_[i + match_length]:
+                    length = _match_length(bytes_, i, j, 3, max_length)
+
+                    if length > match_length:
+                        match_length = length
+                        match_distance = i - j
+
+                        if match_length == max_length:
+                            break
+
+                j = prev3[j & mask]
+                chain -= 1
+
+            if match_length >= 3 or self.min_match >= 3:
+                return match_distance, match_length
+
+        if max_length >= 2:
+            # the closest 2 byte match
+            key = (bytes_[i] << 8) | bytes_[i + 1]
+            j = self.head2.get(key, -1)
+
+            if j >= min_pos:
+                return i - j, 2
+
+        # the closest 1 byte match
+        j = self.last1[bytes_[i]]
+
+        if j >= min_pos:
+            return i - j, 1
+
+        return 0, 0
+
+
+# estimated costs in bits of the optimal parse, like the entropy stage a
+# match length or distance is a code and extra bits; literals of the text
+# are coded with fewer bits than a byte, but not much fewer
+_LITERAL_COST = 7
+_CODE_COST = 5
+_MAX_COST = 1 << 62
+
+
+def _value_cost(value: int) -> int:
+    # cost of a code and its extra bits, see `_value_code` of entropy
+    return _CODE_COST + max(value.bit_length() - 2, 0)
+
+
 class Lz77:
     def __new__(cls): pass
 
+    # fixed (distance, length, next byte) triples, each field is one byte
+    FORMAT_TRIPLE = 0
+
+    # sequences of a literal run and a match with variable width fields
+    FORMAT_COMPACT = 1
+
+    # the shortest match the compact format writes, shorter ones are
+    # written as literals because a match costs at least 2 bytes
+    MIN_MATCH = 3
+
+    # max distance of a compact match
+    WINDOW_SIZE = 1 << 16
+
+    # max length of a compact match, except the runs of a byte
+    MAX_MATCH = 1 << 16
+
+    # max length of a compact run, a run of a byte is written as a single
+    # overlapping match at distance 1 if its bytes are known by the encoder
+    MAX_RUN = 1 << 30
+
+    # max number of the candidates checked for a compact match
+    MAX_CHAIN = 32
+
+    # strategies of the compact match search: greedy takes the longest
+    # match at every index; lazy delays a match by a byte if the next index
+    # has a longer one; optimal chooses the matches and the literals of a
+    # span by their estimated cost in bits with dynamic programming
+    GREEDY = 0
+    LAZY = 1
+    OPTIMAL = 2
+
+    # max chain and strategy of every compression level, the chain is used
+    # by the triple format too but its tokens are always found greedily;
+    # no level means the max chain of the format with greedy matching.
+    # measured with anvil on the 256 KB text corpus of the benchmark:
+    #   level 1-3: greedy, up to 1.7x faster than level 4, 3-9% larger
+    #   level 4: greedy, same as no level
+    #   level 5-7: lazy, 1.6-3x slower than level 4, 2-7% smaller
+    #   level 8-9: optimal, 8-20x slower than level 4, 10-14% smaller
+    LEVELS = {
+        1: (4, GREEDY),
+        2: (8, GREEDY),
+        3: (16, GREEDY),
+        4: (32, GREEDY),
+        5: (32, LAZY),
+        6: (64, LAZY),
+        7: (128, LAZY),
+        8: (64, OPTIMAL),
+        9: (256, OPTIMAL),
+    }
+
+    # a match that is at least this long is taken as it is by the lazy and
+    # optimal strategies, since a better choice around it saves little
+    NICE_LENGTH = 32
+
+    # number of the bytes parsed at once by the optimal strategy
+    OPTIMAL_SPAN = 1 << 16
+
     @staticmethod
-    def encode(file_path: str, save_path: str):
-        with open(file_path, 'rb') as file:
-            bytes_ = file.read()
-            encoded_bytes = bytearray()
+    def encode(file_path: str, save_path: str,
+               token_format: int = FORMAT_TRIPLE, max_chain: int = None,
+               progress: Progress = None, level: int = None,
+               dictionary: bytes = None):
+        # the mapped file is searched in place without a copy
+        with map_file(file_path) as bytes_:
+            write_stream([Lz77.compress(
+                bytes_, token_format, max_chain, progress, level, dictionary
+            )], save_path)
+
+    @staticmethod
+    def decode(file_path: str, save_path: str,
+               token_format: int = FORMAT_TRIPLE, progress: Progress = None,
+               dictionary: bytes = None):
+        with map_file(file_path) as bytes_:
+            write_stream([Lz77.decompress(
+                bytes_, token_format, progress, dictionary
+            )], save_path)
+
+    @staticmethod
+    def compress(bytes_, token_format: int = FORMAT_TRIPLE,
+                 max_chain: int = None, progress: Progress = None,
+                 level: int = None, dictionary: bytes = None) -> bytes:
+        bytes_ = byte_view(bytes_)
+
+        if progress is not None and progress.total is None:
+            progress.total = len(bytes_)
+
+        # a dictionary is put before the bytes as their window, so the
+        # first bytes can be matched too; the decoder must use the same one
+        prime = Lz77._prime(dictionary, token_format)
+
+        if prime:
+            bytes_ = prime + bytes(bytes_)
+
+        # bytes, bytearray and memoryview are searched in place, only the
+        # literals are copied to the output
+        encoded_bytes, _ = Lz77._encode_range(
+            bytes_, len(prime), len(bytes_), token_format, max_chain,
+            progress, -len(prime), level, len(prime),
+        )
+
+        if progress is not None:
+            progress.update('lz77', len(bytes_) - len(prime))
+
+        return bytes(encoded_bytes)
+
+    @staticmethod
+    def decompress(bytes_, token_format: int = FORMAT_TRIPLE,
+                   progress: Progress = None,
+                   dictionary: bytes = None) -> bytes:
+        prime = Lz77._prime(dictionary, token_format)
+        decoded_bytes = bytearray(prime)
+
+        if progress is None:
+            used = Lz77._decode_into(bytes_, decoded_bytes, token_format)
+        else:
+            if progress.total is None:
+                progress.total = len(bytes_)
+
+            # the bytes are decoded a part at a time to report the progress,
+            # a token that doesn't end in a part is decoded with the next
+            encoded_bytes = memoryview(bytes_)
+            used = 0
+            end = 0
+
+            while end < len(encoded_bytes):
+                end = min(end + progress.interval, len(encoded_bytes))
+                used += Lz77._decode_into(
+                    encoded_bytes[used:end], decoded_bytes, token_format
+                )
+
+                progress.update('lz77', used)
+
+        if used != len(bytes_):
+            raise ValueError('lz77 stream ends in the middle of a token')
+
+        del decoded_bytes[:len(prime)]
+
+        return bytes(decoded_bytes)
+
+    @staticmethod
+    def _prime(dictionary: bytes, token_format: int) -> bytes:
+        # only the end of a dictionary fits in the window of the format
+        if not dictionary:
+            return b''
+
+        return bytes(dictionary[-Lz77._window_size(token_format):])
+
+    @staticmethod
+    def _encode_range(bytes_, start: int, end: int, token_format: int,
+                      max_chain: int = None, progress: Progress = None,
+                      offset: int = 0, level: int = None,
+                      primed: int = 0) -> Tuple[bytearray, int]:
+        # encode the tokens that start between `start` and `end`, bytes
+        # before the start are used as the window; progress is reported
+        # as the index plus the offset; `primed` is the size of the
+        # dictionary at the start of the bytes
+        level_chain, strategy = Lz77._level(level)
+
+        if token_format == Lz77.FORMAT_TRIPLE:
+            # a window of 255 bytes never holds more than 255 candidates,
+            # so the default chain depth keeps the search exhaustive
+            finder = Lz77._finder(
+                bytes_, start, token_format,
+                max_chain or level_chain or 256, primed,
+            )
+
+            return Lz77._encode_triples(
+                bytes_, start, end, finder, progress, offset
+            )
+
+        if token_format == Lz77.FORMAT_COMPACT:
+            finder = Lz77._finder(
+                bytes_, start, token_format,
+                max_chain or level_chain or Lz77.MAX_CHAIN, primed,
+            )
+
+            if strategy == Lz77.OPTIMAL:
+                return Lz77._encode_optimal(
+                    bytes_, start, end, finder, progress, offset
+                )
+
+            return Lz77._encode_compact(
+                bytes_, start, end, finder, progress, offset,
+                strategy == Lz77.LAZY,
+            )
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def _finder(bytes_, start: int, token_format: int, max_chain: int,
+                primed: int = 0) -> _HashChain:
+        # the chain of a window that is only a dictionary is copied from
+        # the cached chain of the dictionary instead of being inserted
+        # again, so a small input doesn't pay for the whole dictionary
+        if primed and start == primed:
+            finder = _primed_chain(bytes(bytes_[:primed]), token_format)
+            finder = finder.copy(bytes_)
+            finder.max_chain = max_chain
+
+            return finder
+
+        if token_format == Lz77.FORMAT_TRIPLE:
+            return _HashChain(
+                bytes_, window_size=255, max_chain=max_chain, start=start
+            )
+
+        return _HashChain(
+            bytes_,
+            window_size=Lz77.WINDOW_SIZE,
+            max_chain=max_chain,
+            min_match=Lz77.MIN_MATCH,
+            start=start,
+        )
+
+    @staticmethod
+    def _level(level: int) -> Tuple[int, int]:
+        # returns the max chain and the strategy of a level, no level has
+        # no max chain so the format uses its own
+        if level is None:
+            return None, Lz77.GREEDY
+
+        if level not in Lz77.LEVELS:
+            raise ValueError(f'unknown compression level: {level}')
+
+        return Lz77.LEVELS[level]
+
+    @staticmethod
+    def _decode_into(bytes_, decoded_bytes: bytearray,
+                     token_format: int) -> int:
+        # decode all complete tokens to the end of the decoded bytes,
+        # returns the number of the bytes that are used
+        if token_format == Lz77.FORMAT_TRIPLE:
+            return Lz77._decode_triples(bytes_, decoded_bytes)
+
+        if token_format == Lz77.FORMAT_COMPACT:
+            return Lz77._decode_compact(bytes_, decoded_bytes)
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def _window_size(token_format: int) -> int:
+        if token_format == Lz77.FORMAT_TRIPLE:
+            return 255
+
+        if token_format == Lz77.FORMAT_COMPACT:
+            return Lz77.WINDOW_SIZE
+
+        raise ValueError(f'unknown lz77 token format: {token_format}')
+
+    @staticmethod
+    def encode_stream(source, token_format: int = FORMAT_COMPACT,
+                      max_chain: int = None, progress: Progress = None,
+                      level: int = None,
+                      dictionary: bytes = None) -> Iterator[bytes]:
+        encoder = Lz77Encoder(
+            token_format, max_chain, progress, level, dictionary
+        )
+
+        for chunk in iter_chunks(source):
+            encoded_bytes = encoder.encode(chunk)
+
+            if encoded_bytes:
+                yield encoded_bytes
+
+        encoded_bytes = encoder.flush()
+
+        if encoded_bytes:
+            yield encoded_bytes
+
+    @staticmethod
+    def decode_stream(source, token_format: int = FORMAT_COMPACT,
+                      progress: Progress = None,
+                      dictionary: bytes = None) -> Iterator[bytes]:
+        decoder = Lz77Decoder(token_format, dictionary)
+        done = 0
+
+        for chunk in iter_chunks(source):
+            decoded_bytes = decoder.decode(chunk)
+
+            if progress is not None:
+                done += len(chunk)
+                progress.update('lz77', done)
+
+            if decoded_bytes:
+                yield decoded_bytes
+
+        decoded_bytes = decoder.flush()
+
+        if decoded_bytes:
+            yield decoded_bytes
+
+    @staticmethod
+    def _encode_triples(bytes_, i: int, end: int, finder: _HashChain,
+                        progress: Progress = None,
+                        offset: int = 0) -> Tuple[bytearray, int]:
+        # encode the tokens that start before `end`, returns the encoded
+        # bytes and the index of the next token
+        encoded_bytes = bytearray()
+
+        # index of the next progress report, it is never reached if there
+        # isn't a progress, so the loop only pays for a comparison
+        report_index = i + progress.interval if progress is not None else end
+
+        while i < end:
+            if i >= report_index:
+                progress.update('lz77', offset + i)
+                report_index = i + progress.interval
+
+            # every byte before the current index must be searchable
+            finder.insert_until(i)
+
+            # the length musn't reach the last byte, so there is always
+            # a next byte to write and musn't be greater than 255, so
+            # it can fit in one byte
+            max_length = min(len(bytes_) - i - 1, 255)
+
+            # distance between current index and matched pointer and
+            # length of the matched pointer
+            match_distance, match_length = finder.longest_match(
+                i, max_length
+            )
+
+            # increase index by length of the matched byte
+            i += match_length
+
+            # get the next byte from byte
+            next_byte = bytes_[i]
+
+            # add the distance, length and next byte to the list
+            encoded_bytes.append(match_distance)
+            encoded_bytes.append(match_length)
+            encoded_bytes.append(next_byte)
+
+            i += 1
+
+        return encoded_bytes, i
+
+    @staticmethod
+    def _decode_triples(bytes_, decoded_bytes: bytearray) -> int:
+        # decode all complete triples to the decoded bytes, returns the
+        # number of the bytes that are used
+        end = len(bytes_) - len(bytes_) % 3
+
+        for i in range(0, end, 3):
+            # get distance, length and next byte from
+            # the file in the fixed order
+            distance, length, next_byte = bytes_[i:i + 3]
+
+            # if it is a pointer to the past byte
+            if (distance != 0):
+                # take `length` bytes from `distance` bytes before the end
+                _copy_match(decoded_bytes, distance, length)
+
+            # add next byte to the list
+            decoded_bytes.append(next_byte)
+
+        return end
+
+    @staticmethod
+    def _write_sequence(encoded_bytes: bytearray, bytes_, literal_start: int,
+                        literal_end: int, match_distance: int,
+                        match_length: int):
+        # a sequence is written as a token byte, literal bytes, distance
+        # and the rest of the length; the high 4 bits of the token is the
+        # number of literals and the low 4 bits is the match length, value
+        # 15 means that the rest of the number is written after as a varint
+        literal_count = literal_end - literal_start
+        length_code = match_length - Lz77.MIN_MATCH if match_distance else 0
+
+        encoded_bytes.append(
+            (min(literal_count, 15) << 4) | min(length_code, 15)
+        )
+
+        if literal_count >= 15:
+            write_varint(encoded_bytes, literal_count - 15)
+
+        encoded_bytes.extend(bytes_[literal_start:literal_end])
+
+        # distance 0 is the end sign of the sequences
+        write_varint(encoded_bytes, match_distance)
+
+        if length_code >= 15:
+            write_varint(encoded_bytes, length_code - 15)
+
+    @staticmethod
+    def _encode_compact(bytes_, i: int, end: int, finder: _HashChain,
+                        progress: Progress = None, offset: int = 0,
+                        lazy: bool = False) -> Tuple[bytearray, int]:
+        # encode the sequences that start before `end`, matches can use the
+        # bytes after it; returns the encoded bytes and the next index
+        encoded_bytes = bytearray()
+
+        # start of the literals that aren't written yet
+        literal_start = i
+
+        # index of the next progress report, it is never reached if there
+        # isn't a progress, so the loop only pays for a comparison
+        report_index = i + progress.interval if progress is not None else end
+
+        while i < end:
+            if i >= report_index:
+                progress.update('lz77', offset + i)
+                report_index = i + progress.interval
+
+            finder.insert_until(i)
+
+            match_distance, match_length = finder.longest_match(
+                i, min(len(bytes_) - i, Lz77.MAX_MATCH),
+                min(len(bytes_) - i, Lz77.MAX_RUN),
+            )
+
+            # if there isn't a match, leave the byte to the next literal run
+            if match_length < Lz77.MIN_MATCH:
+                i += 1
+                continue
+
+            # a longer match at the next index makes the current byte a
+            # literal, this is repeated while the matches get longer
+            while lazy and match_length < Lz77.NICE_LENGTH and i + 1 < end:
+                finder.insert_until(i + 1)
+
+                next_distance, next_length = finder.longest_match(
+                    i + 1, min(len(bytes_) - i - 1, Lz77.MAX_MATCH),
+                    min(len(bytes_) - i - 1, Lz77.MAX_RUN),
+                )
+
+                if next_length <= match_length:
+                    break
+
+                i += 1
+                match_distance, match_length = next_distance, next_length
+
+            Lz77._write_sequence(
+                encoded_bytes, bytes_, literal_start, i,
+                match_distance, match_length,
+            )
+
+            i += match_length
+            literal_start = i
+
+        # write the remaining literals with the end sign, so the sequences
+        # of the next bytes can be written after as a new group
+        Lz77._write_sequence(encoded_bytes, bytes_, literal_start, i, 0, 0)
+
+        return encoded_bytes, i
+
+    @staticmethod
+    def _encode_optimal(bytes_, i: int, end: int, finder: _HashChain,
+                        progress: Progress = None,
+                        offset: int = 0) -> Tuple[bytearray, int]:
+        # same as the compact encoder, but the sequences of every span are
+        # chosen by the optimal parse of the span
+        encoded_bytes = bytearray()
+
+        literal_start = i
+        report_index = i + progress.interval if progress is not None else end
+
+        while i < end:
+            if i >= report_index:
+                progress.update('lz77', offset + i)
+                report_index = i + progress.interval
+
+            for match_distance, match_length in Lz77._optimal_parse(
+                bytes_, finder, i, min(i + Lz77.OPTIMAL_SPAN, end)
+            ):
+                if not match_distance:
+                    i += 1
+                    continue
+
+                Lz77._write_sequence(
+                    encoded_bytes, bytes_, literal_start, i,
+                    match_distance, match_length,
+                )
 
-            # index
-            i = 0
-            while i < len(bytes_):
-                # distance between current index and matched pointer
-                match_distance = 0
-
-                # length of the matched pointer
-                match_length = 0
-
-                # search index
-                for j in range(max(0, i - 255), i):
-                    # the lookahead index for continues byte group
-                    k = 0
-
-                    # conditions for increasing the lookahead index
-                    while all([
-                        # the lookahead index musn't be greater than
-                        # the number of byte after i, so decoder won't
-                        #  give an index error
-                        (k < len(bytes_) - i - 1),
-
-                        # lookahead index musn't be greater than 255,
-                        # so it can fit in one byte
-                        (k < 256),
-
-                        # sum of the lookahead index and the search index
-                        # musn't be greater than current index, so decoder
-                        # won't try to access not loaded byte
-                        # after current index
-                        (j + k < i),
-
-                        # look after the current index and the search index,
-                        # they must be same
-                        (bytes_[i + k] == bytes_[j + k]),
-                    ]):
-                        # +1 -> indexes starts from 0, lengths starts from 1
-                        length = k + 1
-
-                        # distance -> current index - search index
-                        distance = i - j
-
-                        # get pointer that has max length
-                        if (length >= match_length):
-                            match_length = length
-                            match_distance = distance
-
-                        k += 1
-
-                # increase index by length of the matched byte
                 i += match_length
+                literal_start = i
+
+        Lz77._write_sequence(encoded_bytes, bytes_, literal_start, i, 0, 0)
+
+        return encoded_bytes, i
+
+    @staticmethod
+    def _optimal_parse(bytes_, finder: _HashChain, start: int,
+                       end: int) -> List[Tuple[int, int]]:
+        # returns the (distance, length) steps with the lowest estimated
+        # cost from the start to the end, distance 0 is a literal; every
+        # shorter length of the longest match at an index is a candidate;
+        # only a long match can pass the end, then the span ends after it
+        size = end - start
+
+        # the lowest cost to reach every index of the span and the last
+        # step of it
+        costs = [0] + [_MAX_COST] * size
+        distances = [0] * (size + 1)
+        lengths = [0] * (size + 1)
+
+        p = 0
+
+        while p < size:
+            cost = costs[p]
+
+            if cost + _LITERAL_COST < costs[p + 1]:
+                costs[p + 1] = cost + _LITERAL_COST
+                distances[p + 1] = 0
+                lengths[p + 1] = 1
+
+            finder.insert_until(start + p)
+
+            left = len(bytes_) - start - p
 
-                # get the next byte from byte
-                next_byte = bytes_[i]
+            match_distance, match_length = finder.longest_match(
+                start + p, min(left, Lz77.MAX_MATCH), min(left, Lz77.MAX_RUN)
+            )
 
-                # add the distance, length and next byte to the list
-                encoded_bytes.append(match_distance)
-                encoded_bytes.append(match_length)
-                encoded_bytes.append(next_byte)
+            if match_length < Lz77.NICE_LENGTH:
+                match_length = min(match_length, size - p)
 
+            if match_length < Lz77.MIN_MATCH:
+                p += 1
+                continue
+
+            cost += _value_cost(match_distance - 1)
+
+            # a long match is taken as it is and the indexes in it aren't
+            # searched, so long runs don't cost a search for every byte
+            if match_length >= Lz77.NICE_LENGTH:
+                q = p + match_length
+                cost += _value_cost(match_length - Lz77.MIN_MATCH)
+
+                if q > size:
+                    costs += [_MAX_COST] * (q - size)
+                    distances += [0] * (q - size)
+                    lengths += [0] * (q - size)
+                    size = q
+
+                if cost < costs[q]:
+                    costs[q] = cost
+                    distances[q] = match_distance
+                    lengths[q] = match_length
+
+                p = q
+                continue
+
+            for length in range(Lz77.MIN_MATCH, match_length + 1):
+                q = p + length
+                length_cost = cost + _LENGTH_COSTS[length]
+
+                if length_cost < costs[q]:
+                    costs[q] = length_cost
+                    distances[q] = match_distance
+                    lengths[q] = length
+
+            p += 1
+
+        # follow the last steps back from the end
+        steps = []
+
+        while size > 0:
+            steps.append((distances[size], lengths[size]))
+            size -= lengths[size]
+
+        steps.reverse()
+
+        return steps
+
+    @staticmethod
+    def _decode_compact(bytes_, decoded_bytes: bytearray) -> int:
+        # decode all complete sequences to the decoded bytes, returns the
+        # number of the bytes that are used
+        i = 0
+        used = 0
+
+        try:
+            while i < len(bytes_):
+                token = bytes_[i]
                 i += 1
-        
-        with open(save_path, 'wb') as save:
-            save.write(encoded_bytes)
-
-    @staticmethod
-    def decode(file_path: str, save_path: str):
-        with open(file_path, 'rb') as file:
-            decoded_bytes = bytearray()
-            
-            while True:
-                bytes_ = file.read(3)
-                
-                # if the file ends, stop reading
-                if not bytes_:
+
+                literal_count = token >> 4
+
+                if literal_count == 15:
+                    extra, i = read_varint(bytes_, i)
+                    literal_count += extra
+
+                literal_end = i + literal_count
+
+                # the sequence isn't complete yet
+                if literal_end > len(bytes_):
                     break
-                
-                # get distance, length and next byte from
-                # the file in the fixed order
-                distance, length, next_byte = bytes_
-                
-                # if it is a pointer to the past byte
-                if (distance != 0):
-                    # the start of the byte
-                    start = len(decoded_bytes) - distance
-
-                    # skip to the `start` and take the first `length` byte
-                    bytes_ = decoded_bytes[start: start + length]
-
-                    decoded_bytes.extend(bytes_)
-
-                # add next byte to the list
-                decoded_bytes.append(next_byte)
-        
-        with open(save_path, 'wb') as save:
-            save.write(decoded_bytes)
+
+                literals = bytes_[i:literal_end]
+                i = literal_end
+
+                match_distance, i = read_varint(bytes_, i)
+                length_code = token & 15
+
+                # distance 0 is the end sign of the sequences
+                if match_distance and length_code == 15:
+                    extra, i = read_varint(bytes_, i)
+                    length_code += extra
+
+                decoded_bytes.extend(literals)
+
+                if match_distance:
+                    _copy_match(
+                        decoded_bytes, match_distance,
+                        length_code + Lz77.MIN_MATCH,
+                    )
+
+                used = i
+        except IndexError:
+            # a varint of the last sequence isn't complete yet
+            pass
+
+        return used
+
+    @staticmethod
+    def _iter_sequences(bytes_) -> Iterator[Tuple[int, int, int, int]]:
+        # yields the literal start, literal end, match distance and match
+        # length of every compact sequence without decoding the matches,
+        # distance 0 is the end sign of the sequences
+        i = 0
+
+        try:
+            while i < len(bytes_):
+                token = bytes_[i]
+                i += 1
+
+                literal_count = token >> 4
+
+                if literal_count == 15:
+                    extra, i = read_varint(bytes_, i)
+                    literal_count += extra
+
+                literal_start = i
+                i += literal_count
+
+                match_distance, i = read_varint(bytes_, i)
+                length_code = token & 15
+
+                if not match_distance:
+                    yield literal_start, literal_start + literal_count, 0, 0
+                    continue
+
+                if length_code == 15:
+                    extra, i = read_varint(bytes_, i)
+                    length_code += extra
+
+                yield (literal_start, literal_start + literal_count,
+                       match_distance, length_code + Lz77.MIN_MATCH)
+        except IndexError:
+            raise ValueError('lz77 stream ends in the middle of a token')
+
+
+# costs of the match lengths that the optimal parse tries at every index
+_LENGTH_COSTS = [
+    _value_cost(length - Lz77.MIN_MATCH) if length >= Lz77.MIN_MATCH else 0
+    for length in range(Lz77.NICE_LENGTH)
+]
+
+
+@lru_cache(maxsize=8)
+def _primed_chain(prime: bytes, token_format: int) -> _HashChain:
+    # the last 2 positions of a dictionary are inserted with the bytes
+    # after them, since their prefixes continue in those bytes
+    chain = Lz77._finder(prime, 0, token_format, 0)
+    chain.insert_until(len(prime) - 2)
+
+    return chain
+
+
+class Lz77Encoder:
+    def __init__(self, token_format: int = Lz77.FORMAT_COMPACT,
+                 max_chain: int = None, progress: Progress = None,
+                 level: int = None, dictionary: bytes = None):
+        self.token_format = token_format
+        self.max_chain = max_chain
+        self.progress = progress
+        self.level = level
+
+        # an unknown level fails before any byte is encoded
+        Lz77._level(level)
+        self.window_size = Lz77._window_size(token_format)
+
+        # a triple needs the byte after the longest match
+        if token_format == Lz77.FORMAT_TRIPLE:
+            self.lookahead = 256
+        else:
+            self.lookahead = Lz77.MAX_MATCH
+
+        # the window of the encoded bytes and the bytes that are waiting
+        # for enough lookahead bytes to be encoded, a dictionary starts
+        # the window
+        self.buffer = bytearray(Lz77._prime(dictionary, token_format))
+
+        # index of the next byte to encode in the buffer
+        self.index = len(self.buffer)
+
+        # number of the bytes that are removed from the start of the buffer,
+        # the dictionary isn't counted as removed bytes
+        self.offset = -len(self.buffer)
+
+        # size of the dictionary until the first bytes are encoded
+        self.primed = len(self.buffer)
+
+    def encode(self, bytes_) -> bytes:
+        # remove the bytes that can't be matched anymore, they are removed
+        # before the new bytes are added so the bytes encoded by the last
+        # call stay in the buffer until the next one
+        drop = max(0, self.index - self.window_size)
+        del self.buffer[:drop]
+        self.index -= drop
+        self.offset += drop
+
+        self.buffer += bytes_
+
+        # encode the bytes that have enough bytes after them to find
+        # the longest match
+        end = len(self.buffer) - self.lookahead
+
+        if end <= self.index:
+            return b''
+
+        encoded_bytes, self.index = Lz77._encode_range(
+            self.buffer, self.index, end, self.token_format, self.max_chain,
+            self.progress, self.offset, self.level, self.primed,
+        )
+        self.primed = 0
+
+        return bytes(encoded_bytes)
+
+    def store(self, bytes_) -> bytes:
+        # the bytes are given to the decoder as they are, so they are only
+        # added to the window; the waiting bytes are encoded before them
+        encoded_bytes = self.flush()
+
+        drop = max(0, self.index - self.window_size)
+        del self.buffer[:drop]
+        self.offset += drop
+
+        self.buffer += bytes_
+        self.index = len(self.buffer)
+
+        return encoded_bytes
+
+    def input_bytes(self, position: int) -> bytes:
+        # returns the input bytes from the position to the next byte to
+        # encode, the position is counted like the offset and must be in
+        # the bytes encoded by the last call
+        return bytes(self.buffer[position - self.offset:self.index])
+
+    def flush(self) -> bytes:
+        # encode all remaining bytes
+        if self.index >= len(self.buffer):
+            self.primed = 0
+            return b''
+
+        encoded_bytes, self.index = Lz77._encode_range(
+            self.buffer, self.index, len(self.buffer),
+            self.token_format, self.max_chain, self.progress, self.offset,
+            self.level, self.primed,
+        )
+        self.primed = 0
+
+        return bytes(encoded_bytes)
+
+
+class Lz77Decoder:
+    def __init__(self, token_format: int = Lz77.FORMAT_COMPACT,
+                 dictionary: bytes = None):
+        self.token_format = token_format
+        self.window_size = Lz77._window_size(token_format)
+
+        # the encoded bytes of a token that isn't complete yet
+        self.pending = bytearray()
+
+        # the decoded bytes that may be referenced by the next tokens, a
+        # dictionary starts the window but isn't given as decoded bytes
+        self.window = bytearray(Lz77._prime(dictionary, token_format))
+        self.skip = len(self.window)
+
+    def decode(self, bytes_) -> bytes:
+        if self.pending:
+            self.pending += bytes_
+            bytes_ = self.pending
+
+        used = Lz77._decode_into(bytes_, self.window, self.token_format)
+        self.pending = bytearray(bytes_[used:])
+
+        return self._take()
+
+    def append(self, bytes_) -> bytes:
+        # decoded bytes that are given as they are, like the bytes given to
+        # `Lz77Encoder.store`
+        if self.pending:
+            raise ValueError('lz77 stream ends in the middle of a token')
+
+        self.window += bytes_
+
+        return self._take()
+
+    def _take(self) -> bytes:
+        # give the decoded bytes that are out of the window
+        flush = len(self.window) - self.window_size
+
+        if flush <= 0:
+            return b''
+
+        decoded_bytes = bytes(self.window[min(self.skip, flush):flush])
+        del self.window[:flush]
+        self.skip = max(0, self.skip - flush)
+
+        return decoded_bytes
+
+    def flush(self) -> bytes:
+        if self.pending:
+            raise ValueError('lz77 stream ends in the middle of a token')
+
+        decoded_bytes = bytes(self.window[self.skip:])
+        self.window.clear()
+        self.skip = 0
+
+        return decoded_bytes
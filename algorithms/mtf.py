@@ -0,0 +1,40 @@
+from .stream import byte_view
+
+
+class Mtf:
+    def __new__(cls): pass
+
+    # move to front gives every byte its position in a list of the bytes
+    # that were used last, so the repeated bytes of a bwt output become
+    # small numbers that the entropy stage codes in a few bits
+
+    @staticmethod
+    def compress(bytes_) -> bytes:
+        bytes_ = byte_view(bytes_)
+        order = list(range(256))
+        encoded_bytes = bytearray(len(bytes_))
+
+        for i, byte in enumerate(bytes_):
+            position = order.index(byte)
+            encoded_bytes[i] = position
+
+            if position:
+                del order[position]
+                order.insert(0, byte)
+
+        return bytes(encoded_bytes)
+
+    @staticmethod
+    def decompress(bytes_) -> bytes:
+        order = list(range(256))
+        decoded_bytes = bytearray(len(bytes_))
+
+        for i, position in enumerate(bytes_):
+            byte = order[position]
+            decoded_bytes[i] = byte
+
+            if position:
+                del order[position]
+                order.insert(0, byte)
+
+        return bytes(decoded_bytes)
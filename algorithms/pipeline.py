@@ -0,0 +1,245 @@
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .bwt import Bwt
+from .entropy import Entropy
+from .huffman import Huffman
+from .lz77 import Lz77
+from .mtf import Mtf
+from .rle import Rle
+from .stats import Stats
+from .stream import byte_view
+
+
+class Stage:
+    # a reversible transform of bytes, a chain of stages codes a block by
+    # running their encoders in order and is decoded by running their
+    # decoders in reverse; the id is written to the header of the files
+    # coded with the stage, so it must never change
+    def __init__(self, stage_id: int, name: str,
+                 encode: Callable[[bytes, Optional[int]], bytes],
+                 decode: Callable[[bytes], bytes], after: str = None):
+        if not 0 < stage_id < 256:
+            raise ValueError('stage id must be between 1 and 255')
+
+        self.id = stage_id
+        self.name = name
+
+        # the encoder is given the compression level, stages without
+        # levels ignore it
+        self.encode = encode
+        self.decode = decode
+
+        # the stage whose output this stage needs as its input, like the
+        # tables of the lz77 tokens
+        self.after = after
+
+
+def _lz77_encode(bytes_, level: int = None) -> bytes:
+    return Lz77.compress(bytes_, Lz77.FORMAT_COMPACT, level=level)
+
+
+def _lz77_decode(bytes_) -> bytes:
+    return Lz77.decompress(bytes_, Lz77.FORMAT_COMPACT)
+
+
+def _entropy_encode(bytes_, level: int = None) -> bytes:
+    return Entropy.compress(bytes_, Lz77.FORMAT_COMPACT)
+
+
+def _entropy_decode(bytes_) -> bytes:
+    return Entropy.decompress(bytes_, Lz77.FORMAT_COMPACT)
+
+
+def _huffman_encode(bytes_, level: int = None) -> bytes:
+    return Huffman.compress(bytes_)
+
+
+def _rle_encode(bytes_, level: int = None) -> bytes:
+    return Rle.compress(bytes_)
+
+
+def _bwt_encode(bytes_, level: int = None) -> bytes:
+    return Bwt.compress(bytes_)
+
+
+def _mtf_encode(bytes_, level: int = None) -> bytes:
+    return Mtf.compress(bytes_)
+
+
+class Pipeline:
+    def __new__(cls): pass
+
+    # registered stages by their ids and by their names
+    STAGES: Dict[int, Stage] = {}
+    NAMES: Dict[str, Stage] = {}
+
+    # the number of stages fits in a byte of the header, but every stage
+    # after the first few only costs time
+    MAX_STAGES = 8
+
+    # chains that the auto mode tries, lz77 with the tables of its tokens
+    # is the chain of the files without stages
+    CHAINS = [
+        ('lz77', 'entropy'),
+        ('bwt', 'mtf', 'rle', 'huffman'),
+        ('rle', 'lz77', 'entropy'),
+        ('rle', 'huffman'),
+        ('huffman',),
+    ]
+
+    # the auto mode codes this many samples of this size from the input
+    # with every chain
+    SAMPLE_COUNT = 4
+    SAMPLE_SIZE = 1 << 13
+
+    @staticmethod
+    def register(stage: Stage):
+        if stage.id in Pipeline.STAGES or stage.name in Pipeline.NAMES:
+            raise ValueError(f'stage {stage.name} is already registered')
+
+        Pipeline.STAGES[stage.id] = stage
+        Pipeline.NAMES[stage.name] = stage
+
+    @staticmethod
+    def stage_ids(names: Sequence[str]) -> List[int]:
+        # checks the chain and returns the ids of its stages
+        if not 0 < len(names) <= Pipeline.MAX_STAGES:
+            raise ValueError(
+                f'a chain must have 1 to {Pipeline.MAX_STAGES} stages'
+            )
+
+        ids = []
+        previous = None
+
+        for name in names:
+            stage = Pipeline.NAMES.get(name)
+
+            if stage is None:
+                raise ValueError(f'unknown stage: {name}')
+
+            if stage.after is not None and stage.after != previous:
+                raise ValueError(f'stage {name} must follow {stage.after}')
+
+            ids.append(stage.id)
+            previous = name
+
+        return ids
+
+    @staticmethod
+    def stage_names(ids: Sequence[int]) -> List[str]:
+        names = []
+
+        for stage_id in ids:
+            stage = Pipeline.STAGES.get(stage_id)
+
+            if stage is None:
+                raise ValueError(f'unknown stage id: {stage_id}')
+
+            names.append(stage.name)
+
+        return names
+
+    @staticmethod
+    def compress(bytes_, stages: Sequence[str], level: int = None,
+                 stats: Stats = None) -> bytes:
+        bytes_ = byte_view(bytes_)
+
+        for name in stages:
+            stage = Pipeline.NAMES[name]
+
+            if stats is not None:
+                clock = stats.clock()
+
+            try:
+                encoded_bytes = stage.encode(bytes_, level)
+            except Exception as e:
+                raise Exception(f'error in {name} encode: {e}')
+
+            if stats is not None:
+                stats.add(name, clock, len(bytes_), len(encoded_bytes))
+
+            bytes_ = encoded_bytes
+
+        return bytes_
+
+    @staticmethod
+    def decompress(bytes_, stages: Sequence[str],
+                   stats: Stats = None) -> bytes:
+        for name in reversed(stages):
+            stage = Pipeline.NAMES[name]
+
+            if stats is not None:
+                clock = stats.clock()
+
+            try:
+                decoded_bytes = stage.decode(bytes_)
+            except Exception as e:
+                raise Exception(f'error in {name} decode: {e}')
+
+            if stats is not None:
+                stats.add(name, clock, len(bytes_), len(decoded_bytes))
+
+            bytes_ = decoded_bytes
+
+        return bytes_
+
+    @staticmethod
+    def select(bytes_, min_speed: float = None,
+               chains: Sequence[Sequence[str]] = None) -> List[str]:
+        # codes samples of the input with every chain and returns the one
+        # with the smallest output among the chains that encode at least
+        # `min_speed` MB/s, or the fastest chain if none of them do
+        sample = Pipeline._sample(bytes_)
+        chains = chains or Pipeline.CHAINS
+
+        if not sample:
+            return list(chains[0])
+
+        results = []
+
+        for chain in chains:
+            start = time.perf_counter()
+            size = len(Pipeline.compress(sample, chain))
+            seconds = time.perf_counter() - start
+
+            speed = len(sample) / max(seconds, 1e-9) / 1e6
+            results.append((size, -speed, list(chain)))
+
+        fast_results = [
+            result for result in results
+            if min_speed is None or -result[1] >= min_speed
+        ]
+
+        if fast_results:
+            return min(fast_results)[2]
+
+        return min(results, key=lambda result: result[1])[2]
+
+    @staticmethod
+    def _sample(bytes_) -> bytes:
+        # samples are spread over the input, an input that is smaller than
+        # all samples is the sample
+        size = Pipeline.SAMPLE_COUNT * Pipeline.SAMPLE_SIZE
+
+        if len(bytes_) <= size:
+            return bytes(bytes_)
+
+        step = len(bytes_) // Pipeline.SAMPLE_COUNT
+
+        return b''.join(
+            bytes(bytes_[i * step:i * step + Pipeline.SAMPLE_SIZE])
+            for i in range(Pipeline.SAMPLE_COUNT)
+        )
+
+
+# the ids of the built in stages
+for _stage in (
+    Stage(1, 'lz77', _lz77_encode, _lz77_decode),
+    Stage(2, 'entropy', _entropy_encode, _entropy_decode, after='lz77'),
+    Stage(3, 'huffman', _huffman_encode, Huffman.decompress),
+    Stage(4, 'rle', _rle_encode, Rle.decompress),
+    Stage(5, 'bwt', _bwt_encode, Bwt.decompress),
+    Stage(6, 'mtf', _mtf_encode, Mtf.decompress),
+):
+    Pipeline.register(_stage)
@@ -0,0 +1,78 @@
+import time
+from typing import Callable, Dict, Optional
+
+
+# number of input bytes processed between two reports of a stage
+INTERVAL = 1 << 18
+
+
+class Cancelled(BaseException):
+    # derives from BaseException like KeyboardInterrupt, so the stages
+    # don't wrap it as an error of the stage when they catch Exception
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        # the operation stops at its next progress report
+        self.cancelled = True
+
+
+class Progress:
+    def __init__(self, callback: Callable[['Progress'], None] = None,
+                 cancel_token: CancelToken = None, interval: int = INTERVAL,
+                 total: int = None):
+        # the callback is called with this object at every report, done and
+        # total are counted in the input bytes of the operation
+        self.callback = callback
+        self.cancel_token = cancel_token
+        self.interval = interval
+        self.total = total
+
+        self.stage: str = None
+        self.done = 0
+
+        # seconds spent in every stage
+        self.timings: Dict[str, float] = {}
+
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+
+    def update(self, stage: str, done: int):
+        # a stage reports the bytes it processed, the time since the last
+        # report is counted as the time of this stage
+        now = time.perf_counter()
+        self.timings[stage] = \
+            self.timings.get(stage, 0.0) + now - self.last_time
+        self.last_time = now
+
+        self.stage = stage
+        self.done = done
+
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise Cancelled('operation is cancelled')
+
+        if self.callback is not None:
+            self.callback(self)
+
+    def elapsed(self) -> float:
+        return self.last_time - self.start_time
+
+    def fraction(self) -> Optional[float]:
+        # None if the total isn't known
+        if not self.total:
+            return None
+
+        return min(self.done / self.total, 1.0)
+
+    def eta(self) -> Optional[float]:
+        # seconds left if the rest goes as fast as the processed bytes
+        fraction = self.fraction()
+
+        if not fraction:
+            return None
+
+        return self.elapsed() * (1 - fraction) / fraction
@@ -0,0 +1,57 @@
+import re
+
+from .stream import byte_view
+from .varint import read_varint, write_varint
+
+
+class Rle:
+    def __new__(cls): pass
+
+    # a run of the same byte is written as its first bytes and the number of
+    # the bytes after them as a varint; the decoder knows that a count
+    # follows when it reads this many equal bytes
+    RUN_SIZE = 4
+
+    # regexes scan the bytes in c, so only the runs are handled in python
+    _RUNS = re.compile(rb'(.)\1{%d,}' % (RUN_SIZE - 1), re.DOTALL)
+    _RUN_STARTS = re.compile(rb'(.)\1{%d}' % (RUN_SIZE - 1), re.DOTALL)
+
+    @staticmethod
+    def compress(bytes_) -> bytes:
+        bytes_ = byte_view(bytes_)
+        encoded_bytes = bytearray()
+        start = 0
+
+        # runs are found from left to right and are as long as possible, so
+        # the bytes between them never have a run
+        for run in Rle._RUNS.finditer(bytes_):
+            end = run.start() + Rle.RUN_SIZE
+            encoded_bytes += bytes_[start:end]
+            write_varint(encoded_bytes, run.end() - end)
+            start = run.end()
+
+        encoded_bytes += bytes_[start:]
+
+        return bytes(encoded_bytes)
+
+    @staticmethod
+    def decompress(bytes_) -> bytes:
+        decoded_bytes = bytearray()
+        start = 0
+
+        try:
+            while True:
+                run = Rle._RUN_STARTS.search(bytes_, start)
+
+                if run is None:
+                    break
+
+                decoded_bytes += bytes_[start:run.end()]
+                count, start = read_varint(bytes_, run.end())
+                decoded_bytes += run.group(1) * count
+        except IndexError:
+            raise ValueError('unexpected end of stream')
+
+        decoded_bytes += bytes_[start:]
+
+        return bytes(decoded_bytes)
@@ -0,0 +1,163 @@
+import json
+import time
+from typing import Dict, List
+
+from .lz77 import Lz77
+
+
+def _bucket(value: int) -> int:
+    # histograms count the values by the greatest power of two that isn't
+    # greater than them
+    return 1 << (value.bit_length() - 1)
+
+
+class Stats:
+    # opt-in measurements of an operation, the codecs only touch it between
+    # the stages of a block, so an operation without stats runs no extra
+    # code for its bytes or tokens; every stage has its wall time and the
+    # bytes it reads and writes
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.bytes_out: Dict[str, int] = {}
+
+        # number and encoded size of the blocks by their type
+        self.blocks: Dict[str, int] = {}
+        self.block_bytes: Dict[str, int] = {}
+
+        # lz77 tokens, a triple with a match counts as a match and a literal
+        self.literals = 0
+        self.matches = 0
+        self.match_lengths: Dict[int, int] = {}
+        self.match_distances: Dict[int, int] = {}
+
+        # bits and symbols that every huffman coder wrote or read, for the
+        # average code length
+        self.code_bits: Dict[str, int] = {}
+        self.code_symbols: Dict[str, int] = {}
+
+        # largest size that every buffer had
+        self.peak_buffers: Dict[str, int] = {}
+
+    @staticmethod
+    def clock() -> float:
+        return time.perf_counter()
+
+    def add(self, stage: str, start: float, bytes_in: int = 0,
+            bytes_out: int = 0) -> float:
+        # counts the time since the start as the time of the stage, returns
+        # the current time so the next stage can start from it
+        now = time.perf_counter()
+
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - start
+        self.bytes_in[stage] = self.bytes_in.get(stage, 0) + bytes_in
+        self.bytes_out[stage] = self.bytes_out.get(stage, 0) + bytes_out
+
+        return now
+
+    def buffer(self, name: str, size: int):
+        if size > self.peak_buffers.get(name, 0):
+            self.peak_buffers[name] = size
+
+    def count_block(self, block_type: str, size: int):
+        self.blocks[block_type] = self.blocks.get(block_type, 0) + 1
+        self.block_bytes[block_type] = \
+            self.block_bytes.get(block_type, 0) + size
+
+    def count_codes(self, coder: str, freqs: List[int], lengths: List[int]):
+        self.code_bits[coder] = self.code_bits.get(coder, 0) + sum(
+            freq * length for freq, length in zip(freqs, lengths)
+        )
+        self.code_symbols[coder] = \
+            self.code_symbols.get(coder, 0) + sum(freqs)
+
+    def count_tokens(self, bytes_, token_format: int):
+        if token_format == Lz77.FORMAT_TRIPLE:
+            for i in range(0, len(bytes_) - 2, 3):
+                distance = bytes_[i]
+
+                if distance:
+                    self._count_match(distance, bytes_[i + 1])
+
+                self.literals += 1
+            return
+
+        for literal_start, literal_end, match_distance, match_length \
+                in Lz77._iter_sequences(bytes_):
+            self.literals += literal_end - literal_start
+
+            if match_distance:
+                self._count_match(match_distance, match_length)
+
+    def _count_match(self, distance: int, length: int):
+        self.matches += 1
+
+        length = _bucket(length)
+        self.match_lengths[length] = self.match_lengths.get(length, 0) + 1
+
+        distance = _bucket(distance)
+        self.match_distances[distance] = \
+            self.match_distances.get(distance, 0) + 1
+
+    def merge(self, other: 'Stats'):
+        # adds the stats of another part of the operation, like a block that
+        # is encoded by another process
+        for name in (
+            'timings', 'bytes_in', 'bytes_out', 'blocks', 'block_bytes',
+            'match_lengths', 'match_distances', 'code_bits', 'code_symbols',
+        ):
+            counts = getattr(self, name)
+
+            for key, value in getattr(other, name).items():
+                counts[key] = counts.get(key, 0) + value
+
+        self.literals += other.literals
+        self.matches += other.matches
+
+        for name, size in other.peak_buffers.items():
+            self.buffer(name, size)
+
+    def to_dict(self) -> dict:
+        return {
+            'stages': {
+                stage: {
+                    'seconds': self.timings[stage],
+                    'bytes_in': self.bytes_in[stage],
+                    'bytes_out': self.bytes_out[stage],
+                }
+                for stage in self.timings
+            },
+            'blocks': {
+                block_type: {
+                    'count': count,
+                    'bytes': self.block_bytes[block_type],
+                }
+                for block_type, count in self.blocks.items()
+            },
+            'tokens': {
+                'literals': self.literals,
+                'matches': self.matches,
+                'match_lengths': {
+                    str(length): count
+                    for length, count in sorted(self.match_lengths.items())
+                },
+                'match_distances': {
+                    str(distance): count
+                    for distance, count
+                    in sorted(self.match_distances.items())
+                },
+            },
+            'average_code_length': {
+                coder: self.code_bits[coder] / self.code_symbols[coder]
+                for coder in self.code_bits if self.code_symbols[coder]
+            },
+            'peak_buffers': dict(self.peak_buffers),
+        }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def save(self, save_path: str):
+        with open(save_path, 'w') as save:
+            save.write(self.to_json())
+            save.write('\n')
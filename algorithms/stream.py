@@ -0,0 +1,231 @@
+import mmap
+import os
+import stat
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .varint import read_varint
+
+
+# number of bytes read from files and streams at once
+CHUNK_SIZE = 1 << 20
+
+
+def byte_view(bytes_):
+    # the codecs index and slice their input by bytes, a memoryview or an
+    # array of wider items is read through a view of its bytes
+    if isinstance(bytes_, (bytes, bytearray)):
+        return bytes_
+
+    return memoryview(bytes_).cast('B')
+
+
+def iter_chunks(source, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    # a bytes like object is a single chunk
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = byte_view(source)
+
+        if len(source):
+            yield source
+        return
+
+    # binary file like objects are read chunk by chunk
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+
+            if not chunk:
+                return
+
+            yield chunk
+
+    # otherwise the source must be an iterable of chunks
+    for chunk in source:
+        if chunk:
+            yield chunk
+
+
+def file_size(file) -> Optional[int]:
+    # the number of the bytes left in a regular file, None for pipes and
+    # other streams whose size isn't known before they are read
+    try:
+        info = os.fstat(file.fileno())
+    except (AttributeError, OSError):
+        return None
+
+    if not stat.S_ISREG(info.st_mode):
+        return None
+
+    return max(0, info.st_size - file.tell())
+
+
+def iter_sized(source, size: int) -> Iterator[bytes]:
+    # the first `size` bytes of the source, the bytes that a growing file
+    # gets after its size is taken are left for the next run
+    remaining = size
+
+    if remaining:
+        for chunk in iter_chunks(source, min(remaining, CHUNK_SIZE)):
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+            if not remaining:
+                break
+
+    if remaining:
+        raise ValueError('input ended before its size')
+
+
+def check_block_size(block_size: int):
+    # a block must have a byte, blocks of no bytes would never end the
+    # input
+    if block_size < 1:
+        raise ValueError('block size must be a positive integer')
+
+
+def iter_blocks(source, block_size: int) -> Iterator[bytes]:
+    # join or split the chunks of the source, so every block except the
+    # last one has exactly `block_size` bytes
+    check_block_size(block_size)
+    buffer = bytearray()
+
+    for chunk in iter_chunks(source, block_size):
+        buffer += chunk
+
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def write_stream(chunks, save_path: str):
+    # write to a temporary file first, so the source can be the same file
+    # and a failed operation doesn't leave a half written file behind
+    temp_path = save_path + '.tmp'
+
+    try:
+        with open(temp_path, 'wb') as save:
+            for chunk in chunks:
+                save.write(chunk)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, save_path)
+
+
+@contextmanager
+def map_file(file_path: str) -> Iterator[memoryview]:
+    # the file is mapped read only, so it is scanned in place and read by
+    # the page cache instead of being copied to a bytes object; an empty
+    # file can't be mapped, it is given as empty bytes
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+
+    try:
+        yield view
+    finally:
+        view.release()
+
+        # slices of the view that are still used keep the map open, it is
+        # closed when they are freed
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+
+
+@contextmanager
+def map_output(save_path: str, size: int) -> Iterator[memoryview]:
+    # the output is created with its final size and mapped, so the bytes
+    # are written to the page cache in place; like `write_stream`, it is
+    # written to a temporary file that replaces the save path at the end
+    temp_path = save_path + '.tmp'
+
+    try:
+        with open(temp_path, 'w+b') as save:
+            save.truncate(size)
+
+            if size == 0:
+                yield memoryview(bytearray())
+            else:
+                with mmap.mmap(save.fileno(), size) as mapped:
+                    with memoryview(mapped) as view:
+                        yield view
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, save_path)
+
+
+class ChunkReader:
+    def __init__(self, source, chunk_size: int = CHUNK_SIZE):
+        self.chunks = iter_chunks(source, chunk_size)
+        self.buffer = bytearray()
+
+        # number of the bytes read from the reader
+        self.position = 0
+
+    def _fill(self, size: int) -> bool:
+        # read chunks until the buffer has `size` bytes or the source ends
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+
+            if chunk is None:
+                return False
+
+            self.buffer += chunk
+
+        return True
+
+    def peek(self, size: int) -> bytes:
+        self._fill(size)
+        return bytes(self.buffer[:size])
+
+    def read(self, size: int = -1) -> bytes:
+        # read the next `size` bytes, less bytes are returned only if the
+        # source ends and all bytes are returned if the size is negative
+        if size < 0:
+            bytes_ = bytes(self.buffer) + b''.join(self.chunks)
+            self.buffer.clear()
+            self.position += len(bytes_)
+            return bytes_
+
+        self._fill(size)
+
+        bytes_ = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.position += len(bytes_)
+        return bytes_
+
+    def read_exact(self, size: int) -> bytes:
+        bytes_ = self.read(size)
+
+        if len(bytes_) < size:
+            raise ValueError('unexpected end of stream')
+
+        return bytes_
+
+    def read_varint(self) -> int:
+        # a varint is never longer than 10 bytes for 64 bit values
+        self._fill(10)
+
+        if not self.buffer:
+            raise ValueError('unexpected end of stream')
+
+        value, index = read_varint(self.buffer, 0)
+        del self.buffer[:index]
+        self.position += index
+        return value
@@ -0,0 +1,28 @@
+from typing import Tuple
+
+
+def write_varint(encoded_bytes: bytearray, value: int):
+    # write the value 7 bits at a time starting from the lowest bits,
+    # the highest bit of a byte shows that there are more bytes to read
+    while value >= 0x80:
+        encoded_bytes.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    encoded_bytes.append(value)
+
+
+def read_varint(bytes_, index: int) -> Tuple[int, int]:
+    # returns the value and the index of the byte after the value
+    value = 0
+    shift = 0
+
+    while True:
+        byte = bytes_[index]
+        index += 1
+
+        value |= (byte & 0x7f) << shift
+        shift += 7
+
+        # if the highest bit isn't set, this is the last byte of the value
+        if byte < 0x80:
+            return value, index
@@ -0,0 +1,623 @@
+from algorithms.anvil import Anvil
+from algorithms.progress import CancelToken, Cancelled, Progress
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty, Queue
+from typing import Dict, List, Tuple
+
+import tkinter as tk
+from tkinter import ttk
+
+from tkinter.filedialog import askopenfilename, asksaveasfilename
+from tkinter.filedialog import askopenfilenames, askdirectory
+from tkinter.messagebox import showwarning, showinfo, showerror
+
+from threading import Thread
+
+
+class AnvilApp(tk.Tk):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        # window settings
+        self.title('Anvil Kayıpsız Sıkıştırma')
+        self.resizable(False, False)
+        
+        # read "user guide" and "about" files
+        self.read_help_files()
+        
+        # set top bar menu
+        self.set_menu()
+        
+        # set encode - decode notebook
+        self.set_notebook()
+    
+    def read_help_files(self):
+        try:
+            with open('help/about.txt', 'r', encoding='utf-8') as f:
+                self.about_text = f.read()
+            
+        except FileNotFoundError as e:
+            showerror(
+                '"help/about.txt" yolunda "Hakkında" dosyası bulunamadı.\n'
+                'Lütfen dosyayı sağlayıp tekrar deneyiniz.'
+            )
+            raise e
+            
+        try:
+            with open('help/user_guide.txt', 'r', encoding='utf-8') as f:
+                self.user_guide_text = f.read()
+        except FileNotFoundError as e:
+            showerror(
+                '"help/user_guide.txt" yolunda "Kullanıcı Kılavuzu" dosyası '
+                'bulunamadı.\nLütfen dosyayı sağlayıp tekrar deneyiniz.'
+            )
+            raise e
+    
+    def set_notebook(self):
+        self.notebook = ttk.Notebook(self, width=500)
+        
+        self.encode_frame = FileFrame(
+            file_command=Anvil.encode, 
+            start_button_text="ENCODING'E BAŞLA",
+            file_types=[
+                ('Yazı Dosyaları', '.txt'),
+                ('Döküman Belgeleri', '.doc .docx'),
+            ],
+            file_default_type='.txt',
+            save_types=[('Anvil Dosyaları', '*.anvil')],
+            save_default_type='.anvil',
+        )
+        
+        self.decode_frame = FileFrame(
+            file_command=Anvil.decode, 
+            start_button_text="DECODING'E BAŞLA",
+            file_types=[('ANVIL Dosyaları', '.anvil')],
+            file_default_type='.anvil',
+            save_types=[
+                ('Yazı Dosyaları', '.txt'),
+                ('Döküman Belgeleri', '.doc .docx'),
+            ],
+            save_default_type='.txt',
+        )
+        
+        self.batch_frame = BatchFrame()
+        
+        self.notebook.add(self.encode_frame)
+        self.notebook.add(self.decode_frame)
+        self.notebook.add(self.batch_frame)
+        
+        self.notebook.tab(0, text='Encode', padding=10)
+        self.notebook.tab(1, text='Decode', padding=10)
+        self.notebook.tab(2, text='Toplu İşlem', padding=10)
+        
+        self.notebook.pack(fill='both')
+    
+    def set_menu(self):
+        self.menu = tk.Menu(self)
+        
+        self.help_menu = tk.Menu(self.menu, tearoff=False)
+        self.help_menu.add_command(
+            label='Hakkında', 
+            command=self.about,
+        )
+        self.help_menu.add_command(
+            label='Kullanım Kılavuzu',
+            command=self.user_guide,
+        )
+        
+        self.menu.add_cascade(label='Yardım', menu=self.help_menu)
+        self.config(menu=self.menu)
+    
+    def about(self):
+        about_window = tk.Toplevel(self)
+        
+        about_window.resizable(False, False)
+        about_window.title('Hakkında')
+        
+        about_label = ttk.Label(
+            about_window, 
+            text=self.about_text,
+            justify='center', 
+            padding=15,
+        )
+        
+        about_label.pack(fill='both', expand=True)
+    
+    def user_guide(self):
+        user_guide_window = tk.Toplevel(self)
+        
+        user_guide_window.resizable(False, False)
+        user_guide_window.title('Kullanım Kılavuzu')
+        
+        about_label = ttk.Label(
+            user_guide_window,
+            text=self.user_guide_text, 
+            justify='center',
+            padding=15,
+        )
+        
+        about_label.pack(fill='both', expand=True)
+
+
+class FileFrame(ttk.Frame):
+    def __init__(self, *args, file_command, file_default_type, file_types,
+                 save_default_type, save_types, start_button_text, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        self.file_default_type = file_default_type
+        self.file_types = file_types
+        self.save_default_type = save_default_type
+        self.save_types = save_types
+        
+        self.file_command = file_command
+        
+        self.file_path: str = None
+        self.save_path: str = None
+        
+        self.file_button_text = 'DOSYA YOLU SEÇ'
+        self.save_button_text = 'KAYIT YOLU SEÇ'
+        
+        self.file_button = ttk.Button(
+            self, command=self.select_file_path,
+            text=self.file_button_text
+        )
+        
+        self.save_button = ttk.Button(
+            self, command=self.select_save_path,
+            text=self.save_button_text
+        )
+        
+        self.start_button = ttk.Button(
+            self, command=self.command,
+            state='disabled',
+            text=start_button_text,
+        )
+        
+        self.progress_bar = ttk.Progressbar(self, orient='horizontal')
+        self.progress_bar.config(mode='determinate', maximum=100)
+        
+        self.progress_label = ttk.Label(self)
+        
+        self.cancel_button = ttk.Button(
+            self, command=self.cancel, text='İPTAL ET',
+        )
+        
+        self.file_button.pack(fill='x')
+        self.save_button.pack(fill='x')
+        self.start_button.pack(fill='x')
+    
+    def select_file_path(self):
+        path = askopenfilename(
+            filetypes=self.file_types,
+            defaultextension=self.file_default_type,
+        )
+        
+        if path:
+            self.file_path = path
+            self.file_button.config(text=self.file_path)
+            
+            if self.file_path and self.save_path:
+                self.start_button.config(state='normal')
+        else:
+            self.file_path = None
+            self.file_button.config(text=self.file_button_text)
+    
+    def select_save_path(self):
+        path = asksaveasfilename(
+            filetypes=self.save_types,
+            defaultextension=self.save_default_type,
+        )
+        
+        if path:
+            self.save_path = path
+            self.save_button.config(text=self.save_path)
+            
+            if self.file_path and self.save_path:
+                self.start_button.config(state='normal')
+        else:
+            self.save_path = None
+            self.save_button.config(text=self.save_button_text)
+    
+    def command(self):
+        self.start_button.pack_forget()
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text='')
+        self.cancel_button.config(state='normal')
+        self.progress_bar.pack(fill='x')
+        self.progress_label.pack(fill='x')
+        self.cancel_button.pack(fill='x')
+        
+        self.file_button.config(state='disabled')
+        self.save_button.config(state='disabled')
+        
+        # the command updates the progress from its thread and the event
+        # loop reads it, so the progress doesn't need a callback
+        self.cancel_token = CancelToken()
+        self.progress = Progress(cancel_token=self.cancel_token)
+        
+        # file is processed in a thread, widgets are only updated from the
+        # event loop
+        self.error = None
+        self.cancelled = False
+        self.thread = Thread(target=self.run_command)
+        self.thread.start()
+        
+        self.after(100, self.check_command)
+    
+    def run_command(self):
+        try:
+            self.file_command(
+                self.file_path, self.save_path, progress=self.progress
+            )
+        except Cancelled:
+            self.cancelled = True
+        except Exception as e:
+            self.error = e
+    
+    def cancel(self):
+        # the command stops at its next progress report
+        self.cancel_token.cancel()
+        self.cancel_button.config(state='disabled')
+    
+    def update_progress(self):
+        fraction = self.progress.fraction()
+        eta = self.progress.eta()
+        
+        if fraction is None:
+            return
+        
+        text = f'%{fraction * 100:.1f}, ' + format_speed(
+            self.progress.done, self.progress.elapsed()
+        )
+        
+        if eta is not None:
+            text += f', kalan süre {int(eta) // 60}:{int(eta) % 60:02}'
+        
+        self.progress_bar.config(value=fraction * 100)
+        self.progress_label.config(text=text)
+    
+    def check_command(self):
+        if self.thread.is_alive():
+            self.update_progress()
+            self.after(100, self.check_command)
+            return
+        
+        if self.cancelled:
+            showinfo('İptal', 'İşleminiz iptal edildi.')
+        elif self.error is not None:
+            showerror('Hata', 'Bir hata ile karşılaşıldı:\n' + str(self.error))
+        else:
+            showinfo('Başarılı', 'İşleminiz başarıyla gerçekleştirildi!')
+        
+        self.file_button.config(state='normal', text=self.file_button_text)
+        self.save_button.config(state='normal', text=self.save_button_text)
+        
+        self.progress_bar.pack_forget()
+        self.progress_label.pack_forget()
+        self.cancel_button.pack_forget()
+        self.start_button.pack(fill='x')
+
+
+def run_job(command, file_path: str, save_path: str) -> float:
+    # runs in a worker process and returns the seconds the job took
+    save_dir = os.path.dirname(save_path)
+    
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    
+    start = time.perf_counter()
+    command(file_path, save_path)
+    
+    return time.perf_counter() - start
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f'{size} B'
+    
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+
+
+def format_speed(size: int, seconds: float) -> str:
+    if seconds <= 0:
+        return ''
+    
+    return f'{size / seconds / (1 << 20):.2f} MB/s'
+
+
+class BatchFrame(ttk.Frame):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        # path of every file and its path relative to the selected folder,
+        # which is kept under the save folder
+        self.files: List[Tuple[str, str]] = []
+        self.save_dir: str = None
+        
+        self.executor: ProcessPoolExecutor = None
+        
+        # worker processes put finished jobs to the queue, the event loop
+        # takes them from it
+        self.results = Queue()
+        self.sizes: Dict[str, int] = {}
+        
+        self.mode = tk.StringVar(value='encode')
+        self.workers = tk.IntVar(value=os.cpu_count() or 1)
+        
+        self.save_button_text = 'KAYIT KLASÖRÜ SEÇ'
+        
+        self.files_button = ttk.Button(
+            self, command=self.select_files, text='DOSYALAR EKLE'
+        )
+        
+        self.folder_button = ttk.Button(
+            self, command=self.select_folder, text='KLASÖR EKLE'
+        )
+        
+        self.clear_button = ttk.Button(
+            self, command=self.clear_files, text='LİSTEYİ TEMİZLE'
+        )
+        
+        self.save_button = ttk.Button(
+            self, command=self.select_save_dir, text=self.save_button_text
+        )
+        
+        self.options_frame = ttk.Frame(self)
+        
+        self.encode_radio = ttk.Radiobutton(
+            self.options_frame, text='Encode',
+            variable=self.mode, value='encode',
+        )
+        
+        self.decode_radio = ttk.Radiobutton(
+            self.options_frame, text='Decode',
+            variable=self.mode, value='decode',
+        )
+        
+        self.workers_label = ttk.Label(
+            self.options_frame, text='İşlemci sayısı:'
+        )
+        
+        self.workers_spinbox = ttk.Spinbox(
+            self.options_frame, from_=1, to=max(64, os.cpu_count() or 1),
+            textvariable=self.workers, width=5,
+        )
+        
+        self.file_list = ttk.Treeview(
+            self, columns=('size', 'status', 'speed'), height=8,
+        )
+        self.file_list.heading('#0', text='Dosya')
+        self.file_list.heading('size', text='Boyut')
+        self.file_list.heading('status', text='Durum')
+        self.file_list.heading('speed', text='Hız')
+        self.file_list.column('#0', width=200)
+        self.file_list.column('size', width=80, anchor='e')
+        self.file_list.column('status', width=100)
+        self.file_list.column('speed', width=90, anchor='e')
+        
+        self.total_label = ttk.Label(self)
+        
+        self.start_button = ttk.Button(
+            self, command=self.start, state='disabled',
+            text='TOPLU İŞLEME BAŞLA',
+        )
+        
+        self.progress_bar = ttk.Progressbar(self, orient='horizontal')
+        self.progress_bar.config(mode='determinate')
+        
+        self.encode_radio.pack(side='left')
+        self.decode_radio.pack(side='left')
+        self.workers_spinbox.pack(side='right')
+        self.workers_label.pack(side='right')
+        
+        self.files_button.pack(fill='x')
+        self.folder_button.pack(fill='x')
+        self.clear_button.pack(fill='x')
+        self.save_button.pack(fill='x')
+        self.options_frame.pack(fill='x', pady=5)
+        self.file_list.pack(fill='both')
+        self.total_label.pack(fill='x')
+        self.start_button.pack(fill='x')
+    
+    def unique_name(self, name: str) -> str:
+        # outputs are saved by the names of the files, so a file with the
+        # name of a file from another folder gets a number after its name
+        names = {os.path.normcase(name_) for _, name_ in self.files}
+        root, extension = os.path.splitext(name)
+        
+        unique = name
+        number = 2
+        
+        while os.path.normcase(unique) in names:
+            unique = f'{root} ({number}){extension}'
+            number += 1
+        
+        return unique
+    
+    def add_file(self, file_path: str, name: str):
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return
+        
+        name = self.unique_name(name)
+        self.files.append((file_path, name))
+        self.sizes[file_path] = size
+        
+        self.file_list.insert(
+            '', 'end', iid=file_path, text=name,
+            values=(format_size(size), 'Bekliyor', ''),
+        )
+    
+    def select_files(self):
+        for path in askopenfilenames():
+            if path not in self.sizes:
+                self.add_file(path, os.path.basename(path))
+        
+        self.update_start_button()
+    
+    def select_folder(self):
+        folder = askdirectory()
+        
+        if not folder:
+            return
+        
+        # files in the sub folders are added too, they are saved to the
+        # same sub folders under the save folder
+        for dir_path, _, file_names in os.walk(folder):
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                
+                if path not in self.sizes:
+                    self.add_file(path, os.path.relpath(path, folder))
+        
+        self.update_start_button()
+    
+    def clear_files(self):
+        self.files.clear()
+        self.sizes.clear()
+        self.file_list.delete(*self.file_list.get_children())
+        self.total_label.config(text='')
+        
+        self.update_start_button()
+    
+    def select_save_dir(self):
+        path = askdirectory()
+        
+        if path:
+            self.save_dir = path
+            self.save_button.config(text=self.save_dir)
+        else:
+            self.save_dir = None
+            self.save_button.config(text=self.save_button_text)
+        
+        self.update_start_button()
+    
+    def update_start_button(self):
+        if self.files and self.save_dir:
+            self.start_button.config(state='normal')
+        else:
+            self.start_button.config(state='disabled')
+    
+    def save_path(self, name: str) -> str:
+        if self.mode.get() == 'encode':
+            return os.path.join(self.save_dir, name + '.anvil')
+        
+        if name.endswith('.anvil'):
+            return os.path.join(self.save_dir, name[:-len('.anvil')])
+        
+        return os.path.join(self.save_dir, name + '.out')
+    
+    def set_buttons_state(self, state: str):
+        for widget in (self.files_button, self.folder_button,
+                       self.clear_button, self.save_button,
+                       self.encode_radio, self.decode_radio,
+                       self.workers_spinbox):
+            widget.config(state=state)
+    
+    def start(self):
+        try:
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            showwarning('Uyarı', 'İşlemci sayısı bir tam sayı olmalıdır.')
+            return
+        
+        command = Anvil.encode if self.mode.get() == 'encode' else Anvil.decode
+        
+        self.set_buttons_state('disabled')
+        self.start_button.pack_forget()
+        self.progress_bar.pack(fill='x')
+        
+        self.total_bytes = sum(self.sizes.values())
+        self.done_bytes = 0
+        self.done_count = 0
+        self.error_count = 0
+        self.start_time = time.perf_counter()
+        
+        self.progress_bar.config(maximum=max(self.total_bytes, 1), value=0)
+        
+        # at most `workers` files are processed at the same time, the rest
+        # wait in the queue of the pool
+        self.executor = ProcessPoolExecutor(workers)
+        
+        for file_path, name in self.files:
+            self.file_list.set(file_path, 'status', 'Bekliyor')
+            self.file_list.set(file_path, 'speed', '')
+            
+            future = self.executor.submit(
+                run_job, command, file_path, self.save_path(name)
+            )
+            future.add_done_callback(
+                lambda future, file_path=file_path:
+                    self.results.put((file_path, future))
+            )
+        
+        self.update_total()
+        self.after(100, self.check_results)
+    
+    def check_results(self):
+        while True:
+            try:
+                file_path, future = self.results.get_nowait()
+            except Empty:
+                break
+            
+            size = self.sizes[file_path]
+            
+            try:
+                seconds = future.result()
+            except Exception as e:
+                self.error_count += 1
+                self.file_list.set(file_path, 'status', 'Hata: ' + str(e))
+            else:
+                self.file_list.set(file_path, 'status', 'Tamamlandı')
+                self.file_list.set(
+                    file_path, 'speed', format_speed(size, seconds)
+                )
+            
+            self.done_bytes += size
+            self.done_count += 1
+        
+        self.progress_bar.config(value=self.done_bytes)
+        self.update_total()
+        
+        if self.done_count < len(self.files):
+            self.after(100, self.check_results)
+            return
+        
+        self.executor.shutdown(wait=False)
+        self.executor = None
+        
+        self.progress_bar.pack_forget()
+        self.start_button.pack(fill='x')
+        self.set_buttons_state('normal')
+        
+        if self.error_count:
+            showerror(
+                'Hata',
+                f'{self.error_count} dosyada bir hata ile karşılaşıldı.',
+            )
+        else:
+            showinfo('Başarılı', 'İşleminiz başarıyla gerçekleştirildi!')
+    
+    def update_total(self):
+        seconds = time.perf_counter() - self.start_time
+        
+        self.total_label.config(
+            text=f'{self.done_count} / {len(self.files)} dosya, '
+                 f'{format_size(self.done_bytes)} / '
+                 f'{format_size(self.total_bytes)}, '
+                 f'toplam hız {format_speed(self.done_bytes, seconds)}'
+        )
+
+
+if __name__ == '__main__':
+    root = AnvilApp()
+    root.mainloop()